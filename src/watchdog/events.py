@@ -83,6 +83,11 @@ Event Handler Classes
    :members:
    :show-inheritance:
 
+
+Functions
+---------
+.. autofunction:: handled_event_types
+
 """
 
 import os.path
@@ -99,6 +104,13 @@ EVENT_TYPE_DELETED = 'deleted'
 EVENT_TYPE_CREATED = 'created'
 EVENT_TYPE_MODIFIED = 'modified'
 
+ALL_EVENT_TYPES = frozenset([
+    EVENT_TYPE_MOVED,
+    EVENT_TYPE_DELETED,
+    EVENT_TYPE_CREATED,
+    EVENT_TYPE_MODIFIED,
+    ])
+
 class FileSystemEvent(object):
     """
     Immutable type that represents a file system event that is triggered
@@ -584,6 +596,62 @@ class LoggingFileSystemEventHandler(LoggingEventHandler):
     """For backwards-compatibility. Please use :class:`LoggingEventHandler` instead."""
 
 
+def handled_event_types(event_handler):
+    """Returns the set of event types (``EVENT_TYPE_*`` constants) an event
+    handler handles, so that observers able to do so need not watch for the
+    others.
+
+    A handler may declare the event types it handles with an ``event_types``
+    attribute. Otherwise they are inferred from the ``on_moved``,
+    ``on_created``, ``on_deleted`` and ``on_modified`` methods it overrides;
+    a handler overriding :meth:`FileSystemEventHandler.on_any_event` or
+    ``dispatch`` handles every event type.
+
+    :param event_handler:
+        An event handler instance.
+    :returns:
+        A frozenset of event types.
+    """
+    event_types = getattr(event_handler, 'event_types', None)
+    if event_types is not None:
+        return frozenset(event_types)
+    if (_overrides(event_handler, 'on_any_event') or
+        _overrides(event_handler, 'dispatch')):
+        return ALL_EVENT_TYPES
+    return frozenset([event_type for event_type, method_name
+                      in _METHOD_NAME_FOR_EVENT_TYPE.items()
+                      if _overrides(event_handler, method_name)])
+
+
+_METHOD_NAME_FOR_EVENT_TYPE = {
+    EVENT_TYPE_MOVED: 'on_moved',
+    EVENT_TYPE_CREATED: 'on_created',
+    EVENT_TYPE_DELETED: 'on_deleted',
+    EVENT_TYPE_MODIFIED: 'on_modified',
+    }
+
+# Handlers whose ``dispatch`` only filters events before calling ``on_*``.
+_FILTERING_HANDLER_CLASSES = (
+    FileSystemEventHandler,
+    PatternMatchingEventHandler,
+    RegexMatchingEventHandler,
+    )
+
+
+def _function_of(method):
+    return getattr(method, 'im_func', getattr(method, '__func__', method))
+
+
+def _overrides(event_handler, method_name):
+    """Determines whether an event handler replaces the library's
+    implementation of the given method."""
+    if method_name in getattr(event_handler, '__dict__', ()):
+        return True
+    function = _function_of(getattr(type(event_handler), method_name, None))
+    return function not in [_function_of(getattr(klass, method_name))
+                            for klass in _FILTERING_HANDLER_CLASSES]
+
+
 def _generate_sub_moved_events_for(src_dir_path, dest_dir_path,
                                    _walker=os.walk):
     """Generates an event list of :class:`DirMovedEvent` and :class:`FileMovedEvent`
@@ -27,6 +27,10 @@ Immutables
    :members:
    :show-inheritance:
 
+.. autoclass:: WatchFuture
+   :members:
+   :show-inheritance:
+
 
 Collections
 -----------
@@ -50,6 +54,7 @@ Classes
 """
 
 from __future__ import with_statement
+import collections
 import threading
 try:
     import queue # IGNORE:F0401
@@ -59,10 +64,15 @@ except ImportError:
 from pathtools.path import absolute_path
 from watchdog.utils import DaemonThread
 from watchdog.utils.bricks import OrderedSetQueue as SetQueue
+from watchdog.events import handled_event_types
 
 DEFAULT_EMITTER_TIMEOUT = 1    # in seconds.
 DEFAULT_OBSERVER_TIMEOUT = 1   # in seconds.
 
+# Maximum number of threads setting up the emitters of watches scheduled
+# with BaseObserver.schedule_async.
+DEFAULT_SCHEDULE_WORKERS = 4
+
 
 # Collection classes
 class EventQueue(SetQueue):
@@ -112,6 +122,82 @@ class ObservedWatch(object):
         return "<ObservedWatch: path=%s, is_recursive=%s>" % (self.path, self.is_recursive)
 
 
+class WatchFuture(object):
+    """Handle to a watch that is being scheduled in the background.
+
+    Returned by :meth:`BaseObserver.schedule_async`. The watch is usable
+    (for example, with :meth:`BaseObserver.unschedule`) straight away, but
+    events may only be reported for parts of the watched tree until the
+    future is done.
+
+    :param watch:
+        The watch being scheduled.
+    :type watch:
+        :class:`ObservedWatch`
+    """
+    def __init__(self, watch):
+        self._watch = watch
+        self._done_event = threading.Event()
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def watch(self):
+        """The watch being scheduled."""
+        return self._watch
+
+    def done(self):
+        """Determines whether scheduling has completed or failed."""
+        return self._done_event.isSet()
+
+    def wait(self, timeout=None):
+        """Blocks until scheduling completes or the timeout (in seconds)
+        expires.
+
+        :returns:
+            ``True`` if scheduling is done; ``False`` otherwise.
+        """
+        self._done_event.wait(timeout)
+        return self.done()
+
+    def exception(self):
+        """Blocks until scheduling completes and returns the exception that
+        made it fail, or ``None``."""
+        self.wait()
+        return self._exception
+
+    def result(self):
+        """Blocks until scheduling completes and returns the watch.
+
+        :raises:
+            The exception that made scheduling fail.
+        """
+        self.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._watch
+
+    def add_done_callback(self, callback):
+        """Calls ``callback(future)`` once scheduling is done, immediately if
+        it already is."""
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_done(self, exception=None):
+        with self._lock:
+            if self.done():
+                return
+            self._exception = exception
+            self._done_event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+
 
 # Observer classes
 class EventEmitter(DaemonThread):
@@ -164,6 +250,29 @@ class EventEmitter(DaemonThread):
         """
         self._event_queue.put((event, self.watch))
 
+    def wait_until_ready(self, timeout=None):
+        """Override this method if the emitter finishes setting up the watch
+        after it has been constructed and started, for example by
+        registering the directory tree in the background. Blocks until the
+        whole watch is observed or the timeout (in seconds) expires.
+
+        :returns:
+            ``True`` if the emitter is ready; ``False`` otherwise.
+        :raises:
+            The error that prevented setting up the watch.
+        """
+        return True
+
+    def set_event_types(self, event_types):
+        """Override this method if the emitter can avoid observing changes
+        nobody is interested in. Called with the event types handled by the
+        handlers of the watch whenever they change.
+
+        :param event_types:
+            A frozenset of ``EVENT_TYPE_*`` constants from
+            :mod:`watchdog.events`.
+        """
+
     def queue_events(self, timeout):
         """Override this method to populate the event queue with events
         per interval period.
@@ -249,8 +358,14 @@ class EventDispatcher(DaemonThread):
 
 
 class BaseObserver(EventDispatcher):
-    """Base observer."""
-    def __init__(self, emitter_class, timeout=DEFAULT_OBSERVER_TIMEOUT):
+    """Base observer.
+
+    :param schedule_workers:
+        Maximum number of threads setting up the emitters of watches
+        scheduled with :meth:`schedule_async`.
+    """
+    def __init__(self, emitter_class, timeout=DEFAULT_OBSERVER_TIMEOUT,
+                 schedule_workers=DEFAULT_SCHEDULE_WORKERS):
         EventDispatcher.__init__(self, timeout)
         self._emitter_class = emitter_class
         self._lock = threading.Lock()
@@ -258,7 +373,30 @@ class BaseObserver(EventDispatcher):
         self._handlers = dict()
         self._emitters = set()
         self._emitter_for_watch = dict()
+        self._future_for_pending_watch = dict()
+        # Futures of watches scheduled in the background, completed in
+        # order by at most ``schedule_workers`` threads that exit once there
+        # are none left.
+        self._queued_futures = collections.deque()
+        self._schedule_workers = 0
+        self._max_schedule_workers = max(1, schedule_workers)
+
+    @property
+    def emitters(self):
+        """A list of the event emitters of the scheduled watches."""
+        with self._lock:
+            return list(self._emitters)
+
+    def _create_emitter(self, watch):
+        """Override this method to construct emitters that share
+        observer-wide state."""
+        return self._emitter_class(event_queue=self.event_queue,
+                                   watch=watch,
+                                   timeout=self.timeout)
 
+    def _start_emitter(self, emitter):
+        """Override this method if emitters are not standalone threads."""
+        emitter.start()
 
     def _add_emitter(self, emitter):
         self._emitter_for_watch[emitter.watch] = emitter
@@ -283,6 +421,7 @@ class BaseObserver(EventDispatcher):
             self._handlers[watch].add(event_handler)
         except KeyError:
             self._handlers[watch] = set([event_handler])
+        self._update_event_types(watch)
 
     def _get_handlers_for_watch(self, watch):
         return self._handlers[watch]
@@ -293,7 +432,80 @@ class BaseObserver(EventDispatcher):
     def _remove_handler_for_watch(self, handler, watch):
         handlers = self._get_handlers_for_watch(watch)
         handlers.remove(handler)
+        self._update_event_types(watch)
 
+    def _event_types_for_watch(self, watch):
+        event_types = set()
+        for handler in self._handlers.get(watch, ()):
+            event_types.update(handled_event_types(handler))
+        return frozenset(event_types)
+
+    def _update_event_types(self, watch):
+        emitter = self._emitter_for_watch.get(watch)
+        if emitter is not None:
+            emitter.set_event_types(self._event_types_for_watch(watch))
+
+
+    def _begin_schedule(self, event_handler, path, recursive):
+        """Adds the handler for a watch and returns a
+        ``(future, needs_emitter)`` pair. The caller must create the emitter
+        with :meth:`_complete_schedule` if ``needs_emitter`` is ``True``."""
+        with self._lock:
+            watch = ObservedWatch(path, recursive)
+            self._add_handler_for_watch(event_handler, watch)
+            if watch in self._emitter_for_watch:
+                # If we have an emitter for this watch already, we don't
+                # create a new emitter. Instead we add the handler to the
+                # event object.
+                future = WatchFuture(watch)
+                future._set_done()
+                return future, False
+            try:
+                return self._future_for_pending_watch[watch], False
+            except KeyError:
+                future = WatchFuture(watch)
+                self._future_for_pending_watch[watch] = future
+                return future, True
+
+    def _complete_schedule(self, future):
+        """Creates and starts the emitter for a pending watch without holding
+        the observer lock, then waits for the emitter to be ready."""
+        watch = future.watch
+        try:
+            emitter = self._create_emitter(watch)
+        except Exception, e:
+            with self._lock:
+                if self._future_for_pending_watch.get(watch) is future:
+                    del self._future_for_pending_watch[watch]
+                    self._handlers.pop(watch, None)
+            future._set_done(e)
+            return
+
+        with self._lock:
+            is_pending = self._future_for_pending_watch.get(watch) is future
+            if is_pending:
+                del self._future_for_pending_watch[watch]
+                self._add_emitter(emitter)
+                # Handlers may have changed while the emitter was created.
+                self._update_event_types(watch)
+                self._start_emitter(emitter)
+                self._watches.add(watch)
+        if not is_pending:
+            # Unscheduled while the emitter was being created.
+            emitter.stop()
+            future._set_done()
+            return
+
+        try:
+            emitter.wait_until_ready()
+        except Exception, e:
+            try:
+                self.unschedule(watch)
+            except KeyError:
+                pass
+            future._set_done(e)
+            return
+        future._set_done()
 
     def schedule(self, event_handler, path, recursive=False):
         """
@@ -319,23 +531,72 @@ class BaseObserver(EventDispatcher):
             An :class:`ObservedWatch` object instance representing
             a watch.
         """
-        with self._lock:
-            watch = ObservedWatch(path, recursive)
-            self._add_handler_for_watch(event_handler, watch)
-            try:
-                # If we have an emitter for this watch already, we don't create a
-                # new emitter. Instead we add the handler to the event
-                # object.
-                emitter = self._get_emitter_for_watch(watch)
-            except KeyError:
-                # Create a new emitter and start it.
-                emitter = self._emitter_class(event_queue=self.event_queue,
-                                              watch=watch,
-                                              timeout=self.timeout)
-                self._add_emitter(emitter)
-                emitter.start()
-            self._watches.add(watch)
-        return watch
+        future, needs_emitter = self._begin_schedule(event_handler,
+                                                     path,
+                                                     recursive)
+        if needs_emitter:
+            self._complete_schedule(future)
+        return future.result()
+
+    def schedule_async(self, event_handler, path, recursive=False):
+        """
+        Schedules watching a path like :meth:`schedule`, but returns
+        immediately. The emitter for the watch is set up by a background
+        thread and, where the emitter supports it, starts reporting events
+        for the parts of the watched tree that are already being monitored
+        while the rest of the tree is registered. Watches are set up in the
+        order they are scheduled by a bounded number of threads shared by
+        the observer, each waiting for one watch to be ready at a time.
+
+        The observer lock is not held while emitters are set up, so
+        scheduling a large tree does not delay other watches or event
+        dispatch.
+
+        :param event_handler:
+            An event handler instance that has appropriate event handling
+            methods which will be called by the observer in response to
+            file system events.
+        :type event_handler:
+            :class:`watchdog.events.FileSystemEventHandler` or a subclass
+        :param path:
+            Directory path that will be monitored.
+        :type path:
+            ``str``
+        :param recursive:
+            ``True`` if events will be emitted for sub-directories
+            traversed recursively; ``False`` otherwise.
+        :type recursive:
+            ``bool``
+        :return:
+            A :class:`WatchFuture` for the watch.
+        """
+        future, needs_emitter = self._begin_schedule(event_handler,
+                                                     path,
+                                                     recursive)
+        if needs_emitter:
+            with self._lock:
+                self._queued_futures.append(future)
+                if self._schedule_workers < self._max_schedule_workers:
+                    self._schedule_workers += 1
+                    worker = threading.Thread(target=self._complete_schedules)
+                    worker.setDaemon(True)
+                    worker.start()
+        return future
+
+    def _complete_schedules(self):
+        while True:
+            with self._lock:
+                if not self._queued_futures:
+                    self._schedule_workers -= 1
+                    return
+                future = self._queued_futures.popleft()
+                is_pending = (self._future_for_pending_watch.get(future.watch)
+                              is future)
+            if is_pending:
+                self._complete_schedule(future)
+            else:
+                # Unscheduled before its turn came.
+                future._set_done()
 
     def add_handler_for_watch(self, event_handler, watch):
         """Adds a handler for the given watch.
@@ -383,6 +644,11 @@ class BaseObserver(EventDispatcher):
             :class:`ObservedWatch`
         """
         with self._lock:
+            if watch in self._future_for_pending_watch:
+                # The emitter is stopped as soon as it has been created.
+                del self._future_for_pending_watch[watch]
+                self._remove_handlers_for_watch(watch)
+                return
             try:
                 emitter = self._get_emitter_for_watch(watch)
                 self._remove_handlers_for_watch(watch)
@@ -398,6 +664,7 @@ class BaseObserver(EventDispatcher):
             self._handlers.clear()
             self._clear_emitters()
             self._watches.clear()
+            self._future_for_pending_watch.clear()
 
     def on_thread_exit(self):
         self.unschedule_all()
@@ -0,0 +1,1049 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+:module: watchdog.observers.fanotify
+:synopsis: ``fanotify(7)`` based emitter implementation.
+:author: Yesudeep Mangalapilly <yesudeep@gmail.com>
+:platforms: Linux 5.9+.
+
+.. ADMONITION:: About system requirements
+
+    Directory entry events (creations, deletions and moves) are reported by
+    fanotify with the ``FAN_REPORT_DFID_NAME`` flag, which was added in Linux
+    5.9. Marking a file system requires the ``CAP_SYS_ADMIN`` capability,
+    and turning the file handles reported with the events back into paths
+    requires ``CAP_DAC_READ_SEARCH``.
+
+    :class:`FanotifyObserver` falls back to inotify for the watches it
+    cannot observe with fanotify.
+
+.. ADMONITION:: About recursiveness and kernel state
+
+    Rather than one watch per directory, fanotify places a single mark on the
+    whole file system holding a watched directory. Scheduling a watch on a
+    tree of any size therefore neither walks the tree nor adds kernel state
+    beyond the first mark on each file system.
+
+    Every change anywhere on a marked file system is reported to us. Events
+    identify the directory holding the changed entry by a file handle; the
+    handle of every directory seen is resolved to a path once, and events
+    outside the watched trees are dropped as soon as their directory is
+    known to be outside them.
+
+.. ADMONITION:: About moves
+
+    Fanotify reports the two halves of a rename without a cookie pairing
+    them. A ``FAN_MOVED_FROM`` event immediately followed by a
+    ``FAN_MOVED_TO`` event in the same read is reported as a move; any other
+    ``FAN_MOVED_FROM`` event is reported as a deletion and any other
+    ``FAN_MOVED_TO`` event as a creation.
+
+    A watched directory that is itself moved is no longer observed.
+
+Classes
+-------
+.. autoclass:: FanotifyObserver
+   :members:
+   :show-inheritance:
+
+.. autoclass:: FanotifyEmitter
+   :members:
+   :show-inheritance:
+
+.. autoclass:: Fanotify
+   :members:
+"""
+
+from __future__ import with_statement
+from watchdog.utils import platform
+
+if platform.is_linux():
+    import os
+    import errno
+    import fcntl
+    import select
+    import struct
+    import threading
+    import ctypes
+
+    from ctypes import\
+        c_int,\
+        c_uint,\
+        c_long,\
+        c_uint64,\
+        c_char_p,\
+        c_void_p
+
+    from watchdog.utils import\
+        DaemonThread,\
+        has_attribute,\
+        ctypes_find_library
+    from watchdog.observers.api import\
+        EventEmitter,\
+        BaseObserver,\
+        DEFAULT_EMITTER_TIMEOUT,\
+        DEFAULT_OBSERVER_TIMEOUT
+    from watchdog.observers.inotify import\
+        Inotify,\
+        InotifyAuditor,\
+        InotifyEmitter,\
+        InotifyReader
+    from watchdog.events import\
+        DirDeletedEvent,\
+        DirModifiedEvent,\
+        DirMovedEvent,\
+        DirCreatedEvent,\
+        FileDeletedEvent,\
+        FileModifiedEvent,\
+        FileMovedEvent,\
+        FileCreatedEvent
+
+    libc_string = ctypes_find_library('c', 'libc.so.6')
+    libc = ctypes.CDLL(libc_string, use_errno=True)
+
+    if (not has_attribute(libc, 'fanotify_init') or
+        not has_attribute(libc, 'fanotify_mark') or
+        not has_attribute(libc, 'name_to_handle_at') or
+        not has_attribute(libc, 'open_by_handle_at')):
+        raise ImportError("Unsupported libc version found: %s" % libc_string)
+
+    # #include <sys/fanotify.h>
+    # int fanotify_init(unsigned int flags, unsigned int event_f_flags);
+    fanotify_init = ctypes.CFUNCTYPE(c_int, c_uint, c_uint, use_errno=True)(
+            ("fanotify_init", libc))
+
+    # #include <sys/fanotify.h>
+    # int fanotify_mark(int fanotify_fd, unsigned int flags, uint64_t mask,
+    #                   int dirfd, const char *pathname);
+    fanotify_mark = ctypes.CFUNCTYPE(c_int, c_int, c_uint, c_uint64, c_int,
+                                     c_char_p, use_errno=True)(
+            ("fanotify_mark", libc))
+
+    # #include <fcntl.h>
+    # int name_to_handle_at(int dirfd, const char *pathname,
+    #                       struct file_handle *handle, int *mount_id,
+    #                       int flags);
+    name_to_handle_at = ctypes.CFUNCTYPE(c_int, c_int, c_char_p, c_void_p,
+                                         c_void_p, c_int, use_errno=True)(
+            ("name_to_handle_at", libc))
+
+    # #include <fcntl.h>
+    # int open_by_handle_at(int mount_fd, struct file_handle *handle,
+    #                       int flags);
+    open_by_handle_at = ctypes.CFUNCTYPE(c_int, c_int, c_char_p, c_int,
+                                         use_errno=True)(
+            ("open_by_handle_at", libc))
+
+    # #include <sys/vfs.h>
+    # int fstatfs(int fd, struct statfs *buf);
+    try:
+        fstatfs = ctypes.CFUNCTYPE(c_int, c_int, c_void_p, use_errno=True)(
+                ("fstatfs64", libc))
+    except AttributeError:
+        fstatfs = ctypes.CFUNCTYPE(c_int, c_int, c_void_p, use_errno=True)(
+                ("fstatfs", libc))
+
+    class FanotifyConstants(object):
+        # User-space events
+        FAN_ACCESS = 0x00000001         # File was accessed.
+        FAN_MODIFY = 0x00000002         # File was modified.
+        FAN_ATTRIB = 0x00000004         # Meta-data changed.
+        FAN_CLOSE_WRITE = 0x00000008    # Writable file closed.
+        FAN_CLOSE_NOWRITE = 0x00000010  # Unwritable file closed.
+        FAN_OPEN = 0x00000020           # File was opened.
+        FAN_MOVED_FROM = 0x00000040     # File was moved from X.
+        FAN_MOVED_TO = 0x00000080       # File was moved to Y.
+        FAN_CREATE = 0x00000100         # File was created.
+        FAN_DELETE = 0x00000200         # File was deleted.
+        FAN_DELETE_SELF = 0x00000400    # Self was deleted.
+        FAN_MOVE_SELF = 0x00000800      # Self was moved.
+
+        # Helper user-space events.
+        FAN_CLOSE = FAN_CLOSE_WRITE | FAN_CLOSE_NOWRITE
+        FAN_MOVE = FAN_MOVED_FROM | FAN_MOVED_TO
+
+        # Events sent by the kernel.
+        FAN_Q_OVERFLOW = 0x00004000     # Event queue overflowed.
+
+        # Helper flags.
+        FAN_EVENT_ON_CHILD = 0x08000000 # Events for the children of a directory.
+        FAN_ONDIR = 0x40000000          # Events for directories too.
+
+        # fanotify_init flags.
+        FAN_CLOEXEC = 0x00000001
+        FAN_NONBLOCK = 0x00000002
+        FAN_CLASS_NOTIF = 0x00000000
+        FAN_REPORT_FID = 0x00000200
+        FAN_REPORT_DIR_FID = 0x00000400
+        FAN_REPORT_NAME = 0x00000800
+        FAN_REPORT_DFID_NAME = FAN_REPORT_DIR_FID | FAN_REPORT_NAME
+
+        # fanotify_mark flags.
+        FAN_MARK_ADD = 0x00000001
+        FAN_MARK_REMOVE = 0x00000002
+        FAN_MARK_MOUNT = 0x00000010
+        FAN_MARK_FILESYSTEM = 0x00000100
+
+        # Types of the information records following event metadata.
+        FAN_EVENT_INFO_TYPE_FID = 1
+        FAN_EVENT_INFO_TYPE_DFID_NAME = 2
+        FAN_EVENT_INFO_TYPE_DFID = 3
+
+    # Watchdog's API cares only about these events. Mount marks do not
+    # support directory entry events; only modifications are reported for
+    # them.
+    WATCHDOG_ALL_EVENTS = reduce(lambda x, y: x | y, [
+            FanotifyConstants.FAN_MODIFY,
+            FanotifyConstants.FAN_CLOSE_WRITE,
+            FanotifyConstants.FAN_ATTRIB,
+            FanotifyConstants.FAN_MOVED_FROM,
+            FanotifyConstants.FAN_MOVED_TO,
+            FanotifyConstants.FAN_CREATE,
+            FanotifyConstants.FAN_DELETE,
+            FanotifyConstants.FAN_ONDIR,
+            ])
+
+    WATCHDOG_MOUNT_EVENTS = (FanotifyConstants.FAN_MODIFY |
+                             FanotifyConstants.FAN_CLOSE_WRITE)
+
+    # Fanotify events reported as modifications.
+    MODIFICATION_MASK = (FanotifyConstants.FAN_MODIFY |
+                         FanotifyConstants.FAN_ATTRIB |
+                         FanotifyConstants.FAN_CLOSE_WRITE)
+
+    AT_FDCWD = -100
+    O_PATH = getattr(os, 'O_PATH', 0x200000)
+    O_DIRECTORY = getattr(os, 'O_DIRECTORY', 0x10000)
+    MAX_HANDLE_SZ = 128
+
+    # struct fanotify_event_metadata {
+    #     __u32 event_len;
+    #     __u8 vers;
+    #     __u8 reserved;
+    #     __u16 metadata_len;
+    #     __aligned_u64 mask;
+    #     __s32 fd;
+    #     __s32 pid;
+    # };
+    EVENT_METADATA = struct.Struct('IBBHQii')
+
+    # struct fanotify_event_info_header {
+    #     __u8 info_type;
+    #     __u8 pad;
+    #     __u16 len;
+    # };
+    INFO_HEADER = struct.Struct('BBH')
+
+    # struct file_handle {
+    #     unsigned int handle_bytes;
+    #     int handle_type;
+    #     unsigned char f_handle[0];
+    # };
+    HANDLE_HEADER = struct.Struct('Ii')
+
+    # A file system ID (__kernel_fsid_t) follows the information header.
+    FSID_SIZE = 8
+
+    # Offset of f_fsid in struct statfs64.
+    STATFS_FSID_OFFSET = 2 * ctypes.sizeof(c_long) + 5 * 8
+    STATFS_SIZE = 256
+
+    DEFAULT_EVENT_BUFFER_SIZE = 256 * 1024
+
+    # Directory paths resolved from file handles are forgotten all at once
+    # when there are more than this many.
+    MAX_CACHED_DIRECTORIES = 65536
+
+    def _set_non_blocking(fd):
+        """Puts the given file descriptor in non-blocking mode."""
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+    def _fsid(fd):
+        """
+        Returns the file system ID of the file system holding an open file,
+        as raw bytes in the form fanotify reports it.
+        """
+        buf = ctypes.create_string_buffer(STATFS_SIZE)
+        if fstatfs(fd, buf) == -1:
+            Fanotify._raise_error()
+        return buf.raw[STATFS_FSID_OFFSET:STATFS_FSID_OFFSET + FSID_SIZE]
+
+    def _handle_for_path(path):
+        """
+        Returns the file handle of a path, as a ``struct file_handle``.
+        """
+        buf = ctypes.create_string_buffer(HANDLE_HEADER.size + MAX_HANDLE_SZ)
+        HANDLE_HEADER.pack_into(buf, 0, MAX_HANDLE_SZ, 0)
+        mount_id = c_int()
+        if name_to_handle_at(AT_FDCWD, path, buf, ctypes.byref(mount_id),
+                             0) == -1:
+            Fanotify._raise_error()
+        handle_bytes, _ = HANDLE_HEADER.unpack_from(buf.raw, 0)
+        return buf.raw[:HANDLE_HEADER.size + handle_bytes]
+
+    def _path_for_handle(mount_fd, handle):
+        """
+        Returns the path of the directory with a file handle, or ``None`` if
+        the directory no longer exists.
+        """
+        fd = open_by_handle_at(mount_fd, handle, O_PATH)
+        if fd == -1:
+            if ctypes.get_errno() == errno.ESTALE:
+                return None
+            Fanotify._raise_error()
+        try:
+            path = os.readlink('/proc/self/fd/%d' % fd)
+        finally:
+            os.close(fd)
+        if path.endswith(' (deleted)'):
+            return None
+        return path
+
+
+    class FanotifyEvent(object):
+        """
+        A fanotify event read for a watched path.
+
+        :param mask:
+            Event mask
+        :param src_path:
+            Event source path
+        :param move_src_path:
+            For a move, the path the file was moved from.
+        """
+
+        __slots__ = ('mask', 'src_path', 'move_src_path')
+
+        def __init__(self, mask, src_path, move_src_path=None):
+            self.mask = mask
+            self.src_path = src_path
+            self.move_src_path = move_src_path
+
+        @property
+        def is_directory(self):
+            return self.mask & FanotifyConstants.FAN_ONDIR > 0
+
+        @property
+        def is_q_overflow(self):
+            return self.mask & FanotifyConstants.FAN_Q_OVERFLOW > 0
+
+        @property
+        def key(self):
+            return (self.mask, self.src_path, self.move_src_path)
+
+        def __eq__(self, fanotify_event):
+            return self.key == fanotify_event.key
+
+        def __ne__(self, fanotify_event):
+            return self.key != fanotify_event.key
+
+        def __hash__(self):
+            return hash(self.key)
+
+        def __repr__(self):
+            return "<FanotifyEvent: mask=%#x, src_path=%s, move_src_path=%s>" %\
+                   (self.mask, self.src_path, self.move_src_path)
+
+
+    class Fanotify(object):
+        """
+        Linux fanotify(7) API wrapper class reporting events for directory
+        trees.
+
+        Each file system holding a watched directory is marked as a whole,
+        once. Events are translated only for the watched trees.
+
+        :param mark_flags:
+            ``FAN_MARK_FILESYSTEM`` to mark whole file systems, or
+            ``FAN_MARK_MOUNT`` to mark only the mounts holding the watched
+            directories. Mount marks report modifications only.
+        :raises:
+            :class:`OSError` if fanotify is not available, for example
+            without the ``CAP_SYS_ADMIN`` capability or before Linux 5.9.
+        """
+
+        def __init__(self, mark_flags=FanotifyConstants.FAN_MARK_FILESYSTEM):
+            fd = fanotify_init(FanotifyConstants.FAN_CLASS_NOTIF |
+                               FanotifyConstants.FAN_CLOEXEC |
+                               FanotifyConstants.FAN_NONBLOCK |
+                               FanotifyConstants.FAN_REPORT_DFID_NAME,
+                               os.O_RDONLY)
+            if fd == -1:
+                Fanotify._raise_error()
+            self._fanotify_fd = fd
+            # Writing to this pipe interrupts a pending read.
+            self._wake_fd, self._wake_write_fd = os.pipe()
+            _set_non_blocking(self._wake_fd)
+            _set_non_blocking(self._wake_write_fd)
+            self._lock = threading.Lock()
+            self._is_closed = False
+            self._active_readers = 0
+            self._mark_flags = mark_flags
+            if mark_flags & FanotifyConstants.FAN_MARK_MOUNT:
+                self._event_mask = WATCHDOG_MOUNT_EVENTS
+            else:
+                self._event_mask = WATCHDOG_ALL_EVENTS
+            # Marked file systems by ID: [descriptor of a directory on the
+            # file system, watched roots on it].
+            self._marks = dict()
+            # Owners watching each root: dict of owner -> is recursive.
+            self._roots = dict()
+            self._fsid_for_root = dict()
+            # (file system ID, file handle) -> (path, owners watching the
+            # entries of the directory), or None outside the watched trees.
+            self._directories = dict()
+
+        @property
+        def fd(self):
+            """The fanotify file descriptor."""
+            return self._fanotify_fd
+
+        @property
+        def mark_flags(self):
+            """Flags used to mark file systems."""
+            return self._mark_flags
+
+        @property
+        def marked_filesystems(self):
+            """Number of file systems currently marked."""
+            return len(self._marks)
+
+        def add_root(self, path, recursive=False, owner=None):
+            """
+            Reports events for a directory, marking its file system unless
+            already marked.
+
+            :param path:
+                Path of the directory. Symbolic links in the path must be
+                resolved already; events are reported with real paths.
+            :param recursive:
+                ``True`` to report events for the whole tree; ``False`` for
+                the directory's entries only.
+            :param owner:
+                Owner of the events reported for the directory.
+            :raises:
+                :class:`OSError` if the file system cannot be marked.
+            """
+            dir_fd = os.open(path, os.O_RDONLY | O_DIRECTORY)
+            try:
+                fsid = _fsid(dir_fd)
+                # Make sure the handles of the file system can be resolved
+                # before relying on them.
+                if _path_for_handle(dir_fd, _handle_for_path(path)) is None:
+                    raise OSError(errno.ENOENT, os.strerror(errno.ENOENT),
+                                  path)
+                with self._lock:
+                    if fsid not in self._marks:
+                        if fanotify_mark(self._fanotify_fd,
+                                         FanotifyConstants.FAN_MARK_ADD |
+                                         self._mark_flags,
+                                         self._event_mask,
+                                         dir_fd, None) == -1:
+                            Fanotify._raise_error()
+                        self._marks[fsid] = [dir_fd, 0]
+                        dir_fd = None
+                    owners = self._roots.setdefault(path, dict())
+                    if not owners:
+                        self._marks[fsid][1] += 1
+                        self._fsid_for_root[path] = fsid
+                    owners[owner] = recursive
+                    self._directories.clear()
+            finally:
+                if dir_fd is not None:
+                    os.close(dir_fd)
+
+        def remove_owner(self, owner):
+            """
+            Stops reporting events for an owner, unmarking the file systems
+            no longer holding watched directories.
+            """
+            with self._lock:
+                if self._is_closed:
+                    return
+                for path, owners in self._roots.items():
+                    if owner not in owners:
+                        continue
+                    del owners[owner]
+                    if owners:
+                        continue
+                    del self._roots[path]
+                    fsid = self._fsid_for_root.pop(path)
+                    mark = self._marks[fsid]
+                    mark[1] -= 1
+                    if not mark[1]:
+                        del self._marks[fsid]
+                        fanotify_mark(self._fanotify_fd,
+                                      FanotifyConstants.FAN_MARK_REMOVE |
+                                      self._mark_flags,
+                                      self._event_mask, mark[0], None)
+                        os.close(mark[0])
+                self._directories.clear()
+
+        def close(self):
+            """
+            Closes the fanotify instance and the file system marks.
+            """
+            with self._lock:
+                if self._is_closed:
+                    return
+                self._is_closed = True
+                for dir_fd, _ in self._marks.values():
+                    os.close(dir_fd)
+                self._marks.clear()
+                self._roots.clear()
+                if self._active_readers:
+                    # The last reader closes the descriptors once it has
+                    # stopped waiting for them.
+                    self._wake()
+                else:
+                    self._close_descriptors()
+
+        def wake(self):
+            """
+            Interrupts a blocking :meth:`read_events_by_owner` call.
+            """
+            with self._lock:
+                if not self._is_closed or self._active_readers:
+                    self._wake()
+
+        def _wake(self):
+            try:
+                os.write(self._wake_write_fd, 'x')
+            except OSError, e:
+                # The pipe is full, so a wake-up is already pending.
+                if e.errno != errno.EAGAIN:
+                    raise
+
+        def _close_descriptors(self):
+            os.close(self._fanotify_fd)
+            os.close(self._wake_fd)
+            os.close(self._wake_write_fd)
+
+        def read_events_by_owner(self, event_buffer_size=DEFAULT_EVENT_BUFFER_SIZE,
+                                 timeout=None):
+            """
+            Reads events from fanotify and groups them by owner.
+
+            :param timeout:
+                Time (in seconds) to wait for events, or ``None`` to block.
+            :returns:
+                List of ``(owner, events)`` tuples, where ``events`` is a
+                list of :class:`FanotifyEvent` objects.
+            """
+            event_buffer = self._read(event_buffer_size, timeout)
+            if not event_buffer:
+                return []
+            events_for_owner = dict()
+            with self._lock:
+                if self._is_closed:
+                    return []
+                for event, owners in self._translate_events(event_buffer):
+                    for owner in owners:
+                        try:
+                            events_for_owner[owner].append(event)
+                        except KeyError:
+                            events_for_owner[owner] = [event]
+            return events_for_owner.items()
+
+        def _read(self, event_buffer_size, timeout):
+            """
+            Waits for events and reads them. The lock is not held while
+            waiting, so that the instance can be closed meanwhile; the
+            descriptors are then closed by the last reader.
+            """
+            with self._lock:
+                if self._is_closed:
+                    return ''
+                self._active_readers += 1
+            try:
+                return self._wait_and_read(event_buffer_size, timeout)
+            finally:
+                with self._lock:
+                    self._active_readers -= 1
+                    if self._is_closed and not self._active_readers:
+                        self._close_descriptors()
+
+        def _wait_and_read(self, event_buffer_size, timeout):
+            try:
+                readable, _, _ = select.select([self._fanotify_fd,
+                                                self._wake_fd], [], [],
+                                               timeout)
+                if self._wake_fd in readable:
+                    try:
+                        while os.read(self._wake_fd, 4096):
+                            pass
+                    except OSError, e:
+                        if e.errno != errno.EAGAIN:
+                            raise
+                if self._fanotify_fd not in readable:
+                    return ''
+                return os.read(self._fanotify_fd, event_buffer_size)
+            except (IOError, OSError, select.error), e:
+                if e.args[0] in (errno.EINTR, errno.EAGAIN):
+                    return ''
+                raise
+
+        # Non-synchronized methods.
+        def _translate_events(self, event_buffer):
+            """
+            Yields an ``(event, owners)`` tuple for every event read for the
+            watched trees.
+            """
+            # A FAN_MOVED_FROM event waiting for the FAN_MOVED_TO event
+            # following it.
+            moved_from = None
+            all_owners = None
+            for mask, fsid, handle, name in Fanotify._parse_event_buffer(
+                    event_buffer):
+                if mask & FanotifyConstants.FAN_Q_OVERFLOW:
+                    if all_owners is None:
+                        all_owners = set()
+                        for owners in self._roots.values():
+                            all_owners.update(owners)
+                        all_owners = frozenset(all_owners)
+                    yield FanotifyEvent(mask, ''), all_owners
+                    continue
+                if handle is None:
+                    continue
+                if (mask & FanotifyConstants.FAN_MOVE and
+                    mask & FanotifyConstants.FAN_ONDIR):
+                    # Paths cached for the moved tree are wrong now.
+                    self._directories.clear()
+                path, owners = self._owners_for_entry(fsid, handle, name)
+
+                if moved_from is not None:
+                    from_event, from_owners = moved_from
+                    moved_from = None
+                    if mask == (from_event.mask ^ FanotifyConstants.FAN_MOVE):
+                        for event, event_owners in self._pair_move(
+                                from_event, from_owners, path, owners):
+                            yield event, event_owners
+                        continue
+                    if from_owners:
+                        yield from_event, from_owners
+                if path is None:
+                    continue
+                if mask & FanotifyConstants.FAN_MOVED_FROM and not (
+                        mask & ~(FanotifyConstants.FAN_MOVED_FROM |
+                                 FanotifyConstants.FAN_ONDIR)):
+                    moved_from = (FanotifyEvent(mask, path), owners)
+                    continue
+                if owners:
+                    yield FanotifyEvent(mask, path), owners
+            if moved_from is not None and moved_from[1]:
+                yield moved_from
+
+        def _pair_move(self, from_event, from_owners, path, owners):
+            """
+            Yields a FAN_MOVED_TO event as a move for the owners who also
+            watch its source, and as a creation and deletion for the others.
+            """
+            mask = from_event.mask ^ FanotifyConstants.FAN_MOVE
+            if from_owners - owners:
+                yield from_event, from_owners - owners
+            if path is None:
+                return
+            if from_owners & owners:
+                yield (FanotifyEvent(mask, path, from_event.src_path),
+                       from_owners & owners)
+            if owners - from_owners:
+                yield FanotifyEvent(mask, path), owners - from_owners
+
+        def _owners_for_entry(self, fsid, handle, name):
+            """
+            Returns the path of a directory entry and the owners of its
+            events, or ``(None, frozenset())`` for an entry outside the
+            watched trees.
+            """
+            key = fsid + handle
+            try:
+                directory = self._directories[key]
+            except KeyError:
+                directory = self._resolve_directory(fsid, handle)
+                if len(self._directories) >= MAX_CACHED_DIRECTORIES:
+                    self._directories.clear()
+                self._directories[key] = directory
+            if directory is None:
+                return None, frozenset()
+            dir_path, owners, child_roots = directory
+            if name == '.':
+                path = dir_path
+            else:
+                path = os.path.join(dir_path, name)
+            if path in child_roots:
+                # A watched directory itself.
+                owners = owners | frozenset(self._roots[path])
+            return path, owners
+
+        def _resolve_directory(self, fsid, handle):
+            """
+            Resolves the handle of a directory and returns its path, the
+            owners watching its entries and the watched directories among
+            them, or ``None`` if the directory is outside the watched trees.
+            """
+            mark = self._marks.get(fsid)
+            if mark is None:
+                return None
+            try:
+                dir_path = _path_for_handle(mark[0], handle)
+            except OSError:
+                return None
+            if dir_path is None:
+                return None
+            owners = set()
+            child_roots = set()
+            for root, root_owners in self._roots.items():
+                if root == dir_path:
+                    owners.update(root_owners)
+                elif os.path.dirname(root) == dir_path:
+                    child_roots.add(root)
+                elif dir_path.startswith(os.path.join(root, '')):
+                    owners.update([owner for owner, recursive
+                                   in root_owners.items() if recursive])
+            if not owners and not child_roots:
+                return None
+            return dir_path, frozenset(owners), frozenset(child_roots)
+
+        @staticmethod
+        def _raise_error():
+            """
+            Raises errors for fanotify failures.
+            """
+            _errnum = ctypes.get_errno()
+            raise OSError(_errnum, os.strerror(_errnum))
+
+        @staticmethod
+        def _parse_event_buffer(event_buffer):
+            """
+            Parses an event buffer of ``fanotify_event_metadata`` structs
+            returned by fanotify, each followed by an information record
+            identifying the directory and name of the changed entry, and
+            yields ``(mask, fsid, handle, name)`` tuples. ``handle`` is a
+            ``struct file_handle``, or ``None`` for events without a record.
+            """
+            metadata_size = EVENT_METADATA.size
+            length = len(event_buffer)
+            i = 0
+            while i + metadata_size <= length:
+                event_len, _, _, metadata_len, mask, _, _ =\
+                    EVENT_METADATA.unpack_from(event_buffer, i)
+                if event_len < metadata_size:
+                    break
+                fsid = handle = name = None
+                j = i + metadata_len
+                end = i + event_len
+                while j + INFO_HEADER.size <= end:
+                    info_type, _, info_len = INFO_HEADER.unpack_from(
+                        event_buffer, j)
+                    if not info_len:
+                        break
+                    if info_type in (
+                            FanotifyConstants.FAN_EVENT_INFO_TYPE_DFID_NAME,
+                            FanotifyConstants.FAN_EVENT_INFO_TYPE_DFID):
+                        k = j + INFO_HEADER.size
+                        fsid = event_buffer[k:k + FSID_SIZE]
+                        k += FSID_SIZE
+                        handle_bytes, _ = HANDLE_HEADER.unpack_from(
+                            event_buffer, k)
+                        handle_end = k + HANDLE_HEADER.size + handle_bytes
+                        handle = event_buffer[k:handle_end]
+                        if (info_type ==
+                            FanotifyConstants.FAN_EVENT_INFO_TYPE_DFID_NAME):
+                            name_end = event_buffer.find('\0', handle_end,
+                                                         j + info_len)
+                            if name_end == -1:
+                                name_end = j + info_len
+                            name = event_buffer[handle_end:name_end]
+                        else:
+                            name = '.'
+                        break
+                    j += info_len
+                yield mask, fsid, handle, name
+                i += event_len
+
+
+    class FanotifyEmitter(EventEmitter):
+        """
+        fanotify(7)-based event emitter.
+
+        :param event_queue:
+            The event queue to fill with events.
+        :param watch:
+            A watch object representing the directory to monitor.
+        :type watch:
+            :class:`watchdog.observers.api.ObservedWatch`
+        :param timeout:
+            Read events blocking timeout (in seconds).
+        :type timeout:
+            ``float``
+        :param fanotify:
+            A shared :class:`Fanotify` instance read by a
+            :class:`FanotifyReader`. The emitter then does not run a thread
+            of its own. If ``None``, the emitter creates a private fanotify
+            instance and reads it from its own thread.
+        :type fanotify:
+            :class:`Fanotify`
+        :raises:
+            :class:`OSError` if the watched directory cannot be observed with
+            fanotify.
+
+        When events are lost because the kernel event queue overflowed, a
+        modification of the watched directory is reported.
+        """
+
+        def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                     fanotify=None):
+            EventEmitter.__init__(self, event_queue, watch, timeout)
+            self._owns_fanotify = fanotify is None
+            if self._owns_fanotify:
+                fanotify = Fanotify()
+            self._fanotify = fanotify
+            self._real_path = os.path.realpath(watch.path)
+            try:
+                fanotify.add_root(self._real_path, watch.is_recursive, self)
+            except OSError:
+                if self._owns_fanotify:
+                    fanotify.close()
+                raise
+
+        def on_thread_told_to_stop(self):
+            if self._owns_fanotify:
+                self._fanotify.wake()
+            else:
+                self._fanotify.remove_owner(self)
+
+        def on_thread_exit(self):
+            if self._owns_fanotify:
+                self._fanotify.close()
+
+        def queue_events(self, timeout):
+            for owner, events in self._fanotify.read_events_by_owner(
+                    timeout=timeout):
+                if owner is self:
+                    self.queue_fanotify_events(events)
+
+        def queue_fanotify_events(self, fanotify_events):
+            """
+            Translates fanotify events read for this emitter's watch into
+            file system events and queues them.
+
+            :param fanotify_events:
+                List of :class:`FanotifyEvent` objects.
+            """
+            # Paths modified in this batch with no other event since.
+            modified_paths = set()
+            for event in fanotify_events:
+                mask = event.mask
+                if mask & FanotifyConstants.FAN_Q_OVERFLOW:
+                    self.queue_event(DirModifiedEvent(self.watch.path))
+                    continue
+                src_path = self._watch_path(event.src_path)
+                is_directory = mask & FanotifyConstants.FAN_ONDIR
+                if event.move_src_path is not None:
+                    modified_paths.discard(src_path)
+                    if is_directory:
+                        moved_event = DirMovedEvent(
+                            self._watch_path(event.move_src_path), src_path)
+                        self.queue_event(moved_event)
+                        if self.watch.is_recursive:
+                            for sub_event in moved_event.sub_moved_events():
+                                self.queue_event(sub_event)
+                    else:
+                        self.queue_event(FileMovedEvent(
+                            self._watch_path(event.move_src_path), src_path))
+                    continue
+
+                # The kernel merges events for an entry that have not been
+                # read yet, so one event may stand for several changes.
+                created = mask & (FanotifyConstants.FAN_CREATE |
+                                  FanotifyConstants.FAN_MOVED_TO)
+                deleted = mask & (FanotifyConstants.FAN_DELETE |
+                                  FanotifyConstants.FAN_MOVED_FROM)
+                if deleted and created and os.path.lexists(src_path):
+                    # Deleted, then created again.
+                    self._queue_deletion(src_path, is_directory)
+                    deleted = False
+                if created:
+                    modified_paths.discard(src_path)
+                    if is_directory:
+                        self.queue_event(DirCreatedEvent(src_path))
+                    else:
+                        self.queue_event(FileCreatedEvent(src_path))
+                if mask & MODIFICATION_MASK and not deleted:
+                    if src_path not in modified_paths:
+                        modified_paths.add(src_path)
+                        if is_directory:
+                            self.queue_event(DirModifiedEvent(src_path))
+                        else:
+                            self.queue_event(FileModifiedEvent(src_path))
+                if deleted:
+                    modified_paths.discard(src_path)
+                    self._queue_deletion(src_path, is_directory)
+
+        def _queue_deletion(self, src_path, is_directory):
+            if is_directory:
+                self.queue_event(DirDeletedEvent(src_path))
+            else:
+                self.queue_event(FileDeletedEvent(src_path))
+
+        def _watch_path(self, path):
+            """
+            Returns a real path reported by fanotify as a path under the
+            watched path, which may go through symbolic links.
+            """
+            if self._real_path == self.watch.path:
+                return path
+            return self.watch.path + path[len(self._real_path):]
+
+
+    class FanotifyReader(DaemonThread):
+        """
+        Daemon thread that reads a shared :class:`Fanotify` instance and
+        hands the events to the emitters owning the watches they were
+        reported for.
+
+        :param fanotify:
+            The shared fanotify instance. It is closed when the thread exits.
+        :type fanotify:
+            :class:`Fanotify`
+        :param timeout:
+            Read events blocking timeout (in seconds).
+        :type timeout:
+            ``float``
+        """
+
+        def __init__(self, fanotify, timeout=DEFAULT_EMITTER_TIMEOUT):
+            DaemonThread.__init__(self)
+            self._fanotify = fanotify
+            self._timeout = timeout
+
+        @property
+        def fanotify(self):
+            """The fanotify instance read by this thread."""
+            return self._fanotify
+
+        @property
+        def timeout(self):
+            """Read events blocking timeout."""
+            return self._timeout
+
+        def on_thread_told_to_stop(self):
+            self._fanotify.wake()
+
+        def run(self):
+            try:
+                while self.should_keep_running():
+                    for emitter, events in self._fanotify.read_events_by_owner(
+                            timeout=self.timeout):
+                        if emitter is not None:
+                            emitter.queue_fanotify_events(events)
+            finally:
+                self._fanotify.close()
+
+
+    class FanotifyObserver(BaseObserver):
+        """
+        Observer thread that schedules watching directories and dispatches
+        calls to event handlers.
+
+        All watches share a single fanotify instance that is read by a
+        single :class:`FanotifyReader` thread. Watches that cannot be
+        observed with fanotify, because it is not available or because their
+        file system cannot be marked, are observed with
+        :class:`watchdog.observers.inotify.InotifyEmitter` objects instead,
+        which share a single inotify instance read by a single
+        :class:`watchdog.observers.inotify.InotifyReader` thread, as with
+        :class:`watchdog.observers.inotify.InotifyObserver`.
+
+        :param mark_flags:
+            How file systems are marked; see :class:`Fanotify`.
+        """
+
+        def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT,
+                     mark_flags=FanotifyConstants.FAN_MARK_FILESYSTEM):
+            BaseObserver.__init__(self, emitter_class=FanotifyEmitter,
+                                  timeout=timeout)
+            try:
+                self._reader = FanotifyReader(Fanotify(mark_flags), timeout)
+            except OSError:
+                self._reader = None
+            self._reader_started = False
+            # Reads the inotify instance shared by the watches that fall
+            # back to inotify, created when first needed.
+            self._inotify_reader = None
+            self._inotify_auditor = None
+            self._inotify_reader_started = False
+
+        @property
+        def is_fanotify_available(self):
+            """
+            ``True`` if watches can be observed with fanotify.
+            """
+            return self._reader is not None
+
+        def _create_emitter(self, watch):
+            if self._reader is not None:
+                try:
+                    return self._emitter_class(
+                            event_queue=self.event_queue,
+                            watch=watch,
+                            timeout=self.timeout,
+                            fanotify=self._reader.fanotify)
+                except OSError:
+                    pass
+            with self._lock:
+                if self._inotify_reader is None:
+                    self._inotify_reader = InotifyReader(Inotify(),
+                                                         self.timeout)
+                    self._inotify_auditor = InotifyAuditor(self, None)
+                event_types = self._event_types_for_watch(watch)
+            return InotifyEmitter(event_queue=self.event_queue,
+                                  watch=watch,
+                                  timeout=self.timeout,
+                                  inotify=self._inotify_reader.inotify,
+                                  event_types=event_types,
+                                  auditor=self._inotify_auditor)
+
+        def _start_emitter(self, emitter):
+            if not isinstance(emitter, FanotifyEmitter):
+                if not self._inotify_reader_started:
+                    self._inotify_reader_started = True
+                    self._inotify_reader.start()
+            elif not self._reader_started:
+                self._reader_started = True
+                self._reader.start()
+
+        def on_thread_exit(self):
+            BaseObserver.on_thread_exit(self)
+            if self._reader is not None:
+                self._reader.stop()
+                if self._reader_started:
+                    self._reader.join()
+                else:
+                    self._reader.fanotify.close()
+            with self._lock:
+                inotify_reader = self._inotify_reader
+            if inotify_reader is not None:
+                inotify_reader.stop()
+                self._inotify_auditor.stop()
+                if self._inotify_reader_started:
+                    inotify_reader.join()
+                else:
+                    inotify_reader.inotify.close()
@@ -156,3 +156,9 @@ if platform.is_darwin():
                 #path = unicode(path, 'utf-8')
                 path = unicodedata.normalize('NFC', path).encode('utf-8')
             return BaseObserver.schedule(self, event_handler, path, recursive)
+
+        def schedule_async(self, event_handler, path, recursive=False):
+            if isinstance(path, unicode):
+                path = unicodedata.normalize('NFC', path).encode('utf-8')
+            return BaseObserver.schedule_async(self, event_handler, path,
+                                               recursive)
@@ -72,9 +72,21 @@ from watchdog.utils import platform
 
 if platform.is_linux():
     import os
+    import io
+    import errno
+    import collections
+    import fcntl
+    import select
+    import stat
     import struct
+    import termios
+    import time
     import threading
     import ctypes
+    try:
+        import queue # IGNORE:F0401
+    except ImportError:
+        import Queue as queue # IGNORE:F0401
     from ctypes import\
         c_int,\
         c_char_p,\
@@ -84,12 +96,19 @@ if platform.is_linux():
 
     from watchdog.utils import\
         has_attribute,\
-        ctypes_find_library
+        ctypes_find_library,\
+        DaemonThread
+    from watchdog.utils.bricks import OrderedSet
+    from watchdog.utils.dirscan import iter_entries, subdirectories
+    from watchdog.utils.dirsnapshot import\
+        DirectorySnapshot,\
+        DirectorySnapshotDiff
     from watchdog.observers.api import\
         EventEmitter,\
         BaseObserver,\
         DEFAULT_EMITTER_TIMEOUT,\
         DEFAULT_OBSERVER_TIMEOUT
+    from watchdog.observers.polling import events_from_snapshot_diff
     from watchdog.events import\
         DirDeletedEvent,\
         DirModifiedEvent,\
@@ -194,9 +213,9 @@ if platform.is_linux():
                 IN_MOVE_SELF,
                 ])
 
-        # Flags for ``inotify_init1``
-        IN_CLOEXEC = 0x02000000
-        IN_NONBLOCK = 0x00004000
+        # Flags for ``inotify_init1`` (``O_CLOEXEC`` and ``O_NONBLOCK``).
+        IN_CLOEXEC = 0x00080000
+        IN_NONBLOCK = 0x00000800
 
         # All inotify bits.
         ALL_INOTIFY_BITS = reduce(lambda x, y: x | y, [
@@ -239,6 +258,46 @@ if platform.is_linux():
             InotifyConstants.IN_DELETE_SELF,
             ])
 
+    # The inotify events needed to report every type of file system event.
+    # Moves are watched for creations and deletions too, because a file
+    # moved in or out of the watched tree is reported as such.
+    INOTIFY_MASK_FOR_EVENT_TYPE = {
+        EVENT_TYPE_CREATED: InotifyConstants.IN_CREATE | InotifyConstants.IN_MOVE,
+        EVENT_TYPE_DELETED: InotifyConstants.IN_DELETE |
+                            InotifyConstants.IN_DELETE_SELF |
+                            InotifyConstants.IN_MOVE,
+        EVENT_TYPE_MOVED: InotifyConstants.IN_MOVE,
+        EVENT_TYPE_MODIFIED: InotifyConstants.IN_MODIFY |
+                             InotifyConstants.IN_ATTRIB |
+                             InotifyConstants.IN_CLOSE_WRITE,
+        }
+
+    def event_mask_for_event_types(event_types, recursive=False):
+        """
+        Returns the inotify event mask needed to report the given types of
+        file system events.
+
+        :param event_types:
+            Iterable of ``EVENT_TYPE_*`` constants from
+            :mod:`watchdog.events`, or ``None`` for all of them.
+        :param recursive:
+            ``True`` if the mask is for a recursive watch, which needs to
+            know about created and moved directories regardless.
+        """
+        if event_types is None:
+            return WATCHDOG_ALL_EVENTS
+        mask = InotifyConstants.IN_DELETE_SELF
+        if recursive:
+            mask |= InotifyConstants.IN_CREATE | InotifyConstants.IN_MOVE
+        for event_type in event_types:
+            mask |= INOTIFY_MASK_FOR_EVENT_TYPE[event_type]
+        return mask
+
+    # Events with any of these bits set are about directories.
+    DIRECTORY_MASK = (InotifyConstants.IN_ISDIR |
+                      InotifyConstants.IN_DELETE_SELF |
+                      InotifyConstants.IN_MOVE_SELF)
+
     class InotifyEvent(object):
         """
         Inotify event struct wrapper.
@@ -253,112 +312,105 @@ if platform.is_linux():
             Event name.
         :param src_path:
             Event source path
-        """
-
-        def __init__(self, wd, mask, cookie, name, src_path):
-            self._wd = wd
-            self._mask = mask
-            self._cookie = cookie
-            self._name = name
-            self._src_path = src_path
-
-        @property
-        def src_path(self):
-            return self._src_path
-
-        @property
-        def wd(self):
-            return self._wd
+        :param move_src_path:
+            For an IN_MOVED_TO event paired with its IN_MOVED_FROM event, the
+            path the file was moved from.
 
-        @property
-        def mask(self):
-            return self._mask
+        Events are read at high rates, so they are kept in slots and their
+        fields are plain attributes.
+        """
 
-        @property
-        def cookie(self):
-            return self._cookie
+        __slots__ = ('wd', 'mask', 'cookie', 'name', 'src_path',
+                     'move_src_path')
 
-        @property
-        def name(self):
-            return self._name
+        def __init__(self, wd, mask, cookie, name, src_path,
+                     move_src_path=None):
+            self.wd = wd
+            self.mask = mask
+            self.cookie = cookie
+            self.name = name
+            self.src_path = src_path
+            self.move_src_path = move_src_path
 
         # Test event types.
         @property
         def is_modify(self):
-            return self._mask & InotifyConstants.IN_MODIFY > 0
+            return self.mask & InotifyConstants.IN_MODIFY > 0
 
         @property
         def is_close_write(self):
-            return self._mask & InotifyConstants.IN_CLOSE_WRITE > 0
+            return self.mask & InotifyConstants.IN_CLOSE_WRITE > 0
 
         @property
         def is_close_nowrite(self):
-            return self._mask & InotifyConstants.IN_CLOSE_NOWRITE > 0
+            return self.mask & InotifyConstants.IN_CLOSE_NOWRITE > 0
 
         @property
         def is_access(self):
-            return self._mask & InotifyConstants.IN_ACCESS > 0
+            return self.mask & InotifyConstants.IN_ACCESS > 0
 
         @property
         def is_delete(self):
-            return self._mask & InotifyConstants.IN_DELETE > 0
+            return self.mask & InotifyConstants.IN_DELETE > 0
 
         @property
         def is_delete_self(self):
-            return self._mask & InotifyConstants.IN_DELETE_SELF > 0
+            return self.mask & InotifyConstants.IN_DELETE_SELF > 0
 
         @property
         def is_create(self):
-            return self._mask & InotifyConstants.IN_CREATE > 0
+            return self.mask & InotifyConstants.IN_CREATE > 0
 
         @property
         def is_moved_from(self):
-            return self._mask & InotifyConstants.IN_MOVED_FROM > 0
+            return self.mask & InotifyConstants.IN_MOVED_FROM > 0
 
         @property
         def is_moved_to(self):
-            return self._mask & InotifyConstants.IN_MOVED_TO > 0
+            return self.mask & InotifyConstants.IN_MOVED_TO > 0
 
         @property
         def is_move(self):
-            return self._mask & InotifyConstants.IN_MOVE > 0
+            return self.mask & InotifyConstants.IN_MOVE > 0
 
         @property
         def is_move_self(self):
-            return self._mask & InotifyConstants.IN_MOVE_SELF > 0
+            return self.mask & InotifyConstants.IN_MOVE_SELF > 0
 
         @property
         def is_attrib(self):
-            return self._mask & InotifyConstants.IN_ATTRIB > 0
+            return self.mask & InotifyConstants.IN_ATTRIB > 0
 
         # Additional bit masks
         @property
         def is_ignored(self):
-            return self._mask & InotifyConstants.IN_IGNORED > 0
+            return self.mask & InotifyConstants.IN_IGNORED > 0
+
+        @property
+        def is_q_overflow(self):
+            return self.mask & InotifyConstants.IN_Q_OVERFLOW > 0
 
         @property
         def is_directory(self):
             # It looks like the kernel does not provide this information for 
             # IN_DELETE_SELF and IN_MOVE_SELF. In this case, assume it's a dir.
             # See also: https://github.com/seb-m/pyinotify/blob/2c7e8f8/python2/pyinotify.py#L897
-            if self.is_delete_self or self.is_move_self:
-                return True
-            return self._mask & InotifyConstants.IN_ISDIR > 0
+            return self.mask & DIRECTORY_MASK > 0
 
         # Python-specific functionality.
         @property
         def key(self):
-            return (self._src_path,
-                    self._wd,
-                    self._mask,
-                    self._cookie,
-                    self._name)
+            return (self.src_path,
+                    self.wd,
+                    self.mask,
+                    self.cookie,
+                    self.name)
 
         def __eq__(self, inotify_event):
             return self.key == inotify_event.key
 
         def __ne__(self, inotify_event):
-            return self.key == inotify_event.key
+            return self.key != inotify_event.key
 
         def __hash__(self):
             return hash(self.key)
@@ -406,49 +458,218 @@ if platform.is_linux():
                     ('len', c_uint32),
                     ('name', c_char_p)]
 
+    def _set_non_blocking(fd):
+        """Puts the given file descriptor in non-blocking mode."""
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
     EVENT_SIZE = ctypes.sizeof(inotify_event_struct)
     DEFAULT_NUM_EVENTS = 2048
     DEFAULT_EVENT_BUFFER_SIZE = DEFAULT_NUM_EVENTS * (EVENT_SIZE + 16)
 
+    # Bounds of the read buffer, which is sized to the number of bytes queued
+    # in the kernel. A read needs room for an event with the longest name.
+    MIN_EVENT_BUFFER_SIZE = 16 * (EVENT_SIZE + 256)
+    MAX_EVENT_BUFFER_SIZE = 16384 * (EVENT_SIZE + 16)
+
+    FIONREAD = getattr(termios, 'FIONREAD', 0x541B)
+
+    def _queued_bytes(fd):
+        """Returns the number of bytes that can be read from the given file
+        descriptor without blocking."""
+        return struct.unpack('i', fcntl.ioctl(fd, FIONREAD, '\0' * 4))[0]
+
+    def _read_inotify_limit(name):
+        """Returns the inotify limit of the given name, or ``None`` if it
+        cannot be read."""
+        try:
+            f = open(os.path.join('/proc/sys/fs/inotify', name))
+            try:
+                return int(f.read())
+            finally:
+                f.close()
+        except (IOError, ValueError):
+            return None
+
+    # Maximum number of threads of an Inotify instance registering the
+    # watches of directory trees.
+    DEFAULT_REGISTRATION_WORKERS = 8
+
+    # Interval (in seconds) between snapshots of subtrees that are polled
+    # because they did not fit in the watch budget.
+    DEFAULT_POLLING_INTERVAL = 5
+
+    # Maximum number of files and directories an audit examines per second.
+    DEFAULT_AUDIT_BUDGET = 1000
+
+    # Niceness added to the thread running audits.
+    AUDIT_NICENESS = 10
+
+    # Time (in seconds) an IN_MOVED_FROM event that ends a read waits for
+    # its IN_MOVED_TO event in a later read before it is reported as a
+    # deletion, and the maximum number of IN_MOVED_FROM events waiting.
+    MOVE_EVENT_TIMEOUT = 0.5
+    MAX_PENDING_MOVES = 1024
+
+    # The fixed-size part of an ``inotify_event`` struct preceding the name.
+    EVENT_HEADER = struct.Struct('iIII')
+
+    try:
+        memoryview
+    except NameError: # pragma: no cover
+        # Python 2.6 and below slice the buffer instead.
+        memoryview = None
+
     class Inotify(object):
         """
         Linux inotify(7) API wrapper class.
 
+        A single instance wraps a single inotify file descriptor and may hold
+        watches for any number of directory trees at once. Each watch
+        descriptor records the *owners* (for example, emitters) on whose
+        behalf it was added so that events read from the shared descriptor
+        can be demultiplexed to the right consumer.
+
         :param path:
-            The directory path for which we want an inotify object.
+            The directory path for which we want an inotify object. If
+            ``None``, no watches are added until :meth:`add_dir_watch` is
+            called.
         :param recursive:
             ``True`` if subdirectories should be monitored; ``False`` otherwise.
         :param non_blocking:
-            ``True`` to initialize inotify in non-blocking mode; ``False``
+            ``True`` if :meth:`read_events` should return immediately when no
+            events are pending instead of waiting for them; ``False``
             otherwise.
+        :param max_watches:
+            Maximum number of kernel watches held by this instance, or
+            ``None`` to be limited only by ``max_user_watches``.
+        :param polling_interval:
+            Interval (in seconds) between snapshots of polled subtrees.
+        :param registration_workers:
+            Maximum number of threads registering the subdirectories of the
+            trees passed to :meth:`register_tree`, shared by all of them.
+
+        .. ADMONITION:: About the watch budget
+
+            Once ``max_watches`` watches are held, or the kernel refuses
+            further watches with ``ENOSPC``, directories of recursive trees
+            are observed by polling instead of failing. When a directory is
+            created while the budget is exhausted, the subtree of the least
+            recently changed watched directory is *demoted*: its kernel
+            watches are released and it is polled with
+            :class:`watchdog.utils.dirsnapshot.DirectorySnapshot` every
+            ``polling_interval`` seconds by :meth:`poll_subtrees`. A polled
+            subtree that changes is given kernel watches again as soon as the
+            budget allows. Directories that are the root of a watched tree
+            are never demoted.
+
+        The inotify file descriptor is always put in non-blocking mode and
+        read only once ``epoll(7)`` (or :func:`select.select` on Pythons
+        without :func:`select.epoll`) reports it readable, so that a pending
+        read honours its timeout and can be interrupted with :meth:`wake`.
         """
 
         def __init__(self,
-                     path,
+                     path=None,
                      recursive=False,
                      event_mask=WATCHDOG_ALL_EVENTS,
-                     non_blocking=False):
+                     non_blocking=False,
+                     max_watches=None,
+                     polling_interval=DEFAULT_POLLING_INTERVAL,
+                     registration_workers=DEFAULT_REGISTRATION_WORKERS):
         # The file descriptor associated with the inotify instance.
-            if non_blocking:
+            try:
                 inotify_fd = inotify_init1(InotifyConstants.IN_NONBLOCK)
-            else:
+            except AttributeError:
                 inotify_fd = inotify_init()
+                if inotify_fd != -1:
+                    _set_non_blocking(inotify_fd)
             if inotify_fd == -1:
                 Inotify._raise_error()
             self._inotify_fd = inotify_fd
             self._lock = threading.Lock()
 
-            # Stores the watch descriptor for a given path.
-            self._wd_for_path = dict()
-            self._path_for_wd = dict()
+            # Events are read into a reused buffer, which grows and shrinks
+            # with the number of bytes queued in the kernel. The queue depth
+            # observed by the latest read, and its peak, are kept as metrics.
+            self._event_file = io.FileIO(inotify_fd, 'rb', closefd=False)
+            self._event_buffer = bytearray(MIN_EVENT_BUFFER_SIZE)
+            self._queued_bytes = 0
+            self._queue_depth = 0
+            self._peak_queue_depth = 0
+            self._max_queued_events = _read_inotify_limit('max_queued_events')
+
+            # Writing to this pipe interrupts a pending read.
+            self._wake_fd, self._wake_write_fd = os.pipe()
+            _set_non_blocking(self._wake_fd)
+            _set_non_blocking(self._wake_write_fd)
+            if has_attribute(select, 'epoll'):
+                self._epoll = select.epoll()
+                self._epoll.register(self._inotify_fd, select.EPOLLIN)
+                self._epoll.register(self._wake_fd, select.EPOLLIN)
+            else:
+                self._epoll = None
+
+            # Watched directories form a tree of nodes, each holding its
+            # name and a pointer to its parent, so that a directory's path
+            # is built when needed and a moved tree is updated by updating
+            # its root only. Nodes whose parent is not watched are roots
+            # named by their absolute paths.
+            self._node_for_wd = dict()
+            self._root_nodes = dict()
+
+            # Owners of every watch descriptor, watch descriptors held by
+            # every owner, the owners whose trees are recursive, and the
+            # event masks of owners that do not use the instance's mask.
+            self._mask_for_owner = dict()
+            self._owners_for_wd = dict()
+            self._wds_for_owner = dict()
+            self._recursive_owners = set()
+
+            # Watch budget, watch descriptors of tree roots (which are never
+            # demoted), watch descriptors ordered from the least to the most
+            # recently changed, and polled subtrees by path.
+            self._max_watches = max_watches
+            self._reserved_watches = 0
+            self._root_wds = set()
+            self._wd_lru = OrderedSet()
+            self._polled_subtrees = dict()
+            self._polling_interval = polling_interval
 
-            path = absolute_path(path)
-            self._path = path
             self._event_mask = event_mask
             self._is_recursive = recursive
             self._is_non_blocking = non_blocking
-            self._add_dir_watch(path, recursive, event_mask)
+            # Directories created in watched trees are scanned for contents
+            # that predate their watches by a background thread, which hands
+            # creation events to the reader. Paths whose creation has been
+            # reported are remembered while scans are under way so that the
+            # kernel's and the scanner's reports are not both passed on.
+            self._is_closed = False
+            self._active_readers = 0
+            self._scan_queue = queue.Queue()
+            self._scanner = None
+            # Directories of trees being registered whose subdirectories are
+            # yet to be watched, as ``(registration, path)`` pairs, taken by
+            # at most ``registration_workers`` threads that exit once there
+            # are none left.
+            self._registration_jobs = collections.deque()
+            self._registration_workers = 0
+            self._max_registration_workers = max(1, registration_workers)
+            self._active_scans = 0
+            self._scanned_events = []
+            self._created_paths = set()
+            # Paths deleted or moved out while scans are under way, which a
+            # scan may have listed before the deletion was read.
+            self._deleted_paths = set()
+
+            # Pending IN_MOVED_FROM events by cookie, and their cookies in
+            # the order they expire.
             self._moved_from_events = dict()
+            self._move_deadlines = collections.deque()
+            self._path = None
+            if path is not None:
+                self._path = absolute_path(path)
+                self.add_dir_watch(self._path, recursive)
 
         @property
         def event_mask(self):
@@ -475,9 +696,58 @@ if platform.is_linux():
             """The file descriptor associated with the inotify instance."""
             return self._inotify_fd
 
+        @property
+        def queued_bytes(self):
+            """Number of bytes queued in the kernel at the latest read."""
+            return self._queued_bytes
+
+        @property
+        def queue_depth(self):
+            """
+            Number of events read by the latest read, which is the number of
+            events queued in the kernel at the time unless that exceeded
+            the read buffer.
+            """
+            return self._queue_depth
+
+        @property
+        def peak_queue_depth(self):
+            """Highest :attr:`queue_depth` observed."""
+            return self._peak_queue_depth
+
+        @property
+        def max_queued_events(self):
+            """
+            The kernel's limit on the number of queued events, beyond which
+            events are lost, or ``None`` if unknown.
+            """
+            return self._max_queued_events
+
+        @property
+        def event_buffer_size(self):
+            """Current size of the read buffer."""
+            return len(self._event_buffer)
+
+        @property
+        def max_watches(self):
+            """The watch budget, or ``None`` if unlimited."""
+            return self._max_watches
+
+        @property
+        def watch_count(self):
+            """Number of kernel watches held."""
+            return len(self._node_for_wd)
+
+        @property
+        def polled_paths(self):
+            """Roots of the subtrees that are polled instead of watched."""
+            with self._lock:
+                return list(self._polled_subtrees)
+
         def clear_move_records(self):
             """Clear cached records of MOVED_FROM events"""
-            self._moved_from_events = dict()
+            self._moved_from_events.clear()
+            self._move_deadlines.clear()
 
         def source_for_move(self, destination_event):
             """
@@ -486,14 +756,174 @@ if platform.is_linux():
             If the source path is outside the monitored directories, None
             is returned instead.
             """
-            if destination_event.cookie in self._moved_from_events:
-                return self._moved_from_events[destination_event.cookie].src_path
-            else:
+            if destination_event.move_src_path is not None:
+                return destination_event.move_src_path
+            entry = self._moved_from_events.get(destination_event.cookie)
+            if entry is None:
                 return None
+            return entry[0].src_path
 
         def remember_move_from_event(self, event):
             """Save this event as the source event for future MOVED_TO events to reference"""
-            self._moved_from_events[event.cookie] = event
+            self._remember_move(event,
+                                frozenset(self._owners_for_wd.get(event.wd, ())))
+
+        def add_dir_watch(self, path, recursive=False, owner=None):
+            """
+            Adds watches for a directory (and optionally its whole tree) on
+            behalf of the given owner. Watches shared with other owners are
+            reused rather than added again.
+
+            :param path:
+                Directory path to begin monitoring.
+            :param recursive:
+                ``True`` to monitor the directory tree recursively.
+            :param owner:
+                Hashable object on whose behalf events will be reported.
+            """
+            registration = self.register_tree(path, recursive, owner)
+            registration.wait()
+            if registration.error is not None:
+                raise registration.error
+
+        def register_tree(self, path, recursive=False, owner=None,
+                          event_mask=None):
+            """
+            Starts adding watches for a directory (and optionally its whole
+            tree) on behalf of the given owner and returns without waiting
+            for the subdirectories to be registered.
+
+            :param path:
+                Directory path to begin monitoring.
+            :param recursive:
+                ``True`` to monitor the directory tree recursively.
+            :param owner:
+                Hashable object on whose behalf events will be reported.
+            :param event_mask:
+                Event mask of the watches added on behalf of the owner, or
+                ``None`` to use the owner's current mask; see
+                :meth:`set_owner_mask`.
+            :returns:
+                The started :class:`InotifyTreeRegistration`.
+            :raises:
+                :class:`OSError` if the directory itself cannot be watched.
+            """
+            if event_mask is not None:
+                with self._lock:
+                    self._mask_for_owner[owner] = event_mask
+            registration = InotifyTreeRegistration(self,
+                                                   absolute_path(path),
+                                                   recursive,
+                                                   owner)
+            registration.start()
+            return registration
+
+        def _queue_registration_job(self, registration, path):
+            """
+            Queues a directory whose subdirectories a registration is to
+            watch, starting a registration worker if there are fewer than
+            the maximum.
+            """
+            with self._lock:
+                self._registration_jobs.append((registration, path))
+                if self._registration_workers < self._max_registration_workers:
+                    self._registration_workers += 1
+                    worker = threading.Thread(
+                        target=self._register_directories)
+                    worker.setDaemon(True)
+                    worker.start()
+
+        def _register_directories(self):
+            """
+            Runs a registration worker.
+            """
+            while True:
+                with self._lock:
+                    if not self._registration_jobs:
+                        self._registration_workers -= 1
+                        return
+                    registration, path = self._registration_jobs.popleft()
+                registration._work(path)
+
+        def remove_owner(self, owner):
+            """
+            Releases every watch held on behalf of the given owner. Watches
+            that are no longer owned by anybody are removed from the kernel.
+
+            :param owner:
+                The owner passed to :meth:`add_dir_watch`.
+            """
+            with self._lock:
+                self._recursive_owners.discard(owner)
+                self._mask_for_owner.pop(owner, None)
+                for path, subtree in list(self._polled_subtrees.items()):
+                    subtree.owners.discard(owner)
+                    if not subtree.owners:
+                        del self._polled_subtrees[path]
+                shared_wds = []
+                for wd in self._wds_for_owner.pop(owner, ()):
+                    owners = self._owners_for_wd.get(wd)
+                    if owners is None:
+                        continue
+                    owners.discard(owner)
+                    if not owners:
+                        self._remove_watch_bookkeeping(wd)
+                        # The watch may already be gone if the directory
+                        # was deleted and IN_IGNORED is still pending, so
+                        # failures are not errors here.
+                        inotify_rm_watch(self._inotify_fd, wd)
+                    else:
+                        shared_wds.append(wd)
+                self._update_masks(shared_wds)
+
+        def set_owner_mask(self, owner, event_mask):
+            """
+            Changes the event mask of the watches held on behalf of the given
+            owner. The kernel mask of a watch shared by several owners is the
+            union of their masks; it is extended with ``IN_MASK_ADD`` and
+            replaced only when it has to shrink.
+
+            :param owner:
+                The owner passed to :meth:`register_tree`.
+            :param event_mask:
+                The new event mask.
+            """
+            with self._lock:
+                if self._mask_for_owner.get(owner) == event_mask:
+                    return
+                self._mask_for_owner[owner] = event_mask
+                self._update_masks(self._wds_for_owner.get(owner, ()))
+
+        def owners_for_wd(self, wd):
+            """
+            Returns the owners of the given watch descriptor.
+
+            :param wd:
+                Watch descriptor.
+            """
+            with self._lock:
+                return frozenset(self._owners_for_wd.get(wd, ()))
+
+        def is_observed(self, path):
+            """
+            Determines whether a directory is watched, or polled as part of
+            a polled subtree.
+
+            :param path:
+                Absolute path of the directory.
+            """
+            with self._lock:
+                if (self._node_for_path(path) is not None or
+                    path in self._polled_subtrees):
+                    return True
+                parent_path = os.path.dirname(path)
+                while parent_path != path:
+                    subtree = self._polled_subtrees.get(parent_path)
+                    if subtree is not None and subtree.is_recursive:
+                        return True
+                    path = parent_path
+                    parent_path = os.path.dirname(path)
+                return False
 
         def add_watch(self, path):
             """
@@ -517,119 +947,732 @@ if platform.is_linux():
                 path = absolute_path(path)
                 self._remove_watch(path)
 
+        def poll_subtrees(self):
+            """
+            Snapshots the polled subtrees that are due and returns the changes
+            found since their previous snapshots.
+
+            :returns:
+                A list of ``(owner, events)`` pairs, where the events are
+                :class:`watchdog.events.FileSystemEvent` objects.
+            """
+            now = time.time()
+            with self._lock:
+                due = [subtree for subtree in self._polled_subtrees.values()
+                       if now - subtree.last_poll >= self._polling_interval]
+            groups = []
+            for subtree in due:
+                subtree.last_poll = now
+                try:
+                    snapshot = DirectorySnapshot(subtree.path,
+                                                 subtree.is_recursive)
+                except OSError:
+                    # Deleted or moved; reported by the parent's watch.
+                    with self._lock:
+                        if self._polled_subtrees.get(subtree.path) is subtree:
+                            del self._polled_subtrees[subtree.path]
+                    continue
+                with self._lock:
+                    if self._polled_subtrees.get(subtree.path) is not subtree:
+                        continue
+                    previous_snapshot = subtree.snapshot
+                    subtree.snapshot = snapshot
+                    owners = list(subtree.owners)
+                if previous_snapshot is None:
+                    continue
+                events = events_from_snapshot_diff(
+                    DirectorySnapshotDiff(previous_snapshot, snapshot))
+                if not events:
+                    continue
+                for owner in owners:
+                    groups.append((owner, events))
+                with self._lock:
+                    self._promote_subtree(subtree)
+            return groups
+
         def close(self):
             """
             Closes the inotify instance and removes all associated watches.
             """
             with self._lock:
-                self._remove_all_watches()
-                os.close(self._inotify_fd)
+                if self._is_closed:
+                    return
+                self._is_closed = True
+                if self._scanner is not None:
+                    self._scan_queue.put(None)
+                try:
+                    self._remove_all_watches()
+                finally:
+                    if self._active_readers:
+                        # The last reader closes the descriptors once it has
+                        # stopped waiting for them.
+                        self._wake()
+                    else:
+                        self._close_descriptors()
+
+        def wake(self):
+            """
+            Interrupts a pending :meth:`read_events` call, which then returns
+            no events.
+            """
+            with self._lock:
+                if not self._is_closed or self._active_readers:
+                    self._wake()
+
+        def _wake(self):
+            try:
+                os.write(self._wake_write_fd, '\0')
+            except OSError, e:
+                # The pipe is full, so a wake-up is already pending.
+                if e.errno != errno.EAGAIN:
+                    raise
+
+        def read_events(self, event_buffer_size=MAX_EVENT_BUFFER_SIZE,
+                        timeout=None):
+            """
+            Reads events from inotify and returns them.
+
+            :param event_buffer_size:
+                Maximum number of bytes to read from the kernel. Reads are
+                sized to the number of bytes queued, within this bound.
+            :param timeout:
+                Maximum time (in seconds) to wait for events. ``None`` waits
+                until events arrive or :meth:`wake` is called, unless the
+                instance is non-blocking.
+            """
+            return [event for event, _ in self._read_events(event_buffer_size,
+                                                            timeout)]
+
+        def read_events_by_owner(self,
+                                 event_buffer_size=MAX_EVENT_BUFFER_SIZE,
+                                 timeout=None):
+            """
+            Reads events from inotify and groups them by the owners of the
+            watches they were reported for.
+
+            :param event_buffer_size:
+                Maximum number of bytes to read from the kernel. Reads are
+                sized to the number of bytes queued, within this bound.
+            :param timeout:
+                Maximum time (in seconds) to wait for events.
+            :returns:
+                A list of ``(owner, events)`` pairs. The order of events is
+                preserved within every group.
+            """
+            groups = []
+            events_for_owner = dict()
+            for event, owners in self._read_events(event_buffer_size, timeout):
+                for owner in owners:
+                    try:
+                        events_for_owner[owner].append(event)
+                    except KeyError:
+                        events_for_owner[owner] = [event]
+                        groups.append((owner, events_for_owner[owner]))
+            return groups
+
+        def _wait(self, timeout):
+            """
+            Waits until the inotify descriptor is readable, the timeout
+            expires or :meth:`wake` is called.
 
-        def read_events(self, event_buffer_size=DEFAULT_EVENT_BUFFER_SIZE):
+            :returns:
+                ``True`` if events can be read; ``False`` otherwise.
             """
-            Reads events from inotify and yields them.
+            if timeout is None and self._is_non_blocking:
+                timeout = 0
+            try:
+                if self._epoll is not None:
+                    if timeout is None:
+                        timeout = -1
+                    ready = [fd for fd, _ in self._epoll.poll(timeout)]
+                else:
+                    ready = select.select([self._inotify_fd, self._wake_fd],
+                                          [], [], timeout)[0]
+            except (IOError, OSError, select.error), e:
+                if e.args[0] == errno.EINTR:
+                    return False
+                raise
+            if self._wake_fd in ready:
+                try:
+                    while os.read(self._wake_fd, 64):
+                        pass
+                except OSError, e:
+                    if e.errno != errno.EAGAIN:
+                        raise
+                return False
+            return self._inotify_fd in ready
+
+        def _read_events(self, event_buffer_size, timeout=None):
+            """
+            Reads events from inotify and returns a list of
+            ``(event, owners)`` pairs.
+
+            The lock is held only while the events read are translated, so
+            that watches can be added and removed, and the instance closed,
+            while the reader waits for the kernel.
             """
             with self._lock:
-                event_buffer = os.read(self._inotify_fd, event_buffer_size)
-                event_list = []
+                if self._is_closed:
+                    return []
+                self._active_readers += 1
+            try:
+                return self._read_and_translate_events(event_buffer_size,
+                                                       timeout)
+            finally:
+                with self._lock:
+                    self._active_readers -= 1
+                    if self._is_closed and not self._active_readers:
+                        self._close_descriptors()
+
+        def _resize_event_buffer(self, queued_bytes, limit):
+            """
+            Grows the read buffer, by doubling, to hold the queued bytes
+            within the limit, or halves it when it is mostly unused.
+            """
+            limit = max(limit, MIN_EVENT_BUFFER_SIZE)
+            size = len(self._event_buffer)
+            wanted = max(min(queued_bytes, limit), MIN_EVENT_BUFFER_SIZE)
+            if wanted > size:
+                while size < wanted:
+                    size *= 2
+                size = min(size, limit)
+            elif wanted <= size // 4 or size > limit:
+                size = max(min(size // 2, limit), MIN_EVENT_BUFFER_SIZE)
+            if size != len(self._event_buffer):
+                self._event_buffer = bytearray(size)
+
+        def _close_descriptors(self):
+            if self._epoll is not None:
+                self._epoll.close()
+            os.close(self._inotify_fd)
+            os.close(self._wake_fd)
+            os.close(self._wake_write_fd)
+
+        def _read_and_translate_events(self, event_buffer_size, timeout):
+            was_scanning = self._active_scans > 0
+            length = 0
+            queued_bytes = 0
+            if self._wait(self._timeout_for_pending_moves(timeout)):
+                try:
+                    queued_bytes = _queued_bytes(self._inotify_fd)
+                    self._resize_event_buffer(queued_bytes, event_buffer_size)
+                    length = self._event_file.readinto(self._event_buffer) or 0
+                except (IOError, OSError), e:
+                    if e.errno != errno.EINTR:
+                        raise
+            if (not length and not self._move_deadlines and
+                not self._scanned_events):
+                return []
+            with self._lock:
+                if self._is_closed:
+                    return []
+                event_list = self._scanned_events
+                self._scanned_events = []
+                node_for_wd = self._node_for_wd
+                wd_lru = self._wd_lru
+                # Directory path prefixes for this batch, forgotten whenever
+                # paths may change.
+                prefix_for_wd = dict()
+                active_wds = set()
+                queue_depth = 0
+                IN_MOVED_FROM = InotifyConstants.IN_MOVED_FROM
+                IN_MOVED_TO = InotifyConstants.IN_MOVED_TO
+                IN_IGNORED = InotifyConstants.IN_IGNORED
+                IN_CREATE = InotifyConstants.IN_CREATE
+                IN_DELETE = InotifyConstants.IN_DELETE
+                moved_from_events = self._moved_from_events
+                self._expire_moves(event_list)
                 for wd, mask, cookie, name in Inotify._parse_event_buffer(
-                        event_buffer):
-                    wd_path = self._path_for_wd[wd]
-                    src_path = absolute_path(os.path.join(wd_path, name))
+                        self._event_buffer, length):
+                    queue_depth += 1
+                    if moved_from_events and not (mask & IN_MOVED_TO and
+                                                  cookie in moved_from_events):
+                        # The kernel queues an IN_MOVED_TO event right after
+                        # its IN_MOVED_FROM event, so the pending ones moved
+                        # out of the watched trees.
+                        self._report_pending_moves(event_list)
+                    if mask & InotifyConstants.IN_Q_OVERFLOW:
+                        # Events were dropped: every owner has to resync.
+                        # Moves cannot be paired across the gap.
+                        self.clear_move_records()
+                        owners = set(self._wds_for_owner)
+                        for subtree in self._polled_subtrees.values():
+                            owners.update(subtree.owners)
+                        event_list.append((InotifyEvent(wd, mask, cookie,
+                                                        name, ''),
+                                           frozenset(owners)))
+                        continue
+                    node = node_for_wd.get(wd)
+                    if node is None:
+                        # Events still queued for a watch we have already
+                        # removed.
+                        continue
+                    if wd not in active_wds:
+                        # Keep the watch descriptors ordered by recent
+                        # activity, before directories created in this
+                        # batch are watched and colder subtrees demoted.
+                        active_wds.add(wd)
+                        wd_lru.discard(wd)
+                        wd_lru.add(wd)
+                    owners = frozenset(self._owners_for_wd[wd])
+                    if name:
+                        try:
+                            src_path = prefix_for_wd[wd] + name
+                        except KeyError:
+                            prefix = os.path.join(node.path, '')
+                            prefix_for_wd[wd] = prefix
+                            src_path = prefix + name
+                    else:
+                        src_path = node.path
                     inotify_event = InotifyEvent(wd, mask, cookie, name,
                                                  src_path)
 
+                    if mask & IN_MOVED_FROM:
+                        self._created_paths.discard(src_path)
+                        self._note_deletion(src_path)
+                        self._remember_move(inotify_event, owners)
+                        continue
+                    elif mask & IN_MOVED_TO:
+                        self._deleted_paths.discard(src_path)
+                        self._pair_move(inotify_event, owners, event_list)
+                        prefix_for_wd.clear()
+                        continue
 
-                    if inotify_event.is_moved_from:
-                        self.remember_move_from_event(inotify_event)
-                    elif inotify_event.is_moved_to:
-                        move_src_path = self.source_for_move(inotify_event)
-                        if move_src_path in self._wd_for_path:
-                            # update old path -> new path
-                            moved_wd = self._wd_for_path[move_src_path]
-                            del self._wd_for_path[move_src_path]
-                            self._wd_for_path[inotify_event.src_path] = moved_wd
-                            self._path_for_wd[moved_wd] = inotify_event.src_path
-                        src_path = absolute_path(os.path.join(wd_path, name))
-                        inotify_event = InotifyEvent(wd, mask, cookie, name,
-                                                  src_path)
-
-                    if inotify_event.is_ignored:
+                    if mask & IN_IGNORED:
                     # Clean up book-keeping for deleted watches.
-                        self._remove_watch_bookkeeping(src_path)
+                        self._remove_watch_bookkeeping(wd)
+                        prefix_for_wd.clear()
                         continue
 
-                    event_list.append(inotify_event)
-
-                    if inotify_event.is_directory:
-                        if inotify_event.is_create:
-                        # HACK: We need to traverse the directory path
-                        # recursively and simulate events for newly
-                        # created subdirectories/files. This will handle
-                        # mkdir -p foobar/blah/bar; touch foobar/afile
-
-                        # TODO: When a directory from another part of the
-                        # filesystem is moved into a watched directory, this
-                        # will not generate events for the directory tree.
-                        # We need to coalesce IN_MOVED_TO events and those
-                        # IN_MOVED_TO events which don't pair up with
-                        # IN_MOVED_FROM events should be marked IN_CREATE
-                        # instead relative to this directory.
-                            self._add_watch(src_path, self._event_mask)
-
-                            for root, dirnames, filenames in os.walk(src_path):
-                                for dirname in dirnames:
-                                    full_path = absolute_path(
-                                            os.path.join(root, dirname))
-                                    wd_dir = self._add_watch(full_path,
-                                                             self._event_mask)
-                                    event_list.append(InotifyEvent(wd_dir,
-                                                                   InotifyConstants.IN_CREATE |
-                                                                   InotifyConstants.IN_ISDIR
-                                                                   ,
-                                                                   0,
-                                                                   dirname,
-                                                                   full_path))
-                                for filename in filenames:
-                                    full_path = absolute_path(
-                                            os.path.join(root, filename))
-                                    wd_parent_dir = self._wd_for_path[
-                                                    absolute_path(
-                                                            os.path.dirname(
-                                                                    full_path))]
-                                    event_list.append(
-                                            InotifyEvent(wd_parent_dir,
-                                                         InotifyConstants.IN_CREATE
-                                                         ,
-                                                         0,
-                                                         filename,
-                                                         full_path))
+                    if mask & IN_CREATE:
+                        self._deleted_paths.discard(src_path)
+                        if self._is_reported_creation(src_path):
+                            continue
+                        event_list.append((inotify_event, owners))
+                        if mask & DIRECTORY_MASK:
+                            self._add_created_tree(src_path, owners)
+                        continue
+                    elif mask & IN_DELETE:
+                        self._created_paths.discard(src_path)
+                        self._note_deletion(src_path)
+
+                    event_list.append((inotify_event, owners))
+
+                # An IN_MOVED_FROM event read last waits for its IN_MOVED_TO
+                # event only if more events are queued already; otherwise
+                # it moved out of the watched trees.
+                if (moved_from_events and length >= queued_bytes and
+                    not _queued_bytes(self._inotify_fd)):
+                    self._report_pending_moves(event_list)
+
+                if length:
+                    self._queued_bytes = queued_bytes
+                    self._queue_depth = queue_depth
+                    if queue_depth > self._peak_queue_depth:
+                        self._peak_queue_depth = queue_depth
+
+                # Once no scan was under way before this read and the read
+                # drained the kernel queue, no duplicate can still come.
+                if (not was_scanning and not self._active_scans and
+                    length >= queued_bytes):
+                    self._created_paths.clear()
+                if not self._active_scans:
+                    self._deleted_paths.clear()
             return event_list
 
 
+        def _timeout_for_pending_moves(self, timeout):
+            """
+            Shortens a read timeout so that pending IN_MOVED_FROM events are
+            reported on time.
+            """
+            if not self._move_deadlines or (timeout is None and
+                                            self._is_non_blocking):
+                return timeout
+            delay = max(0, self._move_deadlines[0][0] - time.time())
+            if timeout is None or delay < timeout:
+                return delay
+            return timeout
+
         # Non-synchronized methods.
-        def _add_dir_watch(self, path, recursive, mask):
+        def _remember_move(self, event, owners):
+            """
+            Holds an IN_MOVED_FROM event until the next event is read. If the
+            event ends a read, it waits for its IN_MOVED_TO event in the
+            next read until the move expires.
             """
-            Adds a watch (optionally recursively) for the given directory path
-            to monitor events specified by the mask.
+            deadline = time.time() + MOVE_EVENT_TIMEOUT
+            self._moved_from_events[event.cookie] = (event, owners)
+            self._move_deadlines.append((deadline, event.cookie))
 
-            :param path:
-                Path to monitor
-            :param recursive:
-                ``True`` to monitor recursively.
-            :param mask:
-                Event bit mask.
+        def _expire_moves(self, event_list):
             """
-            if not os.path.isdir(path):
-                raise OSError('Path is not a directory')
-            self._add_watch(path, mask)
-            if recursive:
-                for root, dirnames, _ in os.walk(path):
-                    for dirname in dirnames:
-                        full_path = absolute_path(os.path.join(root, dirname))
-                        self._add_watch(full_path, mask)
+            Reports the IN_MOVED_FROM events that have waited too long for
+            their IN_MOVED_TO events, or that no longer fit in the table, as
+            deletions.
+            """
+            now = time.time()
+            while self._move_deadlines:
+                deadline, cookie = self._move_deadlines[0]
+                if (cookie in self._moved_from_events and deadline > now and
+                    len(self._moved_from_events) <= MAX_PENDING_MOVES):
+                    break
+                self._move_deadlines.popleft()
+                entry = self._moved_from_events.pop(cookie, None)
+                if entry is not None:
+                    self._report_move_out(entry[0], entry[1], event_list)
+
+        def _report_pending_moves(self, event_list):
+            """
+            Reports all the pending IN_MOVED_FROM events as deletions.
+            """
+            for _, cookie in self._move_deadlines:
+                entry = self._moved_from_events.pop(cookie, None)
+                if entry is not None:
+                    self._report_move_out(entry[0], entry[1], event_list)
+            self._move_deadlines.clear()
+
+        def _pair_move(self, event, owners, event_list):
+            """
+            Reports an IN_MOVED_TO event as a move for the owners who also
+            watch its source, and as a creation for the others.
+            """
+            entry = self._moved_from_events.pop(event.cookie, None)
+            if entry is None:
+                # Moved in from outside the watched trees.
+                self._report_move_in(event, owners, event_list)
+                return
+            from_event, from_owners = entry
+            if from_owners - owners:
+                self._report_move_out(from_event, from_owners - owners,
+                                      event_list)
+            moved_owners = from_owners & owners
+            if moved_owners:
+                self._move_watches(from_event.src_path, event.src_path)
+                event_list.append((InotifyEvent(event.wd,
+                                                event.mask,
+                                                event.cookie,
+                                                event.name,
+                                                event.src_path,
+                                                from_event.src_path),
+                                   moved_owners))
+            if owners - from_owners:
+                self._report_move_in(event, owners - from_owners, event_list)
+
+        def _report_move_out(self, event, owners, event_list):
+            """
+            Reports an IN_MOVED_FROM event as a deletion, releasing the
+            watches of a directory moved out of the watched trees.
+            """
+            mask = InotifyConstants.IN_DELETE | (event.mask &
+                                                 InotifyConstants.IN_ISDIR)
+            event_list.append((InotifyEvent(event.wd, mask, event.cookie,
+                                            event.name, event.src_path),
+                               owners))
+            if event.is_directory:
+                self._release_tree(event.src_path, owners)
+
+        def _report_move_in(self, event, owners, event_list):
+            """
+            Reports an IN_MOVED_TO event as a creation, watching a directory
+            moved into the watched trees and reporting its contents.
+            """
+            if self._is_reported_creation(event.src_path):
+                return
+            mask = InotifyConstants.IN_CREATE | (event.mask &
+                                                 InotifyConstants.IN_ISDIR)
+            event_list.append((InotifyEvent(event.wd, mask, event.cookie,
+                                            event.name, event.src_path),
+                               owners))
+            if event.is_directory:
+                self._add_created_tree(event.src_path, owners)
+
+        def _move_watches(self, src_path, dest_path):
+            """
+            Updates the paths of the watches and polled subtrees of a moved
+            directory tree.
+            """
+            node = self._node_for_path(src_path)
+            if node is not None:
+                self._detach_node(node)
+                self._attach_node(node, dest_path)
+            src_prefix = os.path.join(src_path, '')
+            for path in list(self._polled_subtrees):
+                if path == src_path or path.startswith(src_prefix):
+                    subtree = self._polled_subtrees.pop(path)
+                    subtree.path = dest_path + path[len(src_path):]
+                    subtree.snapshot = None
+                    self._polled_subtrees[subtree.path] = subtree
+
+        def _release_tree(self, path, owners):
+            """
+            Releases the watches and polled subtrees of a directory tree held
+            on behalf of the given owners.
+            """
+            prefix = os.path.join(path, '')
+            node = self._node_for_path(path)
+            for wd in [subtree_node.wd for subtree_node
+                       in self._iter_subtree_nodes(node)]:
+                wd_owners = self._owners_for_wd[wd]
+                for owner in owners:
+                    wd_owners.discard(owner)
+                    wds = self._wds_for_owner.get(owner)
+                    if wds is not None:
+                        wds.discard(wd)
+                if not wd_owners:
+                    self._remove_watch_bookkeeping(wd)
+                    inotify_rm_watch(self._inotify_fd, wd)
+            for subtree_path in list(self._polled_subtrees):
+                if subtree_path == path or subtree_path.startswith(prefix):
+                    subtree = self._polled_subtrees[subtree_path]
+                    subtree.owners.difference_update(owners)
+                    if not subtree.owners:
+                        del self._polled_subtrees[subtree_path]
+
+        def _add_created_tree(self, path, owners):
+            """
+            Watches a directory created in (or moved into) recursively
+            watched trees, and has its contents, which may have been created
+            before the watch was added (for example, by ``mkdir -p
+            foobar/blah/bar; touch foobar/afile``), scanned in the background.
+            """
+            owners = owners & self._recursive_owners
+            if not owners:
+                return
+            mask = self._mask_for(owners)
+            if self._add_budgeted_watch(path, mask, owners) is None:
+                return
+            self._queue_scan(path, owners)
+
+        def _queue_scan(self, path, owners):
+            """
+            Queues a watched directory to be scanned by the scanner thread,
+            which is started when first needed.
+            """
+            self._active_scans += 1
+            self._scan_queue.put((path, owners))
+            if self._scanner is None:
+                self._scanner = threading.Thread(target=self._scan_directories)
+                self._scanner.setDaemon(True)
+                self._scanner.start()
+
+        def _is_reported_creation(self, path):
+            """
+            Determines whether the creation of a path has already been
+            reported while scans are under way, and remembers it otherwise.
+            """
+            if not self._active_scans and not self._created_paths:
+                return False
+            if path in self._created_paths:
+                return True
+            self._created_paths.add(path)
+            return False
+
+        def _note_deletion(self, path):
+            """
+            Remembers a path deleted or moved out while scans are under way,
+            so that a scan that listed it does not report its creation after
+            its deletion.
+            """
+            if self._active_scans:
+                self._deleted_paths.add(path)
+
+        def _scan_directories(self):
+            """
+            Runs the scanner thread.
+            """
+            while True:
+                job = self._scan_queue.get()
+                if job is None:
+                    return
+                path, owners = job
+                try:
+                    self._scan_directory(path, owners)
+                finally:
+                    with self._lock:
+                        self._active_scans -= 1
+
+        def _scan_directory(self, path, owners):
+            """
+            Watches the subdirectories of a newly watched directory, queues
+            them to be scanned in turn, and hands creation events for the
+            directory's entries to the reader.
+            """
+            try:
+                entries = list(iter_entries(path))
+            except OSError:
+                # Gone already; the kernel reports that.
+                return
+            mask = self._mask_for(owners)
+            with self._lock:
+                node = self._node_for_path(path)
+                if node is None:
+                    # Deleted, moved or closed meanwhile.
+                    return
+                for name, is_directory, _ in entries:
+                    entry_path = os.path.join(path, name)
+                    if entry_path in self._deleted_paths:
+                        # Deleted since it was listed.
+                        continue
+                    if self._is_reported_creation(entry_path):
+                        continue
+                    event_mask = InotifyConstants.IN_CREATE
+                    if is_directory:
+                        event_mask |= InotifyConstants.IN_ISDIR
+                        try:
+                            wd = self._add_budgeted_watch(entry_path, mask,
+                                                          owners)
+                        except OSError:
+                            continue
+                        if wd is not None:
+                            self._queue_scan(entry_path, owners)
+                    self._scanned_events.append((InotifyEvent(node.wd,
+                                                              event_mask,
+                                                              0,
+                                                              name,
+                                                              entry_path),
+                                                 owners))
+                # Under the lock, so that the instance cannot be closed.
+                self._wake()
+
+        def _reserve_watch(self):
+            """
+            Reserves room in the watch budget for a watch about to be added.
 
-        def _add_watch(self, path, mask):
+            :returns:
+                ``True`` if there is room; ``False`` otherwise.
+            """
+            if (self._max_watches is not None and
+                len(self._node_for_wd) + self._reserved_watches >=
+                self._max_watches):
+                return False
+            self._reserved_watches += 1
+            return True
+
+        def _add_budgeted_watch(self, path, mask, owners, is_root=False):
+            """
+            Adds a watch for a directory of a recursive tree within the watch
+            budget. Colder subtrees are demoted to make room; if none can be,
+            the directory's subtree is polled instead.
+
+            :returns:
+                The watch descriptor, or ``None`` if the directory is polled.
+            """
+            while True:
+                if not self._reserve_watch():
+                    if self._demote_coldest_subtree(path):
+                        continue
+                    self._poll_subtree(path, owners, True)
+                    return None
+                try:
+                    wd = self._kernel_add_watch(path, mask)
+                except OSError, e:
+                    self._reserved_watches -= 1
+                    if e.errno != errno.ENOSPC:
+                        raise
+                    if self._demote_coldest_subtree(path):
+                        continue
+                    self._poll_subtree(path, owners, True)
+                    return None
+                self._reserved_watches -= 1
+                self._record_watch(wd, path, owners, mask)
+                if is_root:
+                    self._root_wds.add(wd)
+                return wd
+
+        def _poll_subtree(self, path, owners, recursive, snapshot=None):
+            """
+            Starts polling a subtree on behalf of the given owners, replacing
+            polled subtrees nested in it.
+            """
+            subtree = self._polled_subtrees.get(path)
+            if subtree is not None:
+                subtree.owners.update(owners)
+                subtree.is_recursive = subtree.is_recursive or recursive
+                return
+            subtree = _PolledSubtree(path, recursive, owners, snapshot)
+            if recursive:
+                prefix = os.path.join(path, '')
+                for nested_path in list(self._polled_subtrees):
+                    if nested_path.startswith(prefix):
+                        nested = self._polled_subtrees.pop(nested_path)
+                        subtree.owners.update(nested.owners)
+            self._polled_subtrees[path] = subtree
+
+        def _demote_coldest_subtree(self, path_to_watch):
+            """
+            Releases the kernel watches of the subtree of the least recently
+            changed watched directory and polls the subtree instead. Subtrees
+            holding the root of a watched tree, or the directory about to be
+            watched, are not demoted.
+
+            :param path_to_watch:
+                The directory for which room is made.
+            :returns:
+                ``True`` if a subtree was demoted; ``False`` otherwise.
+            """
+            for wd in self._wd_lru:
+                if wd in self._root_wds:
+                    continue
+                owners = self._owners_for_wd[wd] & self._recursive_owners
+                if not owners:
+                    continue
+                node = self._node_for_wd[wd]
+                path = node.path
+                if (path_to_watch == path or
+                    path_to_watch.startswith(os.path.join(path, ''))):
+                    continue
+                subtree_wds = [subtree_node.wd for subtree_node
+                               in self._iter_subtree_nodes(node)]
+                if not self._root_wds.isdisjoint(subtree_wds):
+                    continue
+                break
+            else:
+                return False
+            for subtree_wd in subtree_wds:
+                owners.update(self._owners_for_wd[subtree_wd] &
+                              self._recursive_owners)
+                self._remove_watch_bookkeeping(subtree_wd)
+                inotify_rm_watch(self._inotify_fd, subtree_wd)
+            # The baseline snapshot is taken by the next poll.
+            self._poll_subtree(path, owners, True)
+            return True
+
+        def _promote_subtree(self, subtree):
+            """
+            Gives a polled subtree kernel watches again if the watch budget
+            has room for all of its directories.
+            """
+            if (self._max_watches is None or
+                self._polled_subtrees.get(subtree.path) is not subtree):
+                return
+            paths = [path for path, stat_info
+                     in subtree.snapshot.stat_snapshot.items()
+                     if stat.S_ISDIR(stat_info.st_mode)]
+            if not subtree.is_recursive:
+                paths = [subtree.path]
+            if (len(self._node_for_wd) + self._reserved_watches + len(paths) >
+                self._max_watches):
+                return
+            del self._polled_subtrees[subtree.path]
+            # Parents first, so that children are not orphaned.
+            paths.sort()
+            # Subtrees polled again because the kernel refused watches.
+            polled_prefixes = []
+            for path in paths:
+                if [prefix for prefix in polled_prefixes
+                    if path.startswith(prefix)]:
+                    continue
+                try:
+                    self._add_watch(path, self._mask_for(subtree.owners),
+                                    subtree.owners)
+                except OSError, e:
+                    if e.errno == errno.ENOSPC:
+                        self._poll_subtree(path, subtree.owners,
+                                           subtree.is_recursive)
+                        polled_prefixes.append(os.path.join(path, ''))
+
+        def _add_watch(self, path, mask, owners=frozenset([None])):
             """
             Adds a watch for the given path to monitor events specified by the
             mask.
@@ -638,29 +1681,181 @@ if platform.is_linux():
                 Path to monitor
             :param mask:
                 Event bit mask.
+            :param owners:
+                Owners of the watch. The kernel hands out the same watch
+                descriptor for a path that is already watched, in which case
+                the owners are merged.
+            """
+            wd = self._kernel_add_watch(path, mask)
+            self._record_watch(wd, path, owners, mask)
+            return wd
+
+        def _kernel_add_watch(self, path, mask):
             """
+            Adds a kernel watch for the given path without any book-keeping.
+            Safe to call without holding the lock.
+            """
+            # Watches may be shared with owners interested in other events.
             wd = inotify_add_watch(self._inotify_fd,
                                    path,
-                                   mask)
+                                   mask | InotifyConstants.IN_MASK_ADD)
             if wd == -1:
                 Inotify._raise_error()
-            self._wd_for_path[path] = wd
-            self._path_for_wd[wd] = path
             return wd
 
+        def _record_watch(self, wd, path, owners, mask):
+            """
+            Records a watch descriptor returned by :meth:`_kernel_add_watch`.
+            """
+            node = self._node_for_wd.get(wd)
+            if node is None:
+                node = _WatchNode(wd)
+                self._node_for_wd[wd] = node
+                self._attach_node(node, path)
+            elif node.path != path:
+                # The directory was moved before we noticed.
+                self._detach_node(node)
+                self._attach_node(node, path)
+            node.mask |= mask
+            self._owners_for_wd.setdefault(wd, set()).update(owners)
+            for owner in owners:
+                self._wds_for_owner.setdefault(owner, set()).add(wd)
+            self._wd_lru.add(wd)
+
+        def _node_for_path(self, path):
+            """
+            Returns the node of the watched directory at the given path, or
+            ``None`` if the directory is not watched.
+            """
+            names = []
+            while path not in self._root_nodes:
+                parent_path, name = os.path.split(path)
+                if parent_path == path or not name:
+                    return None
+                names.append(name)
+                path = parent_path
+            node = self._root_nodes[path]
+            while names:
+                if not node.children:
+                    return None
+                node = node.children.get(names.pop())
+                if node is None:
+                    return None
+            return node
+
+        def _attach_node(self, node, path):
+            """
+            Places a detached node at the given path, under the node of its
+            parent directory if that is watched, and adopts the root nodes of
+            its watched subdirectories.
+            """
+            parent_path, name = os.path.split(path)
+            parent = None
+            if name and parent_path != path:
+                parent = self._node_for_path(parent_path)
+            if parent is None:
+                node.name = path
+                self._root_nodes[path] = node
+            else:
+                node.name = name
+                node.parent = parent
+                if parent.children is None:
+                    parent.children = dict()
+                parent.children[name] = node
+            prefix = os.path.join(path, '')
+            for root_path, root in list(self._root_nodes.items()):
+                if (root_path.startswith(prefix) and
+                    os.sep not in root_path[len(prefix):]):
+                    del self._root_nodes[root_path]
+                    root.name = root_path[len(prefix):]
+                    root.parent = node
+                    if node.children is None:
+                        node.children = dict()
+                    node.children[root.name] = root
+
+        def _detach_node(self, node):
+            """
+            Detaches a node, together with its subtree, from its parent.
+            """
+            parent = node.parent
+            if parent is None:
+                if self._root_nodes.get(node.name) is node:
+                    del self._root_nodes[node.name]
+            else:
+                if parent.children.get(node.name) is node:
+                    del parent.children[node.name]
+                node.parent = None
+
+        def _iter_subtree_nodes(self, node):
+            """
+            Yields a node and the nodes of its subtree. Yields nothing if the
+            node is ``None``.
+            """
+            stack = node is not None and [node] or []
+            while stack:
+                node = stack.pop()
+                yield node
+                if node.children:
+                    stack.extend(node.children.values())
+
+        def _mask_for(self, owners):
+            """
+            Returns the union of the event masks of the given owners.
+            """
+            mask = 0
+            for owner in owners:
+                mask |= self._mask_for_owner.get(owner, self._event_mask)
+            return mask
+
+        def _update_masks(self, wds):
+            """
+            Brings the kernel masks of the given watches in line with the
+            masks of their owners.
+            """
+            for wd in list(wds):
+                node = self._node_for_wd.get(wd)
+                if node is None:
+                    continue
+                mask = self._mask_for(self._owners_for_wd[wd])
+                if mask == node.mask:
+                    continue
+                if mask & node.mask == node.mask:
+                    flags = InotifyConstants.IN_MASK_ADD
+                else:
+                    flags = 0
+                # Failures mean that the directory is gone, which IN_IGNORED
+                # will tell us about.
+                inotify_add_watch(self._inotify_fd, node.path, mask | flags)
+                node.mask = mask
+
         def _remove_all_watches(self):
             """
             Removes all watches.
             """
-            for wd in self._wd_for_path.values():
-                del self._path_for_wd[wd]
-                if inotify_rm_watch(self._inotify_fd, wd) == -1:
-                    Inotify._raise_error()
-
-        def _remove_watch_bookkeeping(self, path):
-            wd = self._wd_for_path.pop(path)
-            del self._path_for_wd[wd]
-            return wd
+            for wd in list(self._node_for_wd):
+                self._remove_watch_bookkeeping(wd)
+                # The watch may already be gone if the directory was deleted
+                # and IN_IGNORED is still pending, so failures are not
+                # errors here.
+                inotify_rm_watch(self._inotify_fd, wd)
+
+        def _remove_watch_bookkeeping(self, wd):
+            node = self._node_for_wd.pop(wd)
+            path = node.path
+            self._detach_node(node)
+            # Children that are still watched become roots.
+            for child in list((node.children or {}).values()):
+                child_path = child.path
+                self._detach_node(child)
+                child.name = child_path
+                self._root_nodes[child_path] = child
+            self._wd_lru.discard(wd)
+            self._root_wds.discard(wd)
+            for owner in self._owners_for_wd.pop(wd, ()):
+                wds = self._wds_for_owner.get(owner)
+                if wds is not None:
+                    wds.discard(wd)
+            return path
 
         def _remove_watch(self, path):
             """
@@ -669,7 +1864,11 @@ if platform.is_linux():
             :param path:
                 Path to remove the watch for.
             """
-            wd = self._remove_watch_bookkeeping(path)
+            node = self._node_for_path(path)
+            if node is None:
+                raise KeyError(path)
+            wd = node.wd
+            self._remove_watch_bookkeeping(wd)
             if inotify_rm_watch(self._inotify_fd, wd) == -1:
                 Inotify._raise_error()
 
@@ -679,10 +1878,10 @@ if platform.is_linux():
             Raises errors for inotify failures.
             """
             _errnum = ctypes.get_errno()
-            raise OSError(os.strerror(_errnum))
+            raise OSError(_errnum, os.strerror(_errnum))
 
         @staticmethod
-        def _parse_event_buffer(event_buffer):
+        def _parse_event_buffer(event_buffer, length=None):
             """
             Parses an event buffer of ``inotify_event`` structs returned by
             inotify::
@@ -698,16 +1897,303 @@ if platform.is_linux():
             The ``cookie`` member of this struct is used to pair two related
             events, for example, it pairs an IN_MOVED_FROM event with an
             IN_MOVED_TO event.
+
+            Only the first ``length`` bytes of the buffer are parsed. Names
+            are the only data copied out of the buffer.
             """
+            if length is None:
+                length = len(event_buffer)
+            if memoryview is not None:
+                view = memoryview(event_buffer)
+            unpack_from = EVENT_HEADER.unpack_from
+            header_size = EVENT_HEADER.size
             i = 0
-            while i + 16 < len(event_buffer):
-                wd, mask, cookie, length =\
-                struct.unpack_from('iIII', event_buffer, i)
-                name = event_buffer[i + 16:i + 16 + length].rstrip('\0')
-                i += 16 + length
+            while i + header_size <= length:
+                wd, mask, cookie, name_length = unpack_from(event_buffer, i)
+                i += header_size
+                if name_length:
+                    # The name is padded with null bytes.
+                    end = event_buffer.find('\0', i, i + name_length)
+                    if end == -1:
+                        end = i + name_length
+                    if memoryview is not None:
+                        name = view[i:end].tobytes()
+                    else:
+                        name = str(event_buffer[i:end])
+                    i += name_length
+                else:
+                    name = ''
                 yield wd, mask, cookie, name
 
 
+    class InotifyTreeRegistration(object):
+        """
+        Registers inotify watches for a directory tree on the pool of worker
+        threads of an :class:`Inotify` instance.
+
+        Every worker takes a directory off a shared queue, lists it with
+        :func:`watchdog.utils.dirscan.subdirectories` (which uses ``d_type``
+        rather than ``stat`` to find directories), adds watches for the
+        subdirectories and queues them in turn. Top-level subtrees are hence
+        registered in parallel, and a large subtree is shared among idle
+        workers as well. Directories that vanish while the tree is being
+        registered are skipped.
+
+        Use :meth:`Inotify.register_tree` to create and start a registration.
+
+        :param inotify:
+            The :class:`Inotify` instance to add watches to.
+        :param path:
+            Absolute path of the directory tree.
+        :param recursive:
+            ``True`` to register the whole tree; ``False`` to register only
+            the directory itself.
+        :param owner:
+            Owner of the added watches.
+        """
+
+        def __init__(self, inotify, path, recursive, owner):
+            self._inotify = inotify
+            self._path = path
+            self._is_recursive = recursive
+            self._owner = owner
+            self._owners = frozenset([owner])
+            self._lock = threading.Lock()
+            self._pending = 0
+            self._directories_registered = 0
+            self._error = None
+            self._is_cancelled = False
+            self._done_event = threading.Event()
+
+        @property
+        def path(self):
+            """The root of the directory tree."""
+            return self._path
+
+        @property
+        def owner(self):
+            """The owner of the added watches."""
+            return self._owner
+
+        @property
+        def directories_registered(self):
+            """Number of directories watched so far."""
+            return self._directories_registered
+
+        @property
+        def is_done(self):
+            """Whether the whole tree has been registered (or has failed)."""
+            return self._done_event.isSet()
+
+        @property
+        def error(self):
+            """
+            The first :class:`OSError` that stopped the registration, or
+            ``None``.
+            """
+            return self._error
+
+        def cancel(self):
+            """
+            Stops registering further directories and drops the directories
+            queued for the workers. Watches the workers add afterwards for
+            the directories they are listing are released straight away; use
+            :meth:`wait` to wait for them to finish.
+            """
+            self._is_cancelled = True
+            inotify = self._inotify
+            with inotify._lock:
+                jobs = inotify._registration_jobs
+                kept = [job for job in jobs if job[0] is not self]
+                dropped = len(jobs) - len(kept)
+                if dropped:
+                    jobs.clear()
+                    jobs.extend(kept)
+            for _ in range(dropped):
+                self._task_done()
+
+        def wait(self, timeout=None):
+            """
+            Blocks until the tree has been registered or the timeout (in
+            seconds) expires.
+
+            :returns:
+                ``True`` if the registration is done; ``False`` otherwise.
+            """
+            self._done_event.wait(timeout)
+            return self.is_done
+
+        def start(self):
+            """
+            Registers the root directory and queues it for the workers to
+            register its subdirectories.
+
+            :raises:
+                :class:`OSError` if the root directory cannot be watched.
+            """
+            if not os.path.isdir(self._path):
+                raise OSError('Path is not a directory')
+            inotify = self._inotify
+            with inotify._lock:
+                if self._is_recursive:
+                    inotify._recursive_owners.add(self._owner)
+                wd = inotify._add_budgeted_watch(self._path,
+                                                 inotify._mask_for(self._owners),
+                                                 self._owners,
+                                                 is_root=True)
+                if wd is None and not self._is_recursive:
+                    inotify._polled_subtrees[self._path].is_recursive = False
+            self._directories_registered = 1
+            if wd is None or not self._is_recursive:
+                self._done_event.set()
+                return
+            self._put(self._path)
+
+        def _put(self, path):
+            with self._lock:
+                self._pending += 1
+            self._inotify._queue_registration_job(self, path)
+
+        def _task_done(self):
+            with self._lock:
+                self._pending -= 1
+                if self._pending:
+                    return
+            # Nothing is queued or being listed any more.
+            self._done_event.set()
+
+        def _work(self, path):
+            try:
+                if self._error is None and not self._is_cancelled:
+                    self._register_subdirectories(self._inotify, path)
+            finally:
+                self._task_done()
+
+        def _register_subdirectories(self, inotify, path):
+            try:
+                paths = subdirectories(path)
+            except OSError:
+                # Vanished, or became unreadable, while we were walking.
+                return
+            for subdirectory_path in paths:
+                if self._is_cancelled:
+                    return
+                with inotify._lock:
+                    has_room = inotify._reserve_watch()
+                if not has_room:
+                    self._poll_subtree(inotify, subdirectory_path)
+                    continue
+                # Read for every directory, since the owner's mask may
+                # change while the tree is being registered.
+                mask = inotify._mask_for(self._owners)
+                try:
+                    wd = inotify._kernel_add_watch(subdirectory_path, mask)
+                except OSError, e:
+                    with inotify._lock:
+                        inotify._reserved_watches -= 1
+                    if e.errno == errno.ENOSPC:
+                        self._poll_subtree(inotify, subdirectory_path)
+                        continue
+                    if e.errno in (errno.ENOENT, errno.ENOTDIR):
+                        continue
+                    self._error = e
+                    return
+                with inotify._lock:
+                    inotify._reserved_watches -= 1
+                    if self._is_cancelled:
+                        # The owner may have been removed already.
+                        self._discard_watch(inotify, wd, mask)
+                        return
+                    inotify._record_watch(wd, subdirectory_path, self._owners,
+                                          mask)
+                with self._lock:
+                    self._directories_registered += 1
+                self._put(subdirectory_path)
+
+        def _discard_watch(self, inotify, wd, mask):
+            """
+            Releases a watch added after the registration was cancelled, or
+            takes the owner's events out of its mask if it is shared.
+            """
+            node = inotify._node_for_wd.get(wd)
+            if node is None:
+                # Failures mean that the directory is gone.
+                inotify_rm_watch(inotify._inotify_fd, wd)
+                return
+            # Added with IN_MASK_ADD, so the kernel mask may have grown.
+            node.mask |= mask
+            inotify._update_masks([wd])
+
+        def _poll_subtree(self, inotify, path):
+            # The watch budget is exhausted: poll the rest of this subtree.
+            try:
+                snapshot = DirectorySnapshot(path, True)
+            except OSError:
+                return
+            with inotify._lock:
+                if not self._is_cancelled:
+                    inotify._poll_subtree(path, self._owners, True, snapshot)
+
+
+    def _io_budget_callback(io_budget):
+        """
+        Returns a :class:`watchdog.utils.dirsnapshot.DirectorySnapshot`
+        walker callback that sleeps as needed to examine at most
+        ``io_budget`` entries per second.
+        """
+        if not io_budget:
+            return lambda path, stat_info: None
+        state = dict(count=0, started=time.time())
+
+        def callback(path, stat_info):
+            state['count'] += 1
+            delay = state['count'] / float(io_budget) - (time.time() -
+                                                          state['started'])
+            if delay > 0:
+                time.sleep(delay)
+        return callback
+
+
+    class _WatchNode(object):
+        """
+        A watched directory in the tree of watched directories of an
+        :class:`Inotify` instance.
+        """
+
+        __slots__ = ('wd', 'mask', 'name', 'parent', 'children')
+
+        def __init__(self, wd):
+            self.wd = wd
+            self.mask = 0
+            self.name = None
+            self.parent = None
+            self.children = None
+
+        @property
+        def path(self):
+            names = []
+            node = self
+            while node is not None:
+                names.append(node.name)
+                node = node.parent
+            names.reverse()
+            return os.path.join(*names)
+
+
+    class _PolledSubtree(object):
+        """
+        A directory tree observed by polling because it did not fit in the
+        watch budget of an :class:`Inotify` instance.
+        """
+
+        def __init__(self, path, recursive, owners, snapshot=None):
+            self.path = path
+            self.is_recursive = recursive
+            self.owners = set(owners)
+            self.snapshot = snapshot
+            self.last_poll = time.time()
+
+
     ACTION_EVENT_MAP = {
         (True, EVENT_TYPE_MODIFIED): DirModifiedEvent,
         (True, EVENT_TYPE_CREATED): DirCreatedEvent,
@@ -719,6 +2205,68 @@ if platform.is_linux():
         (False, EVENT_TYPE_MOVED): FileMovedEvent,
     }
 
+    # Translation of an inotify event that is reported after resyncing.
+    RESYNC = 'resync'
+
+    # Inotify events reported as modifications.
+    MODIFICATION_MASK = (InotifyConstants.IN_MODIFY |
+                         InotifyConstants.IN_ATTRIB |
+                         InotifyConstants.IN_CLOSE_WRITE)
+
+    def _translation_for_mask(mask):
+        """
+        Returns how an inotify event is reported, as an ``(event_type,
+        event_class)`` tuple. ``event_type`` is an ``EVENT_TYPE_*`` constant,
+        :const:`RESYNC` for IN_Q_OVERFLOW, or ``None`` if the event is not
+        reported.
+
+        :param mask:
+            Event mask of the inotify event.
+        """
+        if mask & InotifyConstants.IN_Q_OVERFLOW:
+            return RESYNC, None
+        if mask & MODIFICATION_MASK:
+            event_type = EVENT_TYPE_MODIFIED
+        elif mask & InotifyConstants.IN_MOVED_TO:
+            event_type = EVENT_TYPE_MOVED
+        elif mask & (InotifyConstants.IN_DELETE |
+                     InotifyConstants.IN_DELETE_SELF):
+            event_type = EVENT_TYPE_DELETED
+        elif mask & InotifyConstants.IN_CREATE:
+            event_type = EVENT_TYPE_CREATED
+        else:
+            return None, None
+        return event_type, ACTION_EVENT_MAP[(mask & DIRECTORY_MASK > 0,
+                                             event_type)]
+
+    def _build_translation_table():
+        table = dict()
+        for bit in [InotifyConstants.IN_Q_OVERFLOW,
+                    InotifyConstants.IN_IGNORED,
+                    InotifyConstants.IN_UNMOUNT] + [
+                1 << i for i in range(32)
+                if (1 << i) & InotifyConstants.IN_ALL_EVENTS]:
+            for mask in (bit, bit | InotifyConstants.IN_ISDIR):
+                table[mask] = _translation_for_mask(mask)
+        return table
+
+    # Translations by event mask. The kernel sets a single event bit, with
+    # IN_ISDIR for directories, so these are all the masks read in
+    # practice; other masks are translated and added as they are seen.
+    EVENT_TRANSLATION_FOR_MASK = _build_translation_table()
+
+    def translate_mask(mask):
+        """
+        Looks up how an inotify event is reported; see
+        :func:`_translation_for_mask`.
+        """
+        try:
+            return EVENT_TRANSLATION_FOR_MASK[mask]
+        except KeyError:
+            translation = _translation_for_mask(mask)
+            EVENT_TRANSLATION_FOR_MASK[mask] = translation
+            return translation
+
     class InotifyEmitter(EventEmitter):
         """
         inotify(7)-based event emitter.
@@ -733,73 +2281,621 @@ if platform.is_linux():
             Read events blocking timeout (in seconds).
         :type timeout:
             ``float``
+        :param inotify:
+            A shared :class:`Inotify` instance read by an
+            :class:`InotifyReader`. The emitter then does not run a thread of
+            its own. If ``None``, the emitter creates a private inotify
+            instance and reads it from its own thread.
+        :type inotify:
+            :class:`Inotify`
+        :param event_types:
+            The types of events to report (``EVENT_TYPE_*`` constants from
+            :mod:`watchdog.events`), or ``None`` for all of them. The kernel
+            is asked only for the inotify events needed to report these; see
+            :meth:`set_event_types`.
+        :param coalesce_window:
+            Time (in seconds) for which a modification of a file is held
+            back so that later modifications can be folded into it, or
+            ``None`` to fold modifications only within a single read from
+            the kernel.
+        :param auditor:
+            The :class:`InotifyAuditor` that resyncs the emitter in the
+            background. If ``None``, the emitter starts an auditor of its own
+            when it first needs one.
+        :type auditor:
+            :class:`InotifyAuditor`
+
+        Successive IN_MODIFY, IN_ATTRIB and IN_CLOSE_WRITE events for a file
+        are reported as a single modification, as long as no other event is
+        reported for the file in between.
+
+        Subdirectories of a recursive watch are registered in the background
+        after the emitter has been constructed; events are reported for every
+        directory as soon as it is registered. Use :meth:`wait_until_ready`
+        to wait for the whole tree.
+
+        When the kernel event queue overflows and events are lost, the
+        auditor :meth:`resync`-s the emitter while events are still being
+        read. The first resync takes a reference snapshot of the tree and
+        reports the directories that were created in the gap, with their
+        contents; the reference is then kept up to date from the events
+        reported, so that later resyncs report only the changes that were
+        missed. No snapshot is kept by emitters that never resync.
         """
 
-        def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
+        def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                     inotify=None, event_types=None, coalesce_window=None,
+                     auditor=None):
             EventEmitter.__init__(self, event_queue, watch, timeout)
             self._lock = threading.Lock()
-            self._inotify = Inotify(watch.path, watch.is_recursive)
+            self._coalesce_window = coalesce_window
+            # Modifications held back by path, with their deadlines.
+            self._pending_modifications = dict()
+            self._owns_inotify = inotify is None
+            if self._owns_inotify:
+                inotify = Inotify()
+            self._inotify = inotify
+            self._owns_auditor = auditor is None
+            self._auditor = auditor
+            # Reference snapshot of the tree for resyncs, the directories
+            # whose entries were reported on since it was last brought up to
+            # date (``None`` until it is being taken), and whether events
+            # were lost. The reference is only used by the auditor thread.
+            self._reference = None
+            self._touched_directories = None
+            self._is_resync_pending = False
+            self._resync_lock = threading.Lock()
+            try:
+                mask = event_mask_for_event_types(event_types,
+                                                  watch.is_recursive)
+                self._registration = inotify.register_tree(watch.path,
+                                                           watch.is_recursive,
+                                                           self,
+                                                           event_mask=mask)
+            except OSError:
+                if self._owns_inotify:
+                    inotify.close()
+                raise
+
+        @property
+        def coalesce_window(self):
+            """
+            Time for which modifications are held back, or ``None``.
+            """
+            return self._coalesce_window
+
+        @property
+        def registration(self):
+            """
+            The :class:`InotifyTreeRegistration` registering the watched tree.
+            """
+            return self._registration
+
+        def wait_until_ready(self, timeout=None):
+            if not self._registration.wait(timeout):
+                return False
+            if self._registration.error is not None:
+                raise self._registration.error
+            return True
+
+        def set_event_types(self, event_types):
+            self._inotify.set_owner_mask(self, event_mask_for_event_types(
+                    event_types, self.watch.is_recursive))
+
+        def resync(self, io_budget=None):
+            """
+            Queues events for the changes to the watched tree that were not
+            reported, and watches the directories created in the meantime.
+
+            The first resync takes the reference snapshot of the tree. As
+            there is nothing to compare it with, only the directories that
+            are neither watched nor polled, which were created while events
+            were lost, are reported, with their contents. Later resyncs
+            bring the reference up to date and report the differences.
+
+            :param io_budget:
+                Maximum number of files and directories examined per second,
+                or ``None`` to snapshot as fast as possible.
+            """
+            walker_callback = _io_budget_callback(io_budget)
+            with self._resync_lock:
+                if self.should_stop():
+                    return
+                if self._reference is None:
+                    events, created = self._take_reference(walker_callback)
+                else:
+                    self._update_reference(walker_callback)
+                    try:
+                        # Replaced directories need watches of their own.
+                        diff = self._reference.refresh(
+                            walker_callback=walker_callback,
+                            report_replaced=True)
+                    except OSError:
+                        # The watched directory is gone; its deletion is
+                        # reported by the kernel.
+                        return
+                    events = events_from_snapshot_diff(diff)
+                    created = diff.dirs_created + [dest_path for _, dest_path
+                                                   in diff.dirs_moved]
+            with self._lock:
+                for event in events:
+                    self.queue_event(event)
+            if not self.watch.is_recursive:
+                return
+            created = set(created)
+            for path in created:
+                if os.path.dirname(path) in created:
+                    continue
+                try:
+                    self._inotify.register_tree(path, True, self)
+                except OSError:
+                    continue
+
+        def catch_up(self, io_budget=None):
+            """
+            Resyncs if events were lost, or otherwise brings the reference
+            snapshot up to date with the events reported since. Called by
+            the auditor when the emitter asks it to.
+
+            :param io_budget:
+                Maximum number of files and directories examined per second,
+                or ``None`` to examine them as fast as possible.
+            """
+            with self._lock:
+                is_resync_pending = self._is_resync_pending
+                self._is_resync_pending = False
+            if is_resync_pending:
+                self.resync(io_budget)
+                return
+            with self._resync_lock:
+                if self._reference is not None:
+                    self._update_reference(_io_budget_callback(io_budget))
+
+        def _take_reference(self, walker_callback):
+            """
+            Takes the reference snapshot and returns the events for, and the
+            paths of, the directories that are not observed yet.
+            """
+            with self._lock:
+                # Reports made while the snapshot is taken are applied to it
+                # afterwards.
+                self._touched_directories = set()
+            try:
+                reference = DirectorySnapshot(self.watch.path,
+                                              self.watch.is_recursive,
+                                              walker_callback=walker_callback)
+            except OSError:
+                with self._lock:
+                    self._touched_directories = None
+                return [], []
+            self._reference = reference
+            if not self.watch.is_recursive:
+                return [], []
+            # Unobserved directories, and the directories below them.
+            created = set()
+            covered = set()
+            for path in sorted(reference.directories):
+                if path == self.watch.path:
+                    continue
+                if os.path.dirname(path) in covered:
+                    covered.add(path)
+                elif not self._inotify.is_observed(path):
+                    created.add(path)
+                    covered.add(path)
+            events = []
+            if not created:
+                return events, []
+            for path, stat_info in reference.stat_snapshot.items():
+                parent_path = path
+                while parent_path not in created:
+                    path_above = os.path.dirname(parent_path)
+                    if path_above == parent_path:
+                        break
+                    parent_path = path_above
+                else:
+                    if stat.S_ISDIR(stat_info.st_mode):
+                        events.append(DirCreatedEvent(path))
+                    else:
+                        events.append(FileCreatedEvent(path))
+            # Parents first.
+            events.sort(key=lambda event: event.src_path)
+            return events, list(created)
+
+        def _update_reference(self, walker_callback):
+            """
+            Brings the entries of the directories reported on up to date in
+            the reference snapshot, so that the changes already reported are
+            not reported again by the next resync.
+            """
+            with self._lock:
+                directories = self._touched_directories
+                if not directories:
+                    return
+                self._touched_directories = set()
+            try:
+                self._reference.refresh(walker_callback=walker_callback,
+                                        directories=directories)
+            except OSError:
+                pass
+
+        def _touch(self, event):
+            """
+            Records the directories whose entries an event reported on.
+            Called with the lock held.
+            """
+            for path in (event.src_path, getattr(event, 'dest_path', None)):
+                if path is None:
+                    continue
+                self._touched_directories.add(os.path.dirname(path))
+                if event.is_directory:
+                    self._touched_directories.add(path)
+
+        def _queue_catch_up(self):
+            """
+            Asks the auditor to :meth:`catch_up`, starting an auditor of the
+            emitter's own if there is none. Called with the lock held.
+            """
+            if self._auditor is None:
+                if self.should_stop():
+                    return
+                self._auditor = InotifyAuditor(None, None)
+            self._auditor.queue_emitter(self)
+
+        def on_thread_told_to_stop(self):
+            # Called with the observer lock held: a shared instance may be
+            # registering other trees, so the registration is not waited
+            # for; the watches its workers add from now on are released.
+            self._registration.cancel()
+            if self._owns_inotify:
+                self._registration.wait()
+                self._inotify.wake()
+            else:
+                self._inotify.remove_owner(self)
 
         def on_thread_exit(self):
-            self._inotify.close()
+            if self._owns_inotify:
+                self._inotify.close()
+            with self._lock:
+                auditor = self._owns_auditor and self._auditor
+            if auditor:
+                auditor.stop()
+                if auditor.is_alive():
+                    auditor.join()
 
         def queue_events(self, timeout):
+            delay = self.flush_modifications()
+            if delay is not None and delay < timeout:
+                timeout = delay
+            self.queue_inotify_events(self._inotify.read_events(
+                timeout=timeout))
+            self.flush_modifications()
+            for _, events in self._inotify.poll_subtrees():
+                self.queue_polled_events(events)
+
+        def queue_polled_events(self, events):
+            """
+            Queues the events found by polling subtrees that did not fit in
+            the watch budget.
+
+            :param events:
+                List of :class:`watchdog.events.FileSystemEvent` objects.
+            """
             with self._lock:
-                inotify_events = self._inotify.read_events()
-                if not any([event.is_moved_from or event.is_moved_to for event in inotify_events]):
-                    self._inotify.clear_move_records()
+                for event in events:
+                    self.queue_event(event)
+                    if self._touched_directories is not None:
+                        self._touch(event)
+                if self._touched_directories:
+                    self._queue_catch_up()
+
+        def flush_modifications(self):
+            """
+            Queues the modifications held back for longer than the coalesce
+            window.
+
+            :returns:
+                The time (in seconds) until the next held back modification
+                is due, or ``None`` if none is held back.
+            """
+            with self._lock:
+                if not self._pending_modifications:
+                    return None
+                now = time.time()
+                due = [(deadline, path) for path, (deadline, _)
+                       in self._pending_modifications.items()
+                       if deadline <= now]
+                due.sort()
+                for _, path in due:
+                    self._flush_modification(path)
+                if not self._pending_modifications:
+                    return None
+                return min([deadline for deadline, _
+                            in self._pending_modifications.values()]) - now
+
+        def _flush_modification(self, path):
+            pending = self._pending_modifications.pop(path, None)
+            if pending is not None:
+                self.queue_event(pending[1])
+
+        def queue_inotify_events(self, inotify_events):
+            """
+            Translates inotify events read for this emitter's watch into
+            file system events and queues them.
+
+            :param inotify_events:
+                List of :class:`InotifyEvent` objects.
+            """
+            translations = EVENT_TRANSLATION_FOR_MASK
+            queue_event = self.queue_event
+            pending_modifications = self._pending_modifications
+            with self._lock:
+                touched_directories = self._touched_directories
+                # Paths modified in this batch with no other event since.
+                modified_paths = set()
                 for event in inotify_events:
-                    if event.is_moved_to:
-                    # TODO: Sometimes this line will bomb even when a previous
-                    # moved_from event with the same cookie has fired. I have
-                    # yet to figure out why this is the case, so we're
-                    # temporarily swallowing the exception and the move event.
-                    # This happens only during massively quick file movement
-                    # for example, when you execute `git gc` in a monitored
-                    # directory.
-                        try:
-                            src_path = self._inotify.source_for_move(event)
-                            to_event = event
-                            dest_path = to_event.src_path
-
-                            klass = ACTION_EVENT_MAP[
-                                    (to_event.is_directory, EVENT_TYPE_MOVED)]
-                            event = klass(src_path, dest_path)
-                            self.queue_event(event)
-                            # Generate sub events for the directory if recursive.
-                            if event.is_directory and self.watch.is_recursive:
-                                for sub_event in event.sub_moved_events():
-                                    self.queue_event(sub_event)
-                        except KeyError:
-                            pass
-                    elif event.is_attrib:
-                        klass = ACTION_EVENT_MAP[(event.is_directory,
-                                                  EVENT_TYPE_MODIFIED)]
-                        self.queue_event(klass(event.src_path))
-                    elif event.is_close_write:
-                        klass = ACTION_EVENT_MAP[(event.is_directory,
-                                                  EVENT_TYPE_MODIFIED)]
-                        self.queue_event(klass(event.src_path))
-                    elif event.is_modify:
-                        klass = ACTION_EVENT_MAP[(event.is_directory,
-                                                  EVENT_TYPE_MODIFIED)]
-                        self.queue_event(klass(event.src_path))
-                    elif event.is_delete or event.is_delete_self:
-                        klass = ACTION_EVENT_MAP[(event.is_directory,
-                                                  EVENT_TYPE_DELETED)]
-                        self.queue_event(klass(event.src_path))
-                    elif event.is_create:
-                        klass = ACTION_EVENT_MAP[(event.is_directory,
-                                                  EVENT_TYPE_CREATED)]
-                        self.queue_event(klass(event.src_path))
+                    try:
+                        event_type, klass = translations[event.mask]
+                    except KeyError:
+                        event_type, klass = translate_mask(event.mask)
+
+                    if event_type == EVENT_TYPE_MODIFIED:
+                        src_path = event.src_path
+                        if (src_path in modified_paths or
+                            src_path in pending_modifications):
+                            continue
+                        modified_paths.add(src_path)
+                        event = klass(src_path)
+                        if self._coalesce_window:
+                            pending_modifications[src_path] = (
+                                time.time() + self._coalesce_window, event)
+                        else:
+                            queue_event(event)
+                        if touched_directories is not None:
+                            self._touch(event)
+                        continue
+                    elif event_type == RESYNC:
+                        # Events were lost: the auditor reports what changed
+                        # in the gap while the batch goes on.
+                        self._is_resync_pending = True
+                        continue
+
+                    # Other events end the modifications of their paths.
+                    if modified_paths or pending_modifications:
+                        for path in (event.src_path, event.move_src_path):
+                            modified_paths.discard(path)
+                            self._flush_modification(path)
+
+                    if event_type == EVENT_TYPE_MOVED:
+                        # Unpaired moves are reported by Inotify as deletions
+                        # and creations, so the source is always known here.
+                        event = klass(event.move_src_path, event.src_path)
+                        queue_event(event)
+                        # Generate sub events for the directory if recursive.
+                        if event.is_directory and self.watch.is_recursive:
+                            for sub_event in event.sub_moved_events():
+                                queue_event(sub_event)
+                    elif event_type is not None:
+                        event = klass(event.src_path)
+                        queue_event(event)
+                    else:
+                        continue
+                    if touched_directories is not None:
+                        self._touch(event)
+
+                if self._is_resync_pending or touched_directories:
+                    self._queue_catch_up()
+
+
+    class InotifyReader(DaemonThread):
+        """
+        Daemon thread that reads a shared :class:`Inotify` instance and hands
+        the events to the emitters owning the watches they were reported
+        for.
+
+        :param inotify:
+            The shared inotify instance. It is closed when the thread exits.
+        :type inotify:
+            :class:`Inotify`
+        :param timeout:
+            Read events blocking timeout (in seconds).
+        :type timeout:
+            ``float``
+        """
+
+        def __init__(self, inotify, timeout=DEFAULT_EMITTER_TIMEOUT):
+            DaemonThread.__init__(self)
+            self._inotify = inotify
+            self._timeout = timeout
+
+        @property
+        def inotify(self):
+            """The inotify instance read by this thread."""
+            return self._inotify
+
+        @property
+        def timeout(self):
+            """Read events blocking timeout."""
+            return self._timeout
+
+        def on_thread_told_to_stop(self):
+            self._inotify.wake()
+
+        def run(self):
+            # Emitters holding back modifications.
+            coalescing_emitters = set()
+            try:
+                while self.should_keep_running():
+                    timeout = self.timeout
+                    for emitter in list(coalescing_emitters):
+                        delay = emitter.flush_modifications()
+                        if delay is None:
+                            coalescing_emitters.discard(emitter)
+                        elif delay < timeout:
+                            timeout = delay
+                    for emitter, events in self._inotify.read_events_by_owner(
+                            timeout=timeout):
+                        if emitter is not None:
+                            emitter.queue_inotify_events(events)
+                            if emitter.coalesce_window:
+                                coalescing_emitters.add(emitter)
+                    for emitter, events in self._inotify.poll_subtrees():
+                        emitter.queue_polled_events(events)
+            finally:
+                self._inotify.close()
+
+
+    class InotifyAuditor(DaemonThread):
+        """
+        Daemon thread that :meth:`InotifyEmitter.resync`-s emitters in the
+        background: the emitters that lost events, as soon as they ask to,
+        and, periodically, all emitters of an observer, catching changes
+        that inotify failed to report. It also brings the reference
+        snapshots of the emitters up to date with the events they report.
+        The thread runs at a lower scheduling priority and examines at most
+        ``io_budget`` files and directories per second. It is started when
+        an emitter is first queued, unless it is started before.
+
+        :param observer:
+            The :class:`InotifyObserver` whose emitters are audited, or
+            ``None``.
+        :param interval:
+            Interval (in seconds) between audits, or ``None`` to resync only
+            the emitters that ask to.
+        :param io_budget:
+            Maximum number of files and directories examined per second.
+        """
+
+        def __init__(self, observer, interval, io_budget=DEFAULT_AUDIT_BUDGET):
+            DaemonThread.__init__(self)
+            self._observer = observer
+            self._interval = interval
+            self._io_budget = io_budget
+            self._lock = threading.Lock()
+            self._queued_emitters = OrderedSet()
+            self._wake_event = threading.Event()
+            self._is_started = False
+
+        @property
+        def interval(self):
+            """Interval between audits."""
+            return self._interval
+
+        @property
+        def io_budget(self):
+            """Files and directories examined per second."""
+            return self._io_budget
+
+        def queue_emitter(self, emitter):
+            """
+            Has the thread call :meth:`InotifyEmitter.catch_up` for the given
+            emitter.
+            """
+            if self.should_stop():
+                return
+            with self._lock:
+                self._queued_emitters.add(emitter)
+            self._wake_event.set()
+            self.start()
+
+        def start(self):
+            with self._lock:
+                if self._is_started:
+                    return
+                self._is_started = True
+            DaemonThread.start(self)
+
+        def on_thread_told_to_stop(self):
+            self._wake_event.set()
+
+        def run(self):
+            try:
+                # Linux applies the niceness to the calling thread only.
+                os.nice(AUDIT_NICENESS)
+            except OSError:
+                pass
+            if self.interval is None or self._observer is None:
+                next_audit = None
+            else:
+                next_audit = time.time() + self.interval
+            while self.should_keep_running():
+                if next_audit is None:
+                    self._wake_event.wait()
+                else:
+                    self._wake_event.wait(max(0, next_audit - time.time()))
+                self._wake_event.clear()
+                with self._lock:
+                    emitters = list(self._queued_emitters)
+                    self._queued_emitters = OrderedSet()
+                for emitter in emitters:
+                    if self.should_stop():
+                        return
+                    emitter.catch_up(self.io_budget)
+                if next_audit is None or time.time() < next_audit:
+                    continue
+                for emitter in self._observer.emitters:
+                    if self.should_stop():
+                        return
+                    emitter.resync(self.io_budget)
+                next_audit = time.time() + self.interval
 
 
     class InotifyObserver(BaseObserver):
         """
         Observer thread that schedules watching directories and dispatches
         calls to event handlers.
+
+        All watches share a single inotify instance that is read by a single
+        :class:`InotifyReader` thread, so scheduling a watch only adds kernel
+        watches and neither opens a file descriptor nor starts a thread.
+
+        :param max_watches:
+            Maximum number of kernel watches held for all watches, or
+            ``None`` to be limited only by ``max_user_watches``. Directories
+            beyond the budget are polled; see :class:`Inotify`.
+        :param audit_interval:
+            Interval (in seconds) between audits of all watched trees by the
+            :class:`InotifyAuditor`, or ``None`` to resync only the watches
+            that lost events when the kernel event queue overflowed.
+        :param audit_budget:
+            Maximum number of files and directories examined per second by
+            audits and resyncs.
+        :param coalesce_window:
+            Time (in seconds) for which modifications are held back to be
+            folded together; see :class:`InotifyEmitter`.
         """
 
-        def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT):
+        def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT, max_watches=None,
+                     audit_interval=None, audit_budget=DEFAULT_AUDIT_BUDGET,
+                     coalesce_window=None):
             BaseObserver.__init__(self, emitter_class=InotifyEmitter,
                                   timeout=timeout)
+            self._coalesce_window = coalesce_window
+            self._reader = InotifyReader(Inotify(max_watches=max_watches),
+                                         timeout)
+            self._reader_started = False
+            self._auditor = InotifyAuditor(self, audit_interval, audit_budget)
+
+        def _create_emitter(self, watch):
+            with self._lock:
+                event_types = self._event_types_for_watch(watch)
+            return self._emitter_class(event_queue=self.event_queue,
+                                       watch=watch,
+                                       timeout=self.timeout,
+                                       inotify=self._reader.inotify,
+                                       event_types=event_types,
+                                       coalesce_window=self._coalesce_window,
+                                       auditor=self._auditor)
+
+        def _start_emitter(self, emitter):
+            if not self._reader_started:
+                self._reader_started = True
+                self._reader.start()
+                if self._auditor.interval is not None:
+                    self._auditor.start()
+
+        def on_thread_exit(self):
+            BaseObserver.on_thread_exit(self)
+            self._reader.stop()
+            self._auditor.stop()
+            if self._reader_started:
+                self._reader.join()
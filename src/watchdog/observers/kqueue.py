@@ -103,7 +103,14 @@ if platform.is_bsd() or platform.is_darwin():
         EventEmitter, \
         DEFAULT_OBSERVER_TIMEOUT, \
         DEFAULT_EMITTER_TIMEOUT
-    from watchdog.utils.dirsnapshot import DirectorySnapshot
+    from watchdog.utils.dirsnapshot import \
+        DirectorySnapshot, \
+        DirectorySnapshotDiff
+    from watchdog.utils.snapshotfile import \
+        SnapshotCheckpoint, \
+        snapshot_file_name, \
+        DEFAULT_CHECKPOINT_INTERVAL
+    from watchdog.observers.polling import events_from_snapshot_diff
     from watchdog.events import \
         DirMovedEvent, \
         DirDeletedEvent, \
@@ -433,8 +440,18 @@ if platform.is_bsd() or platform.is_darwin():
             Read events blocking timeout (in seconds).
         :type timeout:
             ``float``
+        :param snapshot_file:
+            Path of a file to save the snapshot to now and then and when the
+            emitter stops. If the file holds a snapshot of the watch when the
+            emitter is created, the changes made since it was saved are
+            queued first; see :mod:`watchdog.utils.snapshotfile`.
+        :param checkpoint_interval:
+            Minimum interval (in seconds) between saves of a changing
+            snapshot.
         """
-        def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
+        def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                     snapshot_file=None,
+                     checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL):
             EventEmitter.__init__(self, event_queue, watch, timeout)
 
             self._kq = select.kqueue()
@@ -449,6 +466,49 @@ if platform.is_bsd() or platform.is_darwin():
                                                watch.is_recursive,
                                                walker_callback)
 
+            self._checkpoint = None
+            # Whether the snapshot changed since it was last checkpointed.
+            self._snapshot_dirty = False
+            if snapshot_file is not None:
+                self._checkpoint = SnapshotCheckpoint(snapshot_file,
+                                                      checkpoint_interval)
+                self._snapshot_dirty = True
+                ref_snapshot = self._checkpoint.load(watch.path,
+                                                     watch.is_recursive)
+                if ref_snapshot is not None:
+                    # The kevents are registered already.
+                    diff = DirectorySnapshotDiff(ref_snapshot, self._snapshot)
+                    for event in events_from_snapshot_diff(diff):
+                        EventEmitter.queue_event(self, event)
+
+        def checkpoint(self):
+            """
+            Saves the snapshot to the snapshot file if it changed since it
+            was last saved.
+
+            :raises:
+                :class:`OSError` or :class:`IOError` if the file cannot be
+                written.
+            """
+            with self._lock:
+                if self._checkpoint is not None:
+                    if self._snapshot_dirty:
+                        self._snapshot_dirty = False
+                        self._checkpoint.mark_changed()
+                    self._checkpoint.save(self._snapshot)
+
+        def _checkpoint_if_due(self):
+            """
+            Saves the snapshot if it changed since it was last checkpointed
+            and the checkpoint interval has elapsed.
+            """
+            if (self._checkpoint is None or not self._snapshot_dirty or
+                not self._checkpoint.is_due()):
+                return
+            self._snapshot_dirty = False
+            self._checkpoint.mark_changed()
+            self._checkpoint.save_if_due(self._snapshot)
+
 
         def _register_kevent(self, path, is_directory):
             """
@@ -696,6 +756,10 @@ if platform.is_bsd() or platform.is_darwin():
                         self._queue_dirs_modified(dirs_modified,
                                                   ref_snapshot,
                                                   new_snapshot)
+
+                    if event_list:
+                        self._snapshot_dirty = True
+                    self._checkpoint_if_due()
                 except OSError, e:
                     if e.errno == errno.EBADF:
                         #logging.debug(e)
@@ -704,6 +768,11 @@ if platform.is_bsd() or platform.is_darwin():
                         raise
 
         def on_thread_exit(self):
+            try:
+                self.checkpoint()
+            except (IOError, OSError):
+                # The changes are reported again on the next start.
+                pass
             # Clean up.
             with self._lock:
                 self._descriptors.clear()
@@ -714,6 +783,23 @@ if platform.is_bsd() or platform.is_darwin():
         """
         Observer thread that schedules watching directories and dispatches
         calls to event handlers.
+
+        :param snapshot_dir:
+            Directory to save the snapshots of the watches in, so that the
+            changes made while the observer was not running are reported
+            when the same paths are scheduled again.
         """
-        def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT):
+        def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT, snapshot_dir=None):
             BaseObserver.__init__(self, emitter_class=KqueueEmitter, timeout=timeout)
+            self._snapshot_dir = snapshot_dir
+
+        def _create_emitter(self, watch):
+            snapshot_file = None
+            if self._snapshot_dir is not None:
+                snapshot_file = os.path.join(
+                    self._snapshot_dir,
+                    snapshot_file_name(watch.path, watch.is_recursive))
+            return self._emitter_class(event_queue=self.event_queue,
+                                       watch=watch,
+                                       timeout=self.timeout,
+                                       snapshot_file=snapshot_file)
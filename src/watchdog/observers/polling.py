@@ -27,15 +27,38 @@ Classes
 .. autoclass:: PollingEmitter
    :members:
    :show-inheritance:
+
+.. autoclass:: PollingSchedule
+   :members:
+
+.. autoclass:: PollingEngine
+   :members:
+
+Functions
+---------
+.. autofunction:: events_from_snapshot_diff
 """
 
 
 from __future__ import with_statement
 
+import os
 import time
+import heapq
+import random
 import threading
+from collections import deque
 
-from watchdog.utils.dirsnapshot import DirectorySnapshot, DirectorySnapshotDiff
+from watchdog.utils import DaemonThread
+from watchdog.utils.dirsnapshot import \
+    CompactDirectorySnapshot, \
+    DirectorySnapshot, \
+    DirectorySnapshotDiff, \
+    DEFAULT_CHANGE_FIELDS
+from watchdog.utils.snapshotfile import \
+    SnapshotCheckpoint, \
+    snapshot_file_name, \
+    DEFAULT_CHECKPOINT_INTERVAL
 from watchdog.observers.api import \
     EventEmitter, \
     BaseObserver, \
@@ -52,60 +75,604 @@ from watchdog.events import \
     FileModifiedEvent
 
 
+def events_from_snapshot_diff(diff):
+    """
+    Returns the file system events that describe the difference between two
+    directory snapshots.
+
+    :param diff:
+        The difference between two snapshots.
+    :type diff:
+        :class:`watchdog.utils.dirsnapshot.DirectorySnapshotDiff`
+    :returns:
+        A list of :class:`watchdog.events.FileSystemEvent` objects.
+    """
+    events = []
+
+    # Files.
+    for src_path in diff.files_deleted:
+        events.append(FileDeletedEvent(src_path))
+    for src_path in diff.files_modified:
+        events.append(FileModifiedEvent(src_path))
+    for src_path in diff.files_created:
+        events.append(FileCreatedEvent(src_path))
+    for src_path, dest_path in diff.files_moved:
+        events.append(FileMovedEvent(src_path, dest_path))
+
+    # Directories.
+    for src_path in diff.dirs_deleted:
+        events.append(DirDeletedEvent(src_path))
+    for src_path in diff.dirs_modified:
+        events.append(DirModifiedEvent(src_path))
+    for src_path in diff.dirs_created:
+        events.append(DirCreatedEvent(src_path))
+    for src_path, dest_path in diff.dirs_moved:
+        events.append(DirMovedEvent(src_path, dest_path))
+    return events
+
+
+def changed_directories(diff):
+    """
+    Returns the directories whose entries changed between two directory
+    snapshots.
+
+    :param diff:
+        The difference between two snapshots.
+    :type diff:
+        :class:`watchdog.utils.dirsnapshot.DirectorySnapshotDiff`
+    :returns:
+        A set of directory paths.
+    """
+    paths = (diff.files_created + diff.files_deleted + diff.files_modified +
+             diff.dirs_created + diff.dirs_deleted)
+    for src_path, dest_path in diff.files_moved + diff.dirs_moved:
+        paths.append(src_path)
+        paths.append(dest_path)
+    directories = set([os.path.dirname(path) for path in paths])
+    directories.update(diff.dirs_modified)
+    return directories
+
+
+class PollingSchedule(object):
+    """
+    Decides when to poll each directory of a watch from how often it
+    changes.
+
+    A directory is polled every ``min_interval`` seconds after it changed;
+    every poll that finds it unchanged multiplies its interval by
+    ``backoff``, up to ``max_interval``. New directories start at
+    ``min_interval``.
+
+    :param min_interval:
+        Interval (in seconds) between polls of a directory that just
+        changed.
+    :param max_interval:
+        Longest interval (in seconds) between polls of a directory.
+    :param backoff:
+        Factor by which the interval of a quiet directory grows.
+    """
+    def __init__(self, min_interval, max_interval, backoff=2):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = backoff
+        self._interval = dict()
+        # Due time of every directory not being polled, and a heap of
+        # (due time, path) with stale entries skipped when popped.
+        self._due = dict()
+        self._heap = []
+
+    def __len__(self):
+        return len(self._interval)
+
+    def interval(self, path):
+        """
+        Returns the current polling interval (in seconds) of a directory.
+        """
+        return self._interval[path]
+
+    def _schedule(self, path, interval, now):
+        due = now + interval
+        self._interval[path] = interval
+        self._due[path] = due
+        heapq.heappush(self._heap, (due, path))
+
+    def _drop_stale(self):
+        heap = self._heap
+        if len(heap) > 2 * len(self._due) + 64:
+            self._heap = heap = [(due, path)
+                                 for path, due in self._due.items()]
+            heapq.heapify(heap)
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+
+    def set_directories(self, directories, now):
+        """
+        Schedules the directories new to the schedule and forgets the ones
+        that are not given.
+
+        :param directories:
+            All the directories of the watch.
+        :param now:
+            The current time.
+        """
+        directories = set(directories)
+        for path in list(self._interval):
+            if path not in directories:
+                del self._interval[path]
+                self._due.pop(path, None)
+        for path in directories:
+            if path not in self._interval:
+                self._schedule(path, self.min_interval, now)
+
+    def next_due(self):
+        """
+        Returns the time the next directory is due, or ``None`` if nothing
+        is scheduled.
+        """
+        self._drop_stale()
+        if self._heap:
+            return self._heap[0][0]
+        return None
+
+    def pop_due(self, now):
+        """
+        Returns the directories due at the given time. They are not polled
+        again until :meth:`reschedule` is called for them.
+        """
+        directories = []
+        self._drop_stale()
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due, path = heapq.heappop(heap)
+            if self._due.get(path) == due:
+                del self._due[path]
+                directories.append(path)
+        return directories
+
+    def reschedule(self, directories, changed, now):
+        """
+        Schedules polled directories again, tightening the interval of the
+        ones that changed and backing off the others.
+
+        :param directories:
+            The directories polled.
+        :param changed:
+            The directories found changed.
+        :param now:
+            The current time.
+        """
+        for path in directories:
+            interval = self._interval.get(path)
+            if interval is None:
+                # Gone.
+                continue
+            if path in changed:
+                interval = self.min_interval
+            else:
+                interval = min(interval * self.backoff, self.max_interval)
+            self._schedule(path, interval, now)
+
+
 class PollingEmitter(EventEmitter):
     """
     Platform-independent emitter that polls a directory to detect file
     system changes.
+
+    The snapshot of the watched directory is refreshed in place on every
+    poll; see :meth:`watchdog.utils.dirsnapshot.DirectorySnapshot.refresh`.
+
+    :param stat_files:
+        ``True`` to ``stat`` every file on every poll to detect
+        modifications; ``False`` to detect only the modifications of files
+        in directories that changed, for about one ``stat`` per directory
+        per poll.
+    :param snapshot_file:
+        Path of a file to save the snapshot to now and then and when the
+        emitter stops. If the file holds a snapshot of the watch when the
+        emitter is created, the first poll reports the changes made since it
+        was saved; see :mod:`watchdog.utils.snapshotfile`.
+    :param checkpoint_interval:
+        Minimum interval (in seconds) between saves of a changing snapshot.
+    :param max_interval:
+        If given, each directory is polled on its own schedule, every
+        ``timeout`` seconds after it changed and backing off up to every
+        ``max_interval`` seconds while it stays quiet; see
+        :class:`PollingSchedule`. Otherwise the whole watch is polled every
+        ``timeout`` seconds.
+    :param engine:
+        If given, the :class:`PollingEngine` that polls the watch; the
+        emitter is then added to the engine instead of being started.
+    :param change_fields:
+        The stat fields compared to tell whether a path was modified; see
+        :class:`watchdog.utils.dirsnapshot.DirectorySnapshotDiff`.
+    :param report_replaced:
+        ``True`` to report a path replaced by another file; see
+        :class:`watchdog.utils.dirsnapshot.DirectorySnapshotDiff`.
+    :param structure_only:
+        ``True`` to ``stat`` only directories, reporting the creation,
+        deletion and moves of files but not their modification; see
+        :class:`watchdog.utils.dirsnapshot.DirectorySnapshot`.
+    :param compact:
+        ``True`` to keep the snapshot in compact columns, for large trees;
+        see :class:`watchdog.utils.dirsnapshot.CompactDirectorySnapshot`.
+        It takes much less memory, but every poll rebuilds it in full, even
+        when only the directories due are polled. A compact snapshot cannot
+        be saved to a snapshot file and cannot be structure-only.
+    :raises:
+        :class:`ValueError` if ``compact`` is given with ``snapshot_file``
+        or ``structure_only``.
     """
-    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT):
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT,
+                 stat_files=True, snapshot_file=None,
+                 checkpoint_interval=DEFAULT_CHECKPOINT_INTERVAL,
+                 max_interval=None, engine=None,
+                 change_fields=DEFAULT_CHANGE_FIELDS, report_replaced=False,
+                 structure_only=False, compact=False):
+        if compact and (snapshot_file is not None or structure_only):
+            raise ValueError("A compact snapshot cannot be saved to a file "
+                             "or be structure-only")
         EventEmitter.__init__(self, event_queue, watch, timeout)
-        self._snapshot = DirectorySnapshot(watch.path, watch.is_recursive)
+        self._stat_files = stat_files
+        self._change_fields = change_fields
+        self._report_replaced = report_replaced
+        self._engine = engine
+        self._next_poll = time.time() + timeout
         self._lock = threading.Lock()
+        self._snapshot = None
+        self._checkpoint = None
+        if snapshot_file is not None:
+            self._checkpoint = SnapshotCheckpoint(snapshot_file,
+                                                  checkpoint_interval)
+            self._snapshot = self._checkpoint.load(watch.path,
+                                                   watch.is_recursive,
+                                                   structure_only)
+            if self._snapshot is None:
+                self._checkpoint.mark_changed()
+        if compact:
+            self._snapshot = CompactDirectorySnapshot(watch.path,
+                                                      watch.is_recursive)
+        elif self._snapshot is None:
+            self._snapshot = DirectorySnapshot(watch.path, watch.is_recursive,
+                                               structure_only=structure_only)
+        self._schedule = None
+        if max_interval is not None:
+            self._schedule = PollingSchedule(timeout, max_interval)
+            self._schedule.set_directories(self._snapshot.directories,
+                                           time.time())
+
+    def checkpoint(self):
+        """
+        Saves the snapshot to the snapshot file if it changed since it was
+        last saved.
+
+        :raises:
+            :class:`OSError` or :class:`IOError` if the file cannot be
+            written.
+        """
+        with self._lock:
+            if self._checkpoint is not None and self._snapshot is not None:
+                self._checkpoint.save(self._snapshot)
+
+    def on_thread_told_to_stop(self):
+        if self._engine is not None:
+            self._engine.remove(self)
 
     def on_thread_exit(self):
-        self._snapshot = None
+        try:
+            self.checkpoint()
+        except (IOError, OSError):
+            # The changes are reported again on the next start.
+            pass
+        with self._lock:
+            self._snapshot = None
 
+    def next_poll_time(self):
+        """
+        Returns the time the emitter is next due to poll.
+        """
+        with self._lock:
+            if self._schedule is None:
+                return self._next_poll
+            next_due = self._schedule.next_due()
+            if next_due is None:
+                return time.time() + self.timeout
+            return next_due
 
     def queue_events(self, timeout):
+        # We don't want to hit the disk continuously.
+        # timeout behaves like an interval for polling emitters.
+        next_poll = self.next_poll_time()
+        time.sleep(max(0, min(next_poll - time.time(), timeout)))
+        if time.time() >= next_poll:
+            self.poll()
+
+    def poll(self):
+        """
+        Polls the watch, or the directories of the watch that are due, and
+        queues the events for the changes found.
+        """
         with self._lock:
-            # We don't want to hit the disk continuously.
-            # timeout behaves like an interval for polling emitters.
-            time.sleep(timeout)
-
-            # Get event diff between fresh snapshot and previous snapshot.
-            # Update snapshot.
-            new_snapshot = DirectorySnapshot(self.watch.path, self.watch.is_recursive)
-            events = DirectorySnapshotDiff(self._snapshot, new_snapshot)
-            self._snapshot = new_snapshot
-
-            # Files.
-            for src_path in events.files_deleted:
-                self.queue_event(FileDeletedEvent(src_path))
-            for src_path in events.files_modified:
-                self.queue_event(FileModifiedEvent(src_path))
-            for src_path in events.files_created:
-                self.queue_event(FileCreatedEvent(src_path))
-            for src_path, dest_path in events.files_moved:
-                self.queue_event(FileMovedEvent(src_path, dest_path))
-
-            # Directories.
-            for src_path in events.dirs_deleted:
-                self.queue_event(DirDeletedEvent(src_path))
-            for src_path in events.dirs_modified:
-                self.queue_event(DirModifiedEvent(src_path))
-            for src_path in events.dirs_created:
-                self.queue_event(DirCreatedEvent(src_path))
-            for src_path, dest_path in events.dirs_moved:
-                self.queue_event(DirMovedEvent(src_path, dest_path))
+            if self._snapshot is None:
+                # Stopped.
+                return
+            if self._schedule is not None:
+                diff = self._refresh_due_directories()
+            else:
+                # Bring the snapshot up to date and get the changes.
+                try:
+                    diff = self._snapshot.refresh(
+                        stat_files=self._stat_files,
+                        change_fields=self._change_fields,
+                        report_replaced=self._report_replaced)
+                except OSError:
+                    # The watched directory is gone.
+                    diff = None
+                self._next_poll = time.time() + self.timeout
+            if diff is None:
+                return
 
+            events = events_from_snapshot_diff(diff)
+            for event in events:
+                self.queue_event(event)
+
+            if self._checkpoint is not None:
+                if events:
+                    self._checkpoint.mark_changed()
+                self._checkpoint.save_if_due(self._snapshot)
+
+    def _refresh_due_directories(self):
+        """
+        Refreshes the directories that are due. Returns the changes, or
+        ``None`` if nothing was refreshed.
+        """
+        schedule = self._schedule
+        directories = schedule.pop_due(time.time())
+        if not directories:
+            return None
+        try:
+            diff = self._snapshot.refresh(
+                stat_files=self._stat_files,
+                directories=directories,
+                change_fields=self._change_fields,
+                report_replaced=self._report_replaced)
+        except OSError:
+            # The watched directory is gone.
+            schedule.reschedule(directories, (), time.time())
+            return None
+        now = time.time()
+        if diff.dirs_created or diff.dirs_deleted or diff.dirs_moved:
+            schedule.set_directories(self._snapshot.directories, now)
+        schedule.reschedule(directories, changed_directories(diff), now)
+        return diff
+
+
+class PollingEngine(object):
+    """
+    Polls the watches of many :class:`PollingEmitter` objects from a fixed
+    number of worker threads instead of a thread per watch.
+
+    The emitters are kept in a priority queue ordered by the time they are
+    next due to poll. Every time an emitter is queued, its due time is
+    delayed by a random fraction of its interval, up to ``jitter``, so that
+    watches scheduled together drift apart and the polls are spread over
+    time instead of hitting the disk in bursts.
+
+    The snapshot of a removed emitter is saved by a worker thread, so that
+    removing an emitter never waits for its poll or for the disk.
+
+    :param workers:
+        Number of worker threads.
+    :param jitter:
+        Largest random delay added to a due time, as a fraction of the
+        polling interval.
+    """
+    def __init__(self, workers=1, jitter=0.1):
+        self._jitter = jitter
+        self._condition = threading.Condition()
+        # Heap of (due time, sequence number, emitter); entries of removed
+        # emitters are skipped.
+        self._queue = []
+        self._sequence = 0
+        self._emitters = set()
+        # Removed emitters whose snapshot is still to be saved.
+        self._removed = deque()
+        self._workers = [PollingWorker(self) for _ in range(workers)]
+        self._is_started = False
+        self._is_stopped = False
+
+    @property
+    def workers(self):
+        """The worker threads of the engine."""
+        return list(self._workers)
+
+    def _push(self, emitter, due):
+        self._sequence += 1
+        heapq.heappush(self._queue, (due, self._sequence, emitter))
+        self._condition.notify()
+
+    def add(self, emitter):
+        """
+        Starts polling the watch of an emitter, at a random time within its
+        first interval, and starts the worker threads if needed.
+
+        :param emitter:
+            The emitter, created with this engine and not started.
+        :type emitter:
+            :class:`PollingEmitter`
+        """
+        with self._condition:
+            self._emitters.add(emitter)
+            # Spread the first polls over a whole interval.
+            now = time.time()
+            interval = max(0, emitter.next_poll_time() - now)
+            self._push(emitter, now + random.random() * interval)
+            if not self._is_started:
+                self._is_started = True
+                for worker in self._workers:
+                    worker.start()
+
+    def remove(self, emitter):
+        """
+        Stops polling the watch of an emitter. Its snapshot is saved by a
+        worker thread before the workers stop.
+        """
+        with self._condition:
+            if emitter not in self._emitters:
+                return
+            self._emitters.remove(emitter)
+            if not self._is_stopped:
+                self._removed.append(emitter)
+                self._condition.notify()
+                return
+        # No worker is left to save it.
+        emitter.on_thread_exit()
+
+    def stop(self):
+        """
+        Stops the worker threads once the snapshots of the removed emitters
+        are saved.
+        """
+        with self._condition:
+            self._is_stopped = True
+            for worker in self._workers:
+                worker.stop()
+            self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Waits for the worker threads that were started to stop.
+        """
+        if self._is_started:
+            for worker in self._workers:
+                worker.join(timeout)
+
+    def _next_emitter(self, worker):
+        """
+        Waits for an emitter to be due or removed and takes it off the
+        queue. Returns a tuple of the emitter and whether it was removed, or
+        ``None`` if the worker is told to stop and no removed emitter is
+        left.
+        """
+        with self._condition:
+            while True:
+                if self._removed:
+                    return self._removed.popleft(), True
+                if not worker.should_keep_running():
+                    return None
+                entries = self._queue
+                while entries and entries[0][2] not in self._emitters:
+                    heapq.heappop(entries)
+                if not entries:
+                    self._condition.wait(DEFAULT_EMITTER_TIMEOUT)
+                    continue
+                delay = entries[0][0] - time.time()
+                if delay > 0:
+                    self._condition.wait(min(delay, DEFAULT_EMITTER_TIMEOUT))
+                    continue
+                return heapq.heappop(entries)[2], False
+
+    def _poll(self, emitter, is_removed):
+        if is_removed:
+            emitter.on_thread_exit()
+            return
+        emitter.poll()
+        with self._condition:
+            if emitter in self._emitters:
+                due = emitter.next_poll_time()
+                interval = max(0, due - time.time())
+                self._push(emitter,
+                           due + random.random() * self._jitter * interval)
+
+
+class PollingWorker(DaemonThread):
+    """
+    Worker thread of a :class:`PollingEngine`.
+    """
+    def __init__(self, engine):
+        DaemonThread.__init__(self)
+        self._engine = engine
+
+    def run(self):
+        while True:
+            task = self._engine._next_emitter(self)
+            if task is None:
+                break
+            self._engine._poll(*task)
 
 
 class PollingObserver(BaseObserver):
     """
     Observer thread that schedules watching directories and dispatches
     calls to event handlers.
+
+    :param stat_files:
+        Whether every file is ``stat``-ed on every poll; see
+        :class:`PollingEmitter`.
+    :param snapshot_dir:
+        Directory to save the snapshots of the watches in, so that the
+        changes made while the observer was not running are reported when
+        the same paths are scheduled again.
+    :param max_interval:
+        If given, the longest interval (in seconds) between polls of a
+        quiet directory; see :class:`PollingEmitter`.
+    :param workers:
+        If given, the number of threads polling all the watches; see
+        :class:`PollingEngine`. By default every watch is polled from a
+        thread of its own.
+    :param change_fields:
+        The stat fields compared to tell whether a path was modified; see
+        :class:`PollingEmitter`.
+    :param report_replaced:
+        ``True`` to report a path replaced by another file; see
+        :class:`PollingEmitter`.
+    :param structure_only:
+        ``True`` to ``stat`` only directories; see :class:`PollingEmitter`.
+    :param compact:
+        ``True`` to keep the snapshots in compact columns; see
+        :class:`PollingEmitter`.
     """
-    def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT):
+    def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT, stat_files=True,
+                 snapshot_dir=None, max_interval=None, workers=None,
+                 change_fields=DEFAULT_CHANGE_FIELDS, report_replaced=False,
+                 structure_only=False, compact=False):
         BaseObserver.__init__(self, emitter_class=PollingEmitter, timeout=timeout)
+        self._stat_files = stat_files
+        self._change_fields = change_fields
+        self._report_replaced = report_replaced
+        self._structure_only = structure_only
+        self._compact = compact
+        self._snapshot_dir = snapshot_dir
+        self._max_interval = max_interval
+        self._engine = None
+        if workers is not None:
+            self._engine = PollingEngine(workers)
 
+    def _create_emitter(self, watch):
+        snapshot_file = None
+        if self._snapshot_dir is not None:
+            snapshot_file = os.path.join(
+                self._snapshot_dir,
+                snapshot_file_name(watch.path, watch.is_recursive))
+        return self._emitter_class(event_queue=self.event_queue,
+                                   watch=watch,
+                                   timeout=self.timeout,
+                                   stat_files=self._stat_files,
+                                   snapshot_file=snapshot_file,
+                                   max_interval=self._max_interval,
+                                   engine=self._engine,
+                                   change_fields=self._change_fields,
+                                   report_replaced=self._report_replaced,
+                                   structure_only=self._structure_only,
+                                   compact=self._compact)
 
+    def _start_emitter(self, emitter):
+        if self._engine is None:
+            emitter.start()
+        else:
+            self._engine.add(emitter)
+
+    def on_thread_exit(self):
+        BaseObserver.on_thread_exit(self)
+        if self._engine is not None:
+            self._engine.stop()
+            self._engine.join()
@@ -108,7 +108,7 @@ class OrderedSetQueue(queue.Queue):
 
 
 
-if not sys.version < (2, 6, 0):
+if not sys.version_info < (2, 6, 0):
     KEY, PREV, NEXT = range(3)
 
     class OrderedSet(collections.MutableSet):
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+:module: watchdog.utils.dirscan
+:synopsis: Directory listing helpers that avoid ``stat`` calls.
+:author: Yesudeep Mangalapilly <yesudeep@gmail.com>
+
+Directory listings are read with ``scandir``, which reports the type of every
+entry from the ``d_type`` field filled in by ``readdir(3)`` and hence does not
+need to ``stat`` entries to tell directories apart from files. ``scandir`` is
+part of the standard library from Python 3.5 onwards and is available for
+older Pythons as the ``scandir`` package. Without it, entries are ``lstat``-ed
+instead.
+
+Symbolic links are never followed.
+
+Functions
+---------
+.. autofunction:: iter_entries
+
+.. autofunction:: subdirectories
+"""
+
+import os
+import stat
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # IGNORE:F0401
+    except ImportError:
+        scandir = None
+
+
+def iter_entries(path):
+    """
+    Lists a directory and yields a ``(name, is_directory, inode)`` tuple for
+    every entry in it. Entries that vanish while the directory is being
+    listed are skipped.
+
+    :param path:
+        Directory path.
+    :raises:
+        :class:`OSError` if the directory cannot be listed.
+    """
+    if scandir is not None:
+        for entry in scandir(path):
+            try:
+                yield (entry.name,
+                       entry.is_dir(follow_symlinks=False),
+                       entry.inode())
+            except OSError:
+                continue
+    else:
+        for name in os.listdir(path):
+            try:
+                stat_info = os.lstat(os.path.join(path, name))
+            except OSError:
+                continue
+            yield name, stat.S_ISDIR(stat_info.st_mode), stat_info.st_ino
+
+
+def subdirectories(path):
+    """
+    Returns the paths of the immediate subdirectories of a directory.
+
+    :param path:
+        Directory path.
+    :raises:
+        :class:`OSError` if the directory cannot be listed.
+    """
+    return [os.path.join(path, name)
+            for name, is_directory, _ in iter_entries(path)
+            if is_directory]
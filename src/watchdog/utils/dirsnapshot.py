@@ -23,13 +23,10 @@
 
 .. ADMONITION:: Where are the moved events? They "disappeared"
 
-        This implementation does not take partition boundaries
-        into consideration. It will only work when the directory
-        tree is entirely on the same file system. More specifically,
-        any part of the code that depends on inode numbers can
-        break if partition boundaries are crossed. In these cases,
-        the snapshot diff will represent file/directory movement as
-        created and deleted events.
+        Moves are detected by matching the device and inode numbers
+        of deleted and created paths. Moving a file or directory across
+        partition boundaries copies it to a new inode, so the snapshot
+        diff will represent such movement as created and deleted events.
 
         Windows does not have any concept of ``inodes``, which prevents
         this snapshotter from determining file or directory renames/movement
@@ -50,17 +47,100 @@ Classes
    :members:
    :show-inheritance:
 
+.. autoclass:: CompactDirectorySnapshot
+   :members:
+   :show-inheritance:
+
 """
 
 import os
 import sys
 import stat
+import time
 
+from array import array
+from collections import deque
 from pathtools.path import walk as path_walk, absolute_path
+from watchdog.utils.dirscan import iter_entries
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 if not sys.version < (2, 6, 0):
     from watchdog.utils.bricks import OrderedSet as set
 
+# Directories whose modification time is this close (in seconds) to the time
+# they were listed may change again without their modification time
+# changing, on file systems with coarse timestamps.
+RACY_MTIME_WINDOW = 2
+
+# Stat fields compared by default to tell whether a path was modified.
+# Adding ``st_ino`` reports a path replaced by another file as modified.
+DEFAULT_CHANGE_FIELDS = ('st_mtime_ns',)
+
+# Stat fields that can be compared.
+CHANGE_FIELDS = ('st_mtime_ns', 'st_ctime_ns', 'st_size', 'st_ino',
+                 'st_mode')
+
+
+def _time_ns(stat_info, name):
+    """
+    Returns a time of the stat information in nanoseconds, from the
+    ``*_ns`` field where the platform has one.
+    """
+    value = getattr(stat_info, name + '_ns', None)
+    if value is None:
+        value = int(round(getattr(stat_info, name) * 1e9))
+    return value
+
+
+def _mtime_ns(stat_info):
+    return _time_ns(stat_info, 'st_mtime')
+
+
+def _ctime_ns(stat_info):
+    return _time_ns(stat_info, 'st_ctime')
+
+
+def _stat_result(mode, ino, dev, size, mtime, ctime, mtime_ns, ctime_ns):
+    """
+    Returns stat information with the given fields, the others zero. The
+    times in nanoseconds are kept where ``os.stat_result`` has fields for
+    them; elsewhere they are worked out from the times in seconds.
+    """
+    return os.stat_result((mode, ino, dev, 0, 0, 0, size, 0, mtime, ctime),
+                          dict(st_mtime_ns=mtime_ns, st_ctime_ns=ctime_ns))
+
+
+def _field_values(stat_info, fields):
+    """
+    Returns the values of the given stat fields.
+    """
+    values = []
+    for field in fields:
+        if field == 'st_mtime_ns':
+            values.append(_mtime_ns(stat_info))
+        elif field == 'st_ctime_ns':
+            values.append(_ctime_ns(stat_info))
+        else:
+            values.append(getattr(stat_info, field))
+    return values
+
+
+def _is_changed(ref_stat_info, stat_info):
+    """
+    Determines whether the stat information of a path changed in a way
+    that matters to a snapshot.
+    """
+    return (stat_info.st_ino != ref_stat_info.st_ino or
+            stat_info.st_size != ref_stat_info.st_size or
+            stat_info.st_mode != ref_stat_info.st_mode or
+            _mtime_ns(stat_info) != _mtime_ns(ref_stat_info) or
+            _ctime_ns(stat_info) != _ctime_ns(ref_stat_info))
+
+
 class DirectorySnapshotDiff(object):
     """
     Compares two directory snapshots and creates an object that represents
@@ -75,10 +155,29 @@ class DirectorySnapshotDiff(object):
         with the reference snapshot.
     :type dirsnap:
         :class:`DirectorySnapshot`
+
+    :param change_fields:
+        The stat fields compared to tell whether a path that is in both
+        snapshots was modified, from ``st_mtime_ns``, ``st_ctime_ns``,
+        ``st_size``, ``st_ino`` and ``st_mode``; times are compared in
+        nanoseconds. By default only the modification time is compared.
+    :param report_replaced:
+        ``True`` to report a path now naming another file (device and inode
+        number) as deleted and created; the old file may also be reported
+        as moved elsewhere. If ``st_ino`` is in ``change_fields``, such a
+        path is reported as modified instead when the file type is the
+        same. Otherwise nothing is reported for it.
+
+    When NumPy is installed, two :class:`CompactDirectorySnapshot` objects
+    are compared in bulk over their columns instead of path by path.
     """
-    def __init__(self, ref_dirsnap, dirsnap):
+    def __init__(self, ref_dirsnap, dirsnap,
+                 change_fields=DEFAULT_CHANGE_FIELDS, report_replaced=False):
         """
         """
+        for field in change_fields:
+            if field not in CHANGE_FIELDS:
+                raise ValueError("Cannot compare stat field: %s" % field)
         self._files_deleted = list()
         self._files_modified = list()
         self._files_created = list()
@@ -89,33 +188,76 @@ class DirectorySnapshotDiff(object):
         self._dirs_deleted = list()
         self._dirs_created = list()
 
+        modify_replaced = 'st_ino' in change_fields
+        report_replaced = report_replaced or modify_replaced
+        fields = [field for field in change_fields if field != 'st_ino']
+
+        if (_can_diff_vectorised(ref_dirsnap) and
+            _can_diff_vectorised(dirsnap)):
+            self._diff_vectorised(ref_dirsnap, dirsnap, fields,
+                                  report_replaced, modify_replaced)
+            return
+
         # Detect all the modifications.
+        paths_replaced = []
         for path, stat_info in dirsnap.stat_snapshot.items():
             if path in ref_dirsnap.stat_snapshot:
                 ref_stat_info = ref_dirsnap.stat_info(path)
-                if stat_info.st_ino == ref_stat_info.st_ino and stat_info.st_mtime != ref_stat_info.st_mtime:
+                if (stat_info.st_ino != ref_stat_info.st_ino or
+                    stat_info.st_dev != ref_stat_info.st_dev):
+                    if report_replaced:
+                        paths_replaced.append(path)
+                elif (_field_values(stat_info, fields) !=
+                      _field_values(ref_stat_info, fields)):
                     if stat.S_ISDIR(stat_info.st_mode):
                         self._dirs_modified.append(path)
                     else:
                         self._files_modified.append(path)
 
+        # Paths replaced by other files are deleted and created, and take
+        # part in move detection.
         paths_deleted = ref_dirsnap.paths - dirsnap.paths
         paths_created = dirsnap.paths - ref_dirsnap.paths
+        for path in paths_replaced:
+            paths_deleted.add(path)
+            paths_created.add(path)
 
-        # Detect all the moves/renames.
+        # Detect all the moves/renames by joining the deleted and created
+        # paths on their device and inode numbers.
         # Doesn't work on Windows, so exlude on Windows.
         if not sys.platform.startswith('win'):
-            for created_path in paths_created.copy():
+            deleted_path_for_inode = dict()
+            for deleted_path in paths_deleted:
+                deleted_stat_info = ref_dirsnap.stat_info(deleted_path)
+                deleted_path_for_inode[(deleted_stat_info.st_dev,
+                                        deleted_stat_info.st_ino)] = deleted_path
+            for created_path in list(paths_created):
                 created_stat_info = dirsnap.stat_info(created_path)
-                for deleted_path in paths_deleted.copy():
-                    deleted_stat_info = ref_dirsnap.stat_info(deleted_path)
-                    if created_stat_info.st_ino == deleted_stat_info.st_ino:
-                        paths_deleted.remove(deleted_path)
-                        paths_created.remove(created_path)
-                        if stat.S_ISDIR(created_stat_info.st_mode):
-                            self._dirs_moved.append((deleted_path, created_path))
-                        else:
-                            self._files_moved.append((deleted_path, created_path))
+                deleted_path = deleted_path_for_inode.pop(
+                    (created_stat_info.st_dev, created_stat_info.st_ino), None)
+                if deleted_path is None:
+                    continue
+                paths_deleted.remove(deleted_path)
+                paths_created.remove(created_path)
+                if stat.S_ISDIR(created_stat_info.st_mode):
+                    self._dirs_moved.append((deleted_path, created_path))
+                else:
+                    self._files_moved.append((deleted_path, created_path))
+
+        if modify_replaced:
+            for path in paths_replaced:
+                if path not in paths_deleted or path not in paths_created:
+                    continue
+                stat_info = dirsnap.stat_info(path)
+                if (stat.S_IFMT(stat_info.st_mode) !=
+                    stat.S_IFMT(ref_dirsnap.stat_info(path).st_mode)):
+                    continue
+                paths_deleted.remove(path)
+                paths_created.remove(path)
+                if stat.S_ISDIR(stat_info.st_mode):
+                    self._dirs_modified.append(path)
+                else:
+                    self._files_modified.append(path)
 
         # Now that we have renames out of the way, enlist the deleted and
         # created files/directories.
@@ -134,6 +276,119 @@ class DirectorySnapshotDiff(object):
                 self._files_created.append(path)
 
 
+    def _diff_vectorised(self, ref_dirsnap, dirsnap, fields,
+                         report_replaced, modify_replaced):
+        """
+        Compares two :class:`CompactDirectorySnapshot` objects with NumPy.
+
+        Entries are matched by path hash with a binary search of the
+        sorted hashes of the reference snapshot, and moves by device and
+        inode numbers. Paths are built only for the entries that changed,
+        and for the entries whose hashes collide with others.
+        """
+        ref = _columns(ref_dirsnap)
+        new = _columns(dirsnap)
+
+        ref_order = numpy.argsort(ref['path_hash'], kind='mergesort')
+        ref_sorted = ref['path_hash'][ref_order]
+        if len(ref_sorted):
+            positions = numpy.minimum(
+                numpy.searchsorted(ref_sorted, new['path_hash']),
+                len(ref_sorted) - 1)
+            found = ref_sorted[positions] == new['path_hash']
+        else:
+            positions = numpy.zeros(len(new['path_hash']), dtype=numpy.intp)
+            found = numpy.zeros(len(new['path_hash']), dtype=bool)
+        common_new, common_ref = _verify_matches(
+            ref_dirsnap, dirsnap, numpy.nonzero(found)[0],
+            ref_order[positions[found]])
+        found = numpy.zeros(len(new['path_hash']), dtype=bool)
+        found[common_new] = True
+
+        # Modifications.
+        replaced = ((new['ino'][common_new] != ref['ino'][common_ref]) |
+                    (new['dev'][common_new] != ref['dev'][common_ref]))
+        modified = numpy.zeros(len(common_new), dtype=bool)
+        for field in fields:
+            column = field[len('st_'):]
+            modified |= new[column][common_new] != ref[column][common_ref]
+        modified_new = common_new[modified & ~replaced]
+        self._append_paths(dirsnap, modified_new, new['is_dir'],
+                           self._dirs_modified, self._files_modified)
+        if not report_replaced:
+            replaced[:] = False
+
+        # Paths replaced by other files are deleted and created, and take
+        # part in move detection.
+        replaced_ref = common_ref[replaced]
+        replaced_new = common_new[replaced]
+        ref_matched = numpy.zeros(len(ref['path_hash']), dtype=bool)
+        ref_matched[common_ref] = True
+        ref_matched[replaced_ref] = False
+        new_matched = found.copy()
+        new_matched[replaced_new] = False
+        deleted_ref = numpy.nonzero(~ref_matched)[0]
+        created_new = numpy.nonzero(~new_matched)[0]
+
+        # Moves/renames: deleted and created entries with the same device
+        # and inode numbers.
+        # Doesn't work on Windows, so exlude on Windows.
+        if (not sys.platform.startswith('win') and len(deleted_ref) and
+            len(created_new)):
+            inode_type = numpy.dtype([('dev', numpy.int64),
+                                      ('ino', numpy.int64)])
+            deleted_inodes = numpy.empty(len(deleted_ref), dtype=inode_type)
+            deleted_inodes['dev'] = ref['dev'][deleted_ref]
+            deleted_inodes['ino'] = ref['ino'][deleted_ref]
+            created_inodes = numpy.empty(len(created_new), dtype=inode_type)
+            created_inodes['dev'] = new['dev'][created_new]
+            created_inodes['ino'] = new['ino'][created_new]
+            _, moved_from, moved_to = numpy.intersect1d(
+                deleted_inodes, created_inodes, return_indices=True)
+            for ref_index, new_index in zip(deleted_ref[moved_from],
+                                            created_new[moved_to]):
+                move = (ref_dirsnap._path_at(ref_index),
+                        dirsnap._path_at(new_index))
+                if new['is_dir'][new_index]:
+                    self._dirs_moved.append(move)
+                else:
+                    self._files_moved.append(move)
+            still_deleted = numpy.ones(len(deleted_ref), dtype=bool)
+            still_deleted[moved_from] = False
+            deleted_ref = deleted_ref[still_deleted]
+            still_created = numpy.ones(len(created_new), dtype=bool)
+            still_created[moved_to] = False
+            created_new = created_new[still_created]
+
+        if modify_replaced and len(replaced_ref):
+            ref_deleted = numpy.zeros(len(ref['path_hash']), dtype=bool)
+            ref_deleted[deleted_ref] = True
+            new_created = numpy.zeros(len(new['path_hash']), dtype=bool)
+            new_created[created_new] = True
+            same_type = ((ref['mode'][replaced_ref] & stat.S_IFMT(0xffffffff)) ==
+                         (new['mode'][replaced_new] & stat.S_IFMT(0xffffffff)))
+            modified = (ref_deleted[replaced_ref] & new_created[replaced_new] &
+                        same_type)
+            ref_deleted[replaced_ref[modified]] = False
+            new_created[replaced_new[modified]] = False
+            deleted_ref = numpy.nonzero(ref_deleted)[0]
+            created_new = numpy.nonzero(new_created)[0]
+            self._append_paths(dirsnap, replaced_new[modified], new['is_dir'],
+                               self._dirs_modified, self._files_modified)
+
+        self._append_paths(ref_dirsnap, deleted_ref, ref['is_dir'],
+                           self._dirs_deleted, self._files_deleted)
+        self._append_paths(dirsnap, created_new, new['is_dir'],
+                           self._dirs_created, self._files_created)
+
+    @staticmethod
+    def _append_paths(dirsnap, indices, is_dir, dirs, files):
+        for index in indices:
+            if is_dir[index]:
+                dirs.append(dirsnap._path_at(index))
+            else:
+                files.append(dirsnap._path_at(index))
+
     @property
     def files_created(self):
         """List of files that were created."""
@@ -207,44 +462,298 @@ class DirectorySnapshot(object):
     :param walker_callback:
         A function with the signature ``walker_callback(path, stat_info)``
         which will be called for every entry in the directory tree.
+    :param structure_only:
+        ``True`` to ``stat`` only directories. The stat information of
+        other entries is made up from the directory listing: their type
+        (a regular file), inode number and the device number of their
+        directory, with the other fields zero. Creations, deletions and
+        moves are still detected, but not modifications of files.
+    :type structure_only:
+        ``bool``
+
+    A snapshot can be brought up to date in place with :meth:`refresh`,
+    which lists again only the directories that changed.
     """
     def __init__(self,
                  path,
                  recursive=True,
                  walker_callback=(lambda p, s: None),
+                 structure_only=False,
                  _copying=False):
         self._path = absolute_path(path)
         self._stat_snapshot = {}
         self._inode_to_path = {}
+        # Names of the entries of every listed directory.
+        self._entries = {}
+        # Directories modified too recently to trust their modification
+        # time; they are listed again on the next refresh.
+        self._racy_directories = set()
         self.is_recursive = recursive
+        self.is_structure_only = structure_only
 
         if not _copying:
             stat_info = os.stat(self._path)
             self._stat_snapshot[self._path] = stat_info
             self._inode_to_path[stat_info.st_ino] = self._path
             walker_callback(self._path, stat_info)
+            self._walk(self._path, walker_callback)
 
-            for root, directories, files in path_walk(self._path, recursive):
-                for directory_name in directories:
-                    try:
-                        directory_path = os.path.join(root, directory_name)
-                        stat_info = os.stat(directory_path)
-                        self._stat_snapshot[directory_path] = stat_info
-                        self._inode_to_path[stat_info.st_ino] = directory_path
-                        walker_callback(directory_path, stat_info)
-                    except OSError:
-                        continue
+    def _walk(self, path, walker_callback, added=None):
+        """
+        Adds the entries of a directory tree to the snapshot, and to the
+        ``added`` snapshot if given.
+        """
+        if self.is_structure_only:
+            self._walk_structure(path, walker_callback, added)
+            return
+        for root, directories, files in path_walk(path, self.is_recursive):
+            listed = time.time()
+            names = set()
+            for name in directories + files:
+                try:
+                    entry_path = os.path.join(root, name)
+                    stat_info = os.stat(entry_path)
+                except OSError:
+                    continue
+                names.add(name)
+                self._set_stat_info(entry_path, stat_info)
+                if added is not None:
+                    added._set_stat_info(entry_path, stat_info)
+                walker_callback(entry_path, stat_info)
+            self._entries[root] = names
+            self._check_racy(root, listed)
 
-                for file_name in files:
-                    try:
-                        file_path = os.path.join(root, file_name)
-                        stat_info = os.stat(file_path)
-                        self._stat_snapshot[file_path] = stat_info
-                        self._inode_to_path[stat_info.st_ino] = file_path
-                        walker_callback(file_path, stat_info)
-                    except OSError:
+    def _walk_structure(self, path, walker_callback, added):
+        """
+        Same as :meth:`_walk` for a structure-only snapshot.
+        """
+        directories = [path]
+        while directories:
+            root = directories.pop()
+            listed = time.time()
+            try:
+                entries = list(iter_entries(root))
+            except OSError:
+                continue
+            names = set()
+            for name, is_directory, inode in entries:
+                entry_path = os.path.join(root, name)
+                stat_info = self._entry_stat_info(root, entry_path,
+                                                  is_directory, inode)
+                if stat_info is None:
+                    continue
+                names.add(name)
+                self._set_stat_info(entry_path, stat_info)
+                if added is not None:
+                    added._set_stat_info(entry_path, stat_info)
+                walker_callback(entry_path, stat_info)
+                if is_directory and self.is_recursive:
+                    directories.append(entry_path)
+            self._entries[root] = names
+            self._check_racy(root, listed)
+
+    def _entry_stat_info(self, directory, path, is_directory, inode):
+        """
+        Returns the stat information of an entry of a listed directory, or
+        ``None`` if it is gone. Files of a structure-only snapshot are not
+        ``stat``-ed.
+        """
+        if is_directory or not self.is_structure_only:
+            try:
+                return os.stat(path)
+            except OSError:
+                return None
+        return os.stat_result((stat.S_IFREG, inode,
+                               self._stat_snapshot[directory].st_dev,
+                               0, 0, 0, 0, 0, 0, 0))
+
+    def _check_racy(self, path, listed):
+        stat_info = self._stat_snapshot.get(path)
+        if (stat_info is not None and
+            stat_info.st_mtime >= listed - RACY_MTIME_WINDOW):
+            self._racy_directories.add(path)
+
+    def _set_stat_info(self, path, stat_info):
+        self._stat_snapshot[path] = stat_info
+        self._inode_to_path[stat_info.st_ino] = path
+
+    def _remove(self, path, removed, keep_path=False):
+        """
+        Removes a path and, for a listed directory, its entries from the
+        snapshot, recording their stat information in ``removed``.
+        """
+        names = self._entries.pop(path, None)
+        if names is not None:
+            self._racy_directories.discard(path)
+            for name in names:
+                self._remove(os.path.join(path, name), removed)
+        if keep_path:
+            return
+        stat_info = self._stat_snapshot.pop(path, None)
+        if stat_info is None:
+            return
+        removed._set_stat_info(path, stat_info)
+        if self._inode_to_path.get(stat_info.st_ino) == path:
+            del self._inode_to_path[stat_info.st_ino]
+
+    def refresh(self, stat_files=True, walker_callback=(lambda p, s: None),
+                directories=None, change_fields=DEFAULT_CHANGE_FIELDS,
+                report_replaced=False):
+        """
+        Brings the snapshot up to date in place and returns the changes.
+
+        Every directory is ``stat``-ed again, but only the directories whose
+        modification time changed are listed again, since creating,
+        deleting or renaming an entry updates the modification time of its
+        directory.
+
+        :param stat_files:
+            ``True`` to ``stat`` every file again to detect modifications;
+            ``False`` to ``stat`` only the files of the directories listed
+            again, so that a quiet tree costs one ``stat`` per directory.
+            Ignored by structure-only snapshots, which never ``stat`` files.
+        :param walker_callback:
+            A function with the signature ``walker_callback(path,
+            stat_info)`` which will be called for every entry ``stat``-ed.
+        :param directories:
+            If given, the listed directories of the snapshot to bring up to
+            date, each without its subdirectories; the other directories
+            keep their state until they are refreshed. Directories not in
+            the snapshot are ignored. A rename between a refreshed directory
+            and one that is not is reported as a deletion and a creation.
+        :param change_fields:
+            The stat fields compared to tell whether a path was modified;
+            see :class:`DirectorySnapshotDiff`.
+        :param report_replaced:
+            Whether a path replaced by another file is reported; see
+            :class:`DirectorySnapshotDiff`.
+        :returns:
+            A :class:`DirectorySnapshotDiff` of the changes.
+        :raises:
+            :class:`OSError` if the snapshotted directory is gone.
+        """
+        # Stat information of the changed paths before and after.
+        before = DirectorySnapshot(self._path, self.is_recursive,
+                                   _copying=True)
+        after = DirectorySnapshot(self._path, self.is_recursive,
+                                  _copying=True)
+        racy_directories = self._racy_directories
+        stat_files = stat_files and not self.is_structure_only
+        if directories is None:
+            self._racy_directories = set()
+            stat_info = os.stat(self._path)
+            walker_callback(self._path, stat_info)
+            stack = [(self._path, stat_info)]
+            # Listed subdirectories to refresh too.
+            subdirectories = stack
+        else:
+            directories = [path for path in directories
+                           if path in self._entries]
+            self._racy_directories = racy_directories.difference(directories)
+            stack = []
+            for path in directories:
+                try:
+                    stat_info = os.stat(path)
+                except OSError:
+                    if path == self._path:
+                        raise
+                    # Gone; its parent has changed too.
+                    continue
+                walker_callback(path, stat_info)
+                stack.append((path, stat_info))
+            subdirectories = []
+        while stack:
+            path, stat_info = stack.pop()
+            if path not in self._entries:
+                # Removed while relisting its parent.
+                continue
+            ref_stat_info = self._stat_snapshot[path]
+            is_changed = _is_changed(ref_stat_info, stat_info)
+            if is_changed:
+                before._set_stat_info(path, ref_stat_info)
+                after._set_stat_info(path, stat_info)
+                self._set_stat_info(path, stat_info)
+            if is_changed or path in racy_directories:
+                self._relist(path, before, after, subdirectories,
+                             walker_callback)
+                continue
+            for name in self._entries[path]:
+                entry_path = os.path.join(path, name)
+                if entry_path in self._entries:
+                    if subdirectories is not stack:
                         continue
+                elif not stat_files:
+                    continue
+                try:
+                    entry_stat_info = os.stat(entry_path)
+                except OSError:
+                    # Gone without touching the directory yet.
+                    self._racy_directories.add(path)
+                    continue
+                walker_callback(entry_path, entry_stat_info)
+                if entry_path in self._entries:
+                    stack.append((entry_path, entry_stat_info))
+                    continue
+                ref_stat_info = self._stat_snapshot[entry_path]
+                if _is_changed(ref_stat_info, entry_stat_info):
+                    before._set_stat_info(entry_path, ref_stat_info)
+                    after._set_stat_info(entry_path, entry_stat_info)
+                    self._set_stat_info(entry_path, entry_stat_info)
+        return DirectorySnapshotDiff(before, after, change_fields,
+                                     report_replaced)
 
+    @property
+    def directories(self):
+        """
+        The listed directories of the snapshot, which are all its
+        directories if it is recursive.
+        """
+        return list(self._entries)
+
+    def _relist(self, path, before, after, stack, walker_callback):
+        """
+        Lists a changed directory again, updating the snapshot with its
+        created, deleted and changed entries.
+        """
+        listed = time.time()
+        try:
+            entries = list(iter_entries(path))
+        except OSError:
+            # Gone; its parent has changed too.
+            return
+        old_names = self._entries.get(path, set())
+        names = set()
+        for name, is_directory, inode in entries:
+            entry_path = os.path.join(path, name)
+            stat_info = self._entry_stat_info(path, entry_path, is_directory,
+                                              inode)
+            if stat_info is None:
+                continue
+            walker_callback(entry_path, stat_info)
+            names.add(name)
+            is_listed = is_directory and self.is_recursive
+            ref_stat_info = self._stat_snapshot.get(entry_path)
+            if ref_stat_info is None:
+                self._set_stat_info(entry_path, stat_info)
+                after._set_stat_info(entry_path, stat_info)
+                if is_listed:
+                    self._walk(entry_path, walker_callback, after)
+                continue
+            if is_listed and entry_path in self._entries:
+                stack.append((entry_path, stat_info))
+                continue
+            # A file, or a file replaced by a directory or vice versa.
+            self._remove(entry_path, before, keep_path=True)
+            if _is_changed(ref_stat_info, stat_info):
+                before._set_stat_info(entry_path, ref_stat_info)
+                after._set_stat_info(entry_path, stat_info)
+                self._set_stat_info(entry_path, stat_info)
+            if is_listed:
+                self._walk(entry_path, walker_callback, after)
+        for name in old_names - names:
+            self._remove(os.path.join(path, name), before)
+        self._entries[path] = names
+        self._check_racy(path, listed)
 
     def __sub__(self, previous_dirsnap):
         """Allow subtracting a DirectorySnapshot object instance from
@@ -323,3 +832,705 @@ class DirectorySnapshot(object):
     def __repr__(self):
         return str(self._stat_snapshot)
 
+
+
+def _int64_typecode():
+    """
+    Returns the typecode of 64-bit signed integer arrays, or of double
+    arrays where there is none.
+    """
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            continue
+    return 'd'
+
+INT64_TYPECODE = _int64_typecode()
+
+
+def _can_diff_vectorised(dirsnap):
+    """
+    Determines whether a snapshot can be compared with NumPy: the path
+    hashes used to match entries must be 64-bit for collisions to be
+    negligible.
+    """
+    return (numpy is not None and
+            isinstance(dirsnap, CompactDirectorySnapshot) and
+            INT64_TYPECODE != 'd' and
+            sys.maxsize > 2 ** 32)
+
+
+def _columns(dirsnap):
+    """
+    Returns NumPy arrays over the columns of a
+    :class:`CompactDirectorySnapshot`, sharing their memory.
+    """
+    mode = numpy.frombuffer(dirsnap._mode, dtype=dirsnap._mode.typecode)
+    return dict(path_hash=numpy.frombuffer(dirsnap._path_hash,
+                                           dtype=numpy.int64),
+                dev=numpy.frombuffer(dirsnap._dev, dtype=numpy.int64),
+                ino=numpy.frombuffer(dirsnap._ino, dtype=numpy.int64),
+                size=numpy.frombuffer(dirsnap._size, dtype=numpy.int64),
+                mtime_ns=numpy.frombuffer(dirsnap._mtime_ns,
+                                          dtype=numpy.int64),
+                ctime_ns=numpy.frombuffer(dirsnap._ctime_ns,
+                                          dtype=numpy.int64),
+                mode=mode,
+                is_dir=(mode & stat.S_IFMT(0xffffffff)) == stat.S_IFDIR)
+
+
+def _verify_matches(ref_dirsnap, dirsnap, common_new, common_ref):
+    """
+    Checks entries of two :class:`CompactDirectorySnapshot` objects matched
+    by path hash against their actual paths, and returns the matches that
+    hold as ``(common_new, common_ref)`` index arrays.
+
+    Two entries have the same path if they have the same name and their
+    parent directories have the same path, which is checked for all
+    matches at once, parents before children. Entries matched wrongly
+    because their hashes collide are looked up again by path.
+    """
+    new_names = dict()
+    for index, name in enumerate(dirsnap._names):
+        new_names[name] = index
+    # Index in the names of the new snapshot of every name of the
+    # reference, or -1.
+    ref_name_in_new = numpy.array([new_names.get(name, -1)
+                                   for name in ref_dirsnap._names],
+                                  dtype=numpy.intp)
+    new_name = numpy.frombuffer(dirsnap._name, dtype=numpy.intc)
+    ref_name = numpy.frombuffer(ref_dirsnap._name, dtype=numpy.intc)
+    new_parent = numpy.frombuffer(dirsnap._parent, dtype=numpy.intc)
+    ref_parent = numpy.frombuffer(ref_dirsnap._parent, dtype=numpy.intc)
+
+    # Reference entry matched with every entry of the new snapshot, or -1.
+    match = numpy.empty(len(new_name), dtype=numpy.intp)
+    match.fill(-1)
+    match[common_new] = common_ref
+    mismatched = []
+    while len(common_new):
+        parents = new_parent[common_new]
+        holds = ((ref_name_in_new[ref_name[common_ref]] ==
+                  new_name[common_new]) &
+                 (match[numpy.maximum(parents, 0)] ==
+                  ref_parent[common_ref]))
+        # Both roots, whose names are their paths.
+        holds |= ((parents < 0) & (ref_parent[common_ref] < 0) &
+                  (ref_dirsnap._path == dirsnap._path))
+        if holds.all():
+            break
+        # The children of the entries matched wrongly are checked again.
+        match[common_new[~holds]] = -1
+        mismatched.append(common_new[~holds])
+        common_new = common_new[holds]
+        common_ref = common_ref[holds]
+    if not mismatched:
+        return common_new, common_ref
+    extra_new = []
+    extra_ref = []
+    for index in numpy.concatenate(mismatched):
+        ref_index = ref_dirsnap._index_for_path(dirsnap._path_at(index))
+        if ref_index is not None:
+            extra_new.append(index)
+            extra_ref.append(ref_index)
+    return (numpy.concatenate([common_new,
+                               numpy.array(extra_new, dtype=numpy.intp)]),
+            numpy.concatenate([common_ref,
+                               numpy.array(extra_ref, dtype=numpy.intp)]))
+
+
+class _StatSnapshotView(object):
+    """
+    Read-only dictionary-like view of the stat information of a
+    :class:`CompactDirectorySnapshot` with file paths being keys.
+    """
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def __len__(self):
+        return len(self._snapshot)
+
+    def __contains__(self, path):
+        return self._snapshot._index_for_path(path) is not None
+
+    def __getitem__(self, path):
+        return self._snapshot.stat_info(path)
+
+    def __iter__(self):
+        for _, path in self._snapshot._iter_paths():
+            yield path
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        stat_info_at = self._snapshot._stat_info_at
+        return [(path, stat_info_at(index))
+                for index, path in self._snapshot._iter_paths()]
+
+
+class CompactDirectorySnapshot(object):
+    """
+    A snapshot of stat information of files in a directory, stored in
+    compact columns instead of one ``os.stat_result`` per path.
+
+    The device and inode numbers, mode, size and modification and status
+    change times (in nanoseconds) of the entries are kept in arrays. A path is stored as
+    the index of its parent directory and the index of its name in a
+    table of names, each distinct name being stored once. The entries of
+    every directory are stored next to each other, sorted by name, and
+    paths are looked up by binary search, so that no dictionary is kept
+    per entry. A hash of every path is kept as well, to match entries when
+    two snapshots are compared with NumPy.
+
+    The snapshot can be used in place of a :class:`DirectorySnapshot`,
+    including with :class:`DirectorySnapshotDiff` and
+    :class:`watchdog.observers.polling.PollingEmitter`, and can be brought
+    up to date with :meth:`refresh`. The stat information it returns has
+    only the fields above; the others are zero.
+
+    It trades time for memory: :meth:`refresh` builds every column again,
+    so each refresh takes time in proportion to the size of the whole
+    tree, however few directories changed, whereas
+    :meth:`DirectorySnapshot.refresh` only updates the changed paths.
+
+    :param path:
+        The directory path for which a snapshot should be taken.
+    :type path:
+        ``str``
+    :param recursive:
+        ``True`` if the entired directory tree should be included in the
+        snapshot; ``False`` otherwise.
+    :type recursive:
+        ``bool``
+    :param walker_callback:
+        A function with the signature ``walker_callback(path, stat_info)``
+        which will be called for every entry in the directory tree.
+    """
+    def __init__(self,
+                 path,
+                 recursive=True,
+                 walker_callback=(lambda p, s: None),
+                 _copying=False):
+        self._path = absolute_path(path)
+        self.is_recursive = recursive
+        self._names = []
+        self._parent = array('i')
+        self._name = array('i')
+        self._first_entry = array('i')
+        self._entry_count = array('i')
+        self._dev = array(INT64_TYPECODE)
+        self._ino = array(INT64_TYPECODE)
+        self._mode = array('I')
+        self._size = array(INT64_TYPECODE)
+        self._mtime_ns = array(INT64_TYPECODE)
+        self._ctime_ns = array(INT64_TYPECODE)
+        # Hashes of the paths, to match entries across snapshots.
+        self._path_hash = array(INT64_TYPECODE)
+        # Entry indices sorted by inode number, built when first needed.
+        self._inode_order = None
+        # Directories modified too recently to trust their modification
+        # time; they are listed again on the next refresh.
+        self._racy_directories = set()
+        if _copying:
+            return
+
+        name_index = dict()
+        stat_info = os.stat(self._path)
+        self._append(-1, self._intern(self._path, name_index), self._path,
+                     stat_info)
+        walker_callback(self._path, stat_info)
+        # Indices of the directories yet to be listed.
+        directory_index = {self._path: 0}
+        for root, directories, files in path_walk(self._path, recursive):
+            index = directory_index.pop(root, None)
+            if index is None:
+                continue
+            listed = time.time()
+            self._first_entry[index] = len(self._parent)
+            names = directories + files
+            names.sort()
+            is_directory = set(directories)
+            for name in names:
+                entry_path = os.path.join(root, name)
+                try:
+                    stat_info = os.stat(entry_path)
+                except OSError:
+                    continue
+                if name in is_directory:
+                    directory_index[entry_path] = len(self._parent)
+                self._append(index, self._intern(name, name_index),
+                             entry_path, stat_info)
+                walker_callback(entry_path, stat_info)
+            self._entry_count[index] = (len(self._parent) -
+                                        self._first_entry[index])
+            self._check_racy(index, root, listed)
+
+    def _intern(self, name, name_index):
+        try:
+            return name_index[name]
+        except KeyError:
+            index = len(self._names)
+            self._names.append(name)
+            name_index[name] = index
+            return index
+
+    def _append(self, parent, name, path, stat_info):
+        self._parent.append(parent)
+        self._name.append(name)
+        self._first_entry.append(0)
+        self._entry_count.append(0)
+        self._dev.append(stat_info.st_dev)
+        self._ino.append(stat_info.st_ino)
+        self._mode.append(stat_info.st_mode)
+        self._size.append(stat_info.st_size)
+        self._mtime_ns.append(_mtime_ns(stat_info))
+        self._ctime_ns.append(_ctime_ns(stat_info))
+        self._path_hash.append(hash(path))
+
+    def _append_from(self, parent, name, snapshot, index):
+        """
+        Appends an entry with the stat information of an entry of another
+        snapshot of the same directory.
+        """
+        self._parent.append(parent)
+        self._name.append(name)
+        self._first_entry.append(0)
+        self._entry_count.append(0)
+        self._dev.append(snapshot._dev[index])
+        self._ino.append(snapshot._ino[index])
+        self._mode.append(snapshot._mode[index])
+        self._size.append(snapshot._size[index])
+        self._mtime_ns.append(snapshot._mtime_ns[index])
+        self._ctime_ns.append(snapshot._ctime_ns[index])
+        self._path_hash.append(snapshot._path_hash[index])
+
+    def _set_stat_info_at(self, index, stat_info):
+        self._dev[index] = stat_info.st_dev
+        self._ino[index] = stat_info.st_ino
+        self._mode[index] = stat_info.st_mode
+        self._size[index] = stat_info.st_size
+        self._mtime_ns[index] = _mtime_ns(stat_info)
+        self._ctime_ns[index] = _ctime_ns(stat_info)
+
+    def _is_changed_at(self, index, snapshot, snapshot_index):
+        """
+        Determines whether an entry changed from an entry of another
+        snapshot, like :func:`_is_changed`.
+        """
+        return (self._ino[index] != snapshot._ino[snapshot_index] or
+                self._size[index] != snapshot._size[snapshot_index] or
+                self._mode[index] != snapshot._mode[snapshot_index] or
+                self._mtime_ns[index] != snapshot._mtime_ns[snapshot_index] or
+                self._ctime_ns[index] != snapshot._ctime_ns[snapshot_index])
+
+    def _check_racy(self, index, path, listed):
+        if self._mtime_ns[index] >= (listed - RACY_MTIME_WINDOW) * 1e9:
+            self._racy_directories.add(path)
+
+    def refresh(self, stat_files=True, walker_callback=(lambda p, s: None),
+                directories=None, change_fields=DEFAULT_CHANGE_FIELDS,
+                report_replaced=False):
+        """
+        Brings the snapshot up to date and returns the changes; see
+        :meth:`DirectorySnapshot.refresh`, whose parameters it takes.
+
+        The columns are built again in full, entry by entry, copying the
+        entries of the directories that did not change from the previous
+        columns instead of listing and ``stat``-ing them again. Even when
+        ``directories`` is given, every entry of the snapshot is copied.
+
+        :returns:
+            A :class:`DirectorySnapshotDiff` of the changes.
+        :raises:
+            :class:`OSError` if the snapshotted directory is gone.
+        """
+        if directories is not None:
+            directories = set(directories)
+        refresh = _CompactRefresh(self, stat_files, walker_callback,
+                                  directories)
+        refresh.run()
+        diff = DirectorySnapshotDiff(refresh.before, refresh.after,
+                                     change_fields, report_replaced)
+        self.__dict__.update(refresh.snapshot.__dict__)
+        return diff
+
+    @property
+    def directories(self):
+        """
+        The listed directories of the snapshot, which are all its
+        directories if it is recursive.
+        """
+        if not self.is_recursive:
+            return [self._path]
+        mode = self._mode
+        return [path for index, path in self._iter_paths()
+                if stat.S_ISDIR(mode[index])]
+
+    def __len__(self):
+        return len(self._parent)
+
+    def __sub__(self, previous_dirsnap):
+        """Allow subtracting a snapshot from another.
+
+        :returns:
+            A :class:`DirectorySnapshotDiff` object.
+        """
+        return DirectorySnapshotDiff(previous_dirsnap, self)
+
+    def _index_for_path(self, path):
+        """
+        Returns the index of the entry for a path, or ``None`` if the path
+        is not in the snapshot.
+        """
+        if path == self._path:
+            return 0
+        prefix = os.path.join(self._path, '')
+        if not path.startswith(prefix):
+            return None
+        names = self._names
+        name = self._name
+        index = 0
+        for component in path[len(prefix):].split(os.sep):
+            low = self._first_entry[index]
+            high = low + self._entry_count[index]
+            while low < high:
+                middle = (low + high) // 2
+                if names[name[middle]] < component:
+                    low = middle + 1
+                else:
+                    high = middle
+            if (low == self._first_entry[index] + self._entry_count[index] or
+                names[name[low]] != component):
+                return None
+            index = low
+        return index
+
+    def _path_at(self, index):
+        components = []
+        while index > 0:
+            components.append(self._names[self._name[index]])
+            index = self._parent[index]
+        components.append(self._path)
+        components.reverse()
+        return os.path.join(*components)
+
+    def _iter_paths(self):
+        """
+        Yields an ``(index, path)`` tuple for every entry.
+        """
+        # Paths of the directories whose entries are yet to come.
+        directory_paths = {0: self._path}
+        yield 0, self._path
+        names = self._names
+        for index in range(1, len(self._parent)):
+            parent = self._parent[index]
+            path = os.path.join(directory_paths[parent],
+                                names[self._name[index]])
+            if index == (self._first_entry[parent] +
+                         self._entry_count[parent] - 1):
+                del directory_paths[parent]
+            if self._entry_count[index]:
+                directory_paths[index] = path
+            yield index, path
+
+    def _stat_info_at(self, index):
+        mtime_ns = int(self._mtime_ns[index])
+        ctime_ns = int(self._ctime_ns[index])
+        return _stat_result(self._mode[index],
+                            int(self._ino[index]),
+                            int(self._dev[index]),
+                            int(self._size[index]),
+                            mtime_ns / 1e9,
+                            ctime_ns / 1e9,
+                            mtime_ns,
+                            ctime_ns)
+
+    @property
+    def stat_snapshot(self):
+        """
+        Returns a read-only dictionary-like view of stat information with
+        file paths being keys.
+        """
+        return _StatSnapshotView(self)
+
+    def stat_info(self, path):
+        """
+        Returns a stat information object for the specified path from
+        the snapshot.
+
+        :param path:
+            The path for which stat information should be obtained
+            from a snapshot.
+        :raises:
+            :class:`KeyError` if the path is not in the snapshot.
+        """
+        index = self._index_for_path(path)
+        if index is None:
+            raise KeyError(path)
+        return self._stat_info_at(index)
+
+    def path_for_inode(self, inode):
+        """
+        Determines the path that an inode represents in a snapshot.
+
+        :param inode:
+            inode number.
+        :raises:
+            :class:`KeyError` if no entry has the inode number.
+        """
+        if self._inode_order is None:
+            ino = self._ino
+            self._inode_order = array('i', sorted(range(len(ino)),
+                                                  key=ino.__getitem__))
+        order = self._inode_order
+        low = 0
+        high = len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if self._ino[order[middle]] < inode:
+                low = middle + 1
+            else:
+                high = middle
+        if low == len(order) or self._ino[order[low]] != inode:
+            raise KeyError(inode)
+        return self._path_at(order[low])
+
+    def stat_info_for_inode(self, inode):
+        """
+        Determines stat information for a given inode.
+
+        :param inode:
+            inode number.
+        """
+        return self.stat_info(self.path_for_inode(inode))
+
+    @property
+    def paths(self):
+        """
+        List of file/directory paths in the snapshot.
+        """
+        return set([path for _, path in self._iter_paths()])
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return '<CompactDirectorySnapshot: path=%s, entries=%d>' % (
+            self._path, len(self))
+
+
+class _CompactRefresh(object):
+    """
+    Builds the columns of a :class:`CompactDirectorySnapshot` brought up to
+    date, copying the entries of the directories that did not change from
+    the previous snapshot, and records the stat information of the changed
+    entries before and after in two :class:`DirectorySnapshot` objects.
+
+    The rows are not patched in place: the entries of a directory are kept
+    next to each other, so adding or removing one would shift all the rows
+    after it and the indices that refer to them. Every entry is therefore
+    visited once per refresh.
+    """
+    def __init__(self, previous, stat_files, walker_callback, directories):
+        self.previous = previous
+        self.snapshot = CompactDirectorySnapshot(previous._path,
+                                                 previous.is_recursive,
+                                                 _copying=True)
+        self.before = DirectorySnapshot(previous._path,
+                                        previous.is_recursive,
+                                        _copying=True)
+        self.after = DirectorySnapshot(previous._path, previous.is_recursive,
+                                       _copying=True)
+        self.stat_files = stat_files
+        self.walker_callback = walker_callback
+        self.directories = directories
+        self._name_index = dict()
+        # Directories whose entries are yet to be added, as ``(index,
+        # previous_index, path, is_fresh)`` tuples: ``previous_index`` is
+        # ``None`` for a new directory, and ``is_fresh`` tells whether the
+        # directory was ``stat``-ed again already.
+        self._pending = deque()
+
+    def _is_due(self, path):
+        return self.directories is None or path in self.directories
+
+    def run(self):
+        path = self.previous._path
+        if self._is_due(path):
+            stat_info = os.stat(path)
+            self.walker_callback(path, stat_info)
+            self._add(-1, path, path, stat_info, 0)
+        else:
+            self._copy(-1, path, path, 0)
+        snapshot = self.snapshot
+        while self._pending:
+            index, previous_index, path, is_fresh = self._pending.popleft()
+            snapshot._first_entry[index] = len(snapshot)
+            if previous_index is None:
+                self._list(index, path, None)
+            elif not self._is_due(path):
+                self._copy_entries(index, previous_index, path, False)
+            else:
+                if not is_fresh:
+                    try:
+                        stat_info = os.stat(path)
+                    except OSError:
+                        # Gone; its parent has changed too.
+                        stat_info = None
+                    if stat_info is None:
+                        self._copy_entries(index, previous_index, path,
+                                           False)
+                        snapshot._entry_count[index] = (
+                            len(snapshot) - snapshot._first_entry[index])
+                        continue
+                    self.walker_callback(path, stat_info)
+                    self._update(index, path, stat_info, previous_index)
+                if (snapshot._is_changed_at(index, self.previous,
+                                            previous_index) or
+                    path in self.previous._racy_directories):
+                    self._list(index, path, previous_index)
+                else:
+                    self._copy_entries(index, previous_index, path,
+                                       self.stat_files)
+            snapshot._entry_count[index] = (len(snapshot) -
+                                            snapshot._first_entry[index])
+
+    def _add(self, parent, name, path, stat_info, previous_index):
+        """
+        Appends an entry with fresh stat information, recording it as
+        created or changed.
+        """
+        previous = self.previous
+        snapshot = self.snapshot
+        index = len(snapshot)
+        snapshot._append(parent, snapshot._intern(name, self._name_index),
+                         path, stat_info)
+        is_directory = stat.S_ISDIR(stat_info.st_mode)
+        was_directory = False
+        if previous_index is None:
+            self.after._set_stat_info(path, stat_info)
+        else:
+            was_directory = stat.S_ISDIR(previous._mode[previous_index])
+            if snapshot._is_changed_at(index, previous, previous_index):
+                self.before._set_stat_info(
+                    path, previous._stat_info_at(previous_index))
+                self.after._set_stat_info(path, stat_info)
+            if was_directory and not is_directory:
+                self._remove_entries(previous_index, path)
+        if is_directory and (parent == -1 or snapshot.is_recursive):
+            if not was_directory:
+                previous_index = None
+            self._pending.append((index, previous_index, path, True))
+
+    def _copy(self, parent, name, path, previous_index):
+        """
+        Appends an entry with the stat information of the previous
+        snapshot.
+        """
+        previous = self.previous
+        snapshot = self.snapshot
+        index = len(snapshot)
+        snapshot._append_from(parent,
+                              snapshot._intern(name, self._name_index),
+                              previous, previous_index)
+        if (stat.S_ISDIR(previous._mode[previous_index]) and
+            (parent == -1 or snapshot.is_recursive)):
+            self._pending.append((index, previous_index, path, False))
+
+    def _update(self, index, path, stat_info, previous_index):
+        """
+        Sets fresh stat information of an entry, recording it if changed.
+        """
+        snapshot = self.snapshot
+        snapshot._set_stat_info_at(index, stat_info)
+        if snapshot._is_changed_at(index, self.previous, previous_index):
+            self.before._set_stat_info(
+                path, self.previous._stat_info_at(previous_index))
+            self.after._set_stat_info(path, stat_info)
+
+    def _copy_entries(self, index, previous_index, path, stat_files):
+        """
+        Appends the entries of a directory that did not change, ``stat``-ing
+        its files again if ``stat_files`` is ``True``.
+        """
+        previous = self.previous
+        if path in previous._racy_directories:
+            self.snapshot._racy_directories.add(path)
+        first = previous._first_entry[previous_index]
+        for previous_entry in range(
+                first, first + previous._entry_count[previous_index]):
+            name = previous._names[previous._name[previous_entry]]
+            entry_path = os.path.join(path, name)
+            if (stat_files and
+                not stat.S_ISDIR(previous._mode[previous_entry])):
+                try:
+                    stat_info = os.stat(entry_path)
+                except OSError:
+                    # Gone without touching the directory yet.
+                    self.snapshot._racy_directories.add(path)
+                    stat_info = None
+                if stat_info is not None:
+                    self.walker_callback(entry_path, stat_info)
+                    self._add(index, name, entry_path, stat_info,
+                              previous_entry)
+                    continue
+            self._copy(index, name, entry_path, previous_entry)
+
+    def _list(self, index, path, previous_index):
+        """
+        Lists a new or changed directory, appending its entries and
+        recording the created, deleted and changed ones.
+        """
+        listed = time.time()
+        try:
+            entries = list(iter_entries(path))
+        except OSError:
+            # Gone; its parent has changed too.
+            if previous_index is not None:
+                self._copy_entries(index, previous_index, path, False)
+            return
+        previous = self.previous
+        previous_entries = dict()
+        if previous_index is not None:
+            first = previous._first_entry[previous_index]
+            for previous_entry in range(
+                    first, first + previous._entry_count[previous_index]):
+                previous_entries[previous._names[
+                        previous._name[previous_entry]]] = previous_entry
+        entries.sort()
+        for name, _, _ in entries:
+            entry_path = os.path.join(path, name)
+            try:
+                stat_info = os.stat(entry_path)
+            except OSError:
+                continue
+            self.walker_callback(entry_path, stat_info)
+            self._add(index, name, entry_path, stat_info,
+                      previous_entries.pop(name, None))
+        for name, previous_entry in previous_entries.items():
+            entry_path = os.path.join(path, name)
+            self.before._set_stat_info(
+                entry_path, previous._stat_info_at(previous_entry))
+            self._remove_entries(previous_entry, entry_path)
+        self.snapshot._check_racy(index, path, listed)
+
+    def _remove_entries(self, previous_index, path):
+        """
+        Records the entries of a directory of the previous snapshot, and
+        theirs, as deleted.
+        """
+        previous = self.previous
+        directories = [(previous_index, path)]
+        while directories:
+            previous_index, path = directories.pop()
+            first = previous._first_entry[previous_index]
+            for previous_entry in range(
+                    first, first + previous._entry_count[previous_index]):
+                entry_path = os.path.join(
+                    path, previous._names[previous._name[previous_entry]])
+                self.before._set_stat_info(
+                    entry_path, previous._stat_info_at(previous_entry))
+                directories.append((previous_entry, entry_path))
@@ -0,0 +1,424 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+:module: watchdog.utils.snapshotfile
+:synopsis: Directory snapshots saved to and loaded from disk.
+:author: Yesudeep Mangalapilly <yesudeep@gmail.com>
+
+A :class:`watchdog.utils.dirsnapshot.DirectorySnapshot` saved to a file can
+be loaded again after a restart and compared with the directory tree as it
+is then, reporting the changes made in the meantime.
+
+File format
+-----------
+All numbers are little-endian. The file starts with a header::
+
+    char     magic[8];      /* "WDSNAP\\0\\0" */
+    uint32_t version;       /* FORMAT_VERSION */
+    uint32_t flags;         /* 1 if recursive, 2 if structure-only */
+    uint64_t entry_count;
+    uint64_t names_length;  /* Length of the name table in bytes */
+    uint32_t checksum;      /* CRC-32 of everything after the header */
+    uint32_t reserved;
+
+which is followed by one column per field, each holding ``entry_count``
+values: the ``int64`` columns ``st_dev``, ``st_ino``, ``st_size``,
+``st_mtime`` and ``st_ctime`` in nanoseconds, the ``double`` columns
+``st_mtime`` and ``st_ctime`` in seconds (as ``os.stat`` reported them,
+for Pythons whose stat information has no times in nanoseconds), and the
+``int32`` columns ``st_mode``, parent entry index, name index and entry
+flags. Last comes the table of names, separated by null bytes. The first
+entry is the snapshotted directory; its name is its absolute path. Every
+column starts at a multiple of 8 bytes, so the file can be memory-mapped
+and its columns used in place.
+
+Files are written to a temporary file that is then renamed over the
+previous file, so a file is either complete or absent.
+
+Functions
+---------
+.. autofunction:: save_snapshot
+
+.. autofunction:: load_snapshot
+
+.. autofunction:: snapshot_file_name
+
+Classes
+-------
+.. autoclass:: SnapshotCheckpoint
+   :members:
+"""
+
+import os
+import sys
+import mmap
+import struct
+import zlib
+import hashlib
+import tempfile
+import time
+
+from array import array
+from pathtools.path import absolute_path
+
+from watchdog.utils.dirsnapshot import \
+    DirectorySnapshot, \
+    _mtime_ns, \
+    _ctime_ns, \
+    _stat_result
+
+MAGIC = 'WDSNAP\0\0'
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct('<8sIIQQII')
+
+FLAG_RECURSIVE = 1
+FLAG_STRUCTURE_ONLY = 2
+
+# Minimum interval (in seconds) between saves of a changing snapshot.
+DEFAULT_CHECKPOINT_INTERVAL = 60
+
+# Entry flags.
+ENTRY_LISTED = 1
+ENTRY_RACY = 2
+
+# Columns in the order they are stored, with their array typecodes.
+INT64_COLUMNS = ('dev', 'ino', 'size', 'mtime_ns', 'ctime_ns')
+DOUBLE_COLUMNS = ('mtime', 'ctime')
+INT32_COLUMNS = ('mode', 'parent', 'name', 'flags')
+
+
+def _int64_typecode():
+    for typecode in ('q', 'l'):
+        try:
+            if array(typecode).itemsize == 8:
+                return typecode
+        except ValueError:
+            continue
+    raise ImportError("No 64-bit integer array type on this platform")
+
+INT64_TYPECODE = _int64_typecode()
+
+if sys.byteorder == 'little':
+    def _little_endian(column):
+        return column
+else:
+    def _little_endian(column):
+        column = array(column.typecode, column)
+        column.byteswap()
+        return column
+
+
+def _padding(length):
+    return '\0' * (-length % 8)
+
+
+def snapshot_file_name(path, recursive):
+    """
+    Returns a file name for the snapshot of a watch, unique to the watched
+    path and recursiveness.
+
+    :param path:
+        Watched directory path.
+    :param recursive:
+        ``True`` if the watch is recursive.
+    """
+    key = '%s\0%d' % (os.path.abspath(path), bool(recursive))
+    return 'snapshot-%s.wds' % hashlib.sha1(key).hexdigest()
+
+
+def save_snapshot(snapshot, filename):
+    """
+    Saves a snapshot to a file atomically.
+
+    :param snapshot:
+        The snapshot to save.
+    :type snapshot:
+        :class:`watchdog.utils.dirsnapshot.DirectorySnapshot`
+    :param filename:
+        Path of the file. It is replaced if it exists.
+    :raises:
+        :class:`OSError` or :class:`IOError` if the file cannot be written.
+    """
+    root = snapshot._path
+    stat_snapshot = snapshot.stat_snapshot
+    # Parents come before their entries in sorted order, the snapshotted
+    # directory first.
+    paths = sorted(stat_snapshot)
+    if paths and paths[0] != root:
+        paths.remove(root)
+        paths.insert(0, root)
+    index_for_path = dict()
+    name_index = dict()
+    names = []
+    columns = dict()
+    for name in INT64_COLUMNS:
+        columns[name] = array(INT64_TYPECODE)
+    for name in DOUBLE_COLUMNS:
+        columns[name] = array('d')
+    for name in INT32_COLUMNS:
+        columns[name] = array('i')
+
+    for index, path in enumerate(paths):
+        stat_info = stat_snapshot[path]
+        index_for_path[path] = index
+        if path == root:
+            parent = -1
+            name = path
+        else:
+            parent_path, name = os.path.split(path)
+            parent = index_for_path[parent_path]
+        try:
+            name = name_index[name]
+        except KeyError:
+            name_index[name] = len(names)
+            names.append(name)
+            name = len(names) - 1
+        flags = 0
+        if path in snapshot._entries:
+            flags |= ENTRY_LISTED
+        if path in snapshot._racy_directories:
+            flags |= ENTRY_RACY
+        columns['dev'].append(stat_info.st_dev)
+        columns['ino'].append(stat_info.st_ino)
+        columns['size'].append(stat_info.st_size)
+        columns['mtime_ns'].append(_mtime_ns(stat_info))
+        columns['ctime_ns'].append(_ctime_ns(stat_info))
+        columns['mtime'].append(stat_info.st_mtime)
+        columns['ctime'].append(stat_info.st_ctime)
+        columns['mode'].append(stat_info.st_mode)
+        columns['parent'].append(parent)
+        columns['name'].append(name)
+        columns['flags'].append(flags)
+
+    names_blob = '\0'.join(names)
+    body = []
+    for name in INT64_COLUMNS + DOUBLE_COLUMNS + INT32_COLUMNS:
+        data = _little_endian(columns[name]).tostring()
+        body.append(data)
+        body.append(_padding(len(data)))
+    body.append(names_blob)
+    checksum = 0
+    for data in body:
+        checksum = zlib.crc32(data, checksum)
+    header_flags = 0
+    if snapshot.is_recursive:
+        header_flags |= FLAG_RECURSIVE
+    if snapshot.is_structure_only:
+        header_flags |= FLAG_STRUCTURE_ONLY
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, header_flags, len(paths),
+                         len(names_blob), checksum & 0xffffffff, 0)
+
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.snapshot-')
+    try:
+        f = os.fdopen(fd, 'wb')
+        try:
+            f.write(header)
+            for data in body:
+                f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        finally:
+            f.close()
+        if sys.platform.startswith('win') and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(temp_filename, filename)
+    except:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def load_snapshot(filename, path=None, recursive=None, structure_only=None):
+    """
+    Loads a snapshot saved with :func:`save_snapshot`.
+
+    :param filename:
+        Path of the file.
+    :param path:
+        If given, the directory the snapshot must be of.
+    :param recursive:
+        If given, whether the snapshot must be recursive.
+    :param structure_only:
+        If given, whether the snapshot must be structure-only.
+    :returns:
+        A :class:`watchdog.utils.dirsnapshot.DirectorySnapshot`. Its stat
+        information has the saved fields only; the others are zero.
+    :raises:
+        :class:`OSError` or :class:`IOError` if the file cannot be read,
+        and :class:`ValueError` if it is not a snapshot file of this
+        version, is damaged or is not of the given directory.
+    """
+    f = open(filename, 'rb')
+    try:
+        size = os.fstat(f.fileno()).st_size
+        if size < HEADER.size:
+            raise ValueError("Not a snapshot file: %s" % filename)
+        data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+    finally:
+        f.close()
+    try:
+        snapshot = _load_snapshot(data, filename)
+    finally:
+        data.close()
+    if ((path is not None and snapshot._path != absolute_path(path)) or
+        (recursive is not None and snapshot.is_recursive != bool(recursive)) or
+        (structure_only is not None and
+         snapshot.is_structure_only != bool(structure_only))):
+        raise ValueError("Snapshot file of another watch: %s" % filename)
+    return snapshot
+
+
+def _load_snapshot(data, filename):
+    magic, version, flags, entry_count, names_length, checksum, _ = \
+        HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a snapshot file: %s" % filename)
+    if version != FORMAT_VERSION:
+        raise ValueError("Unsupported snapshot file version %d: %s" %
+                         (version, filename))
+    column_sizes = ([8] * len(INT64_COLUMNS) + [8] * len(DOUBLE_COLUMNS) +
+                    [4] * len(INT32_COLUMNS))
+    expected_size = HEADER.size + names_length
+    for item_size in column_sizes:
+        length = item_size * entry_count
+        expected_size += length + (-length % 8)
+    if len(data) != expected_size:
+        raise ValueError("Truncated snapshot file: %s" % filename)
+    if zlib.crc32(data[HEADER.size:]) & 0xffffffff != checksum:
+        raise ValueError("Damaged snapshot file: %s" % filename)
+
+    columns = dict()
+    offset = HEADER.size
+    for name, typecode in ([(name, INT64_TYPECODE) for name in INT64_COLUMNS] +
+                           [(name, 'd') for name in DOUBLE_COLUMNS] +
+                           [(name, 'i') for name in INT32_COLUMNS]):
+        column = array(typecode)
+        length = column.itemsize * entry_count
+        column.fromstring(data[offset:offset + length])
+        if sys.byteorder != 'little':
+            column.byteswap()
+        columns[name] = column
+        offset += length + (-length % 8)
+    names = data[offset:offset + names_length].split('\0')
+
+    root = names[columns['name'][0]]
+    snapshot = DirectorySnapshot(root, bool(flags & FLAG_RECURSIVE),
+                                 structure_only=bool(flags &
+                                                     FLAG_STRUCTURE_ONLY),
+                                 _copying=True)
+    paths = []
+    dev = columns['dev']
+    ino = columns['ino']
+    size = columns['size']
+    mtime = columns['mtime']
+    ctime = columns['ctime']
+    mtime_ns = columns['mtime_ns']
+    ctime_ns = columns['ctime_ns']
+    mode = columns['mode']
+    parent = columns['parent']
+    name = columns['name']
+    entry_flags = columns['flags']
+    for index in range(entry_count):
+        if index == 0:
+            path = root
+        else:
+            parent_path = paths[parent[index]]
+            path = os.path.join(parent_path, names[name[index]])
+            try:
+                snapshot._entries[parent_path].add(names[name[index]])
+            except KeyError:
+                pass
+        paths.append(path)
+        snapshot._set_stat_info(path, _stat_result(
+                mode[index], ino[index], dev[index], size[index],
+                mtime[index], ctime[index], mtime_ns[index], ctime_ns[index]))
+        if entry_flags[index] & ENTRY_LISTED:
+            snapshot._entries[path] = set()
+        if entry_flags[index] & ENTRY_RACY:
+            snapshot._racy_directories.add(path)
+    return snapshot
+
+
+class SnapshotCheckpoint(object):
+    """
+    Saves the snapshot of a watch to a file now and then, so that an
+    emitter started again can report the changes made while it was not
+    running.
+
+    :param filename:
+        Path of the snapshot file.
+    :param interval:
+        Minimum interval (in seconds) between saves of a changing snapshot.
+    """
+    def __init__(self, filename, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.filename = filename
+        self.interval = interval
+        # The first change is saved right away.
+        self._last_saved = 0
+        self._is_changed = False
+
+    def load(self, path, recursive, structure_only=False):
+        """
+        Returns the snapshot saved for a watch, or ``None`` if there is no
+        usable one.
+        """
+        try:
+            return load_snapshot(self.filename, path, recursive,
+                                 structure_only)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def mark_changed(self):
+        """
+        Records that the snapshot changed since it was last saved.
+        """
+        self._is_changed = True
+
+    def save(self, snapshot):
+        """
+        Saves the snapshot if it changed since it was last saved.
+
+        :raises:
+            :class:`OSError` or :class:`IOError` if the file cannot be
+            written.
+        """
+        if self._is_changed:
+            save_snapshot(snapshot, self.filename)
+            self._is_changed = False
+        self._last_saved = time.time()
+
+    def is_due(self):
+        """
+        Determines whether the interval since the last save has elapsed.
+        """
+        return time.time() - self._last_saved >= self.interval
+
+    def save_if_due(self, snapshot):
+        """
+        Saves the snapshot if it changed and the interval has elapsed. A
+        file that cannot be written is retried after another interval.
+        """
+        if not self._is_changed or not self.is_due():
+            return
+        try:
+            self.save(snapshot)
+        except (IOError, OSError):
+            self._last_saved = time.time()
@@ -42,6 +42,8 @@ from watchdog.events import \
     EVENT_TYPE_CREATED, \
     EVENT_TYPE_DELETED, \
     EVENT_TYPE_MOVED, \
+    ALL_EVENT_TYPES, \
+    handled_event_types, \
     _generate_sub_moved_events_for
 
 path_1 = '/path/xyz'
@@ -765,3 +767,28 @@ class TestGenerateSubMovedEventsFor(unittest2.TestCase):
                 src_path, dest_path, _walker=_mock_os_walker))
         self.assertEqual(expected_events, calculated_events)
 
+
+class TestHandledEventTypes(unittest2.TestCase):
+    def test_overridden_methods(self):
+        class CreatedHandler(PatternMatchingEventHandler):
+            def on_created(self, event):
+                pass
+        self.assertEqual(frozenset([EVENT_TYPE_CREATED]),
+                         handled_event_types(CreatedHandler()))
+        self.assertEqual(frozenset(),
+                         handled_event_types(FileSystemEventHandler()))
+        self.assertEqual(ALL_EVENT_TYPES,
+                         handled_event_types(LoggingEventHandler()))
+
+    def test_any_event(self):
+        class AnyEventHandler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                pass
+        self.assertEqual(ALL_EVENT_TYPES,
+                         handled_event_types(AnyEventHandler()))
+
+    def test_declared_event_types(self):
+        handler = LoggingEventHandler()
+        handler.event_types = [EVENT_TYPE_DELETED]
+        self.assertEqual(frozenset([EVENT_TYPE_DELETED]),
+                         handled_event_types(handler))
@@ -17,6 +17,7 @@
 # limitations under the License.
 
 import time
+import threading
 import unittest2
 
 from watchdog.observers.api import \
@@ -24,7 +25,8 @@ from watchdog.observers.api import \
     EventEmitter, \
     ObservedWatch, \
     EventDispatcher, \
-    EventQueue
+    EventQueue, \
+    WatchFuture
 from watchdog.events import LoggingEventHandler, FileModifiedEvent
 
 
@@ -101,3 +103,57 @@ class TestBaseObserver(unittest2.TestCase):
         time.sleep(1)
         observer.unschedule_all()
         observer.stop()
+
+    def test_schedule_async(self):
+        observer = BaseObserver(EventEmitter)
+        handler = LoggingEventHandler()
+
+        future = observer.schedule_async(handler, '/foobar', True)
+        self.assertTrue(isinstance(future, WatchFuture))
+        self.assertEqual(ObservedWatch('/foobar', True), future.watch)
+        self.assertEqual(future.watch, future.result())
+        self.assertTrue(future.done())
+        self.assertEqual(None, future.exception())
+
+        called = []
+        future.add_done_callback(called.append)
+        self.assertEqual([future], called)
+        observer.unschedule(future.watch)
+
+    def test_schedule_async_bounds_threads(self):
+        state = dict(active=0, peak=0)
+        lock = threading.Lock()
+
+        class SlowEmitter(EventEmitter):
+            def __init__(self, event_queue, watch, timeout=1):
+                EventEmitter.__init__(self, event_queue, watch, timeout)
+                with lock:
+                    state['active'] += 1
+                    state['peak'] = max(state['peak'], state['active'])
+                time.sleep(0.05)
+                with lock:
+                    state['active'] -= 1
+
+        observer = BaseObserver(SlowEmitter, schedule_workers=2)
+        handler = LoggingEventHandler()
+        futures = [observer.schedule_async(handler, '/foobar%d' % i, True)
+                   for i in range(8)]
+        observer.unschedule(futures[-1].watch)
+        for future in futures:
+            self.assertTrue(future.wait(5))
+            self.assertEqual(None, future.exception())
+        self.assertEqual(2, state['peak'])
+        self.assertEqual(7, len(observer.emitters))
+        observer.unschedule_all()
+
+    def test_schedule_failure(self):
+        class FailingEmitter(EventEmitter):
+            def __init__(self, event_queue, watch, timeout=1):
+                raise OSError('Path is not a directory')
+
+        observer = BaseObserver(FailingEmitter)
+        handler = LoggingEventHandler()
+        future = observer.schedule_async(handler, '/foobar', True)
+        self.assertTrue(isinstance(future.exception(), OSError))
+        self.assertRaises(OSError, observer.schedule, handler, '/foobar', True)
+        self.assertRaises(KeyError, observer.unschedule, future.watch)
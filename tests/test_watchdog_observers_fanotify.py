@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import threading
+import unittest2
+
+try:
+    import queue  # IGNORE:F0401
+except ImportError:
+    import Queue as queue  # IGNORE:F0401
+
+from time import sleep, time
+from tests.shell import \
+    mkdir, \
+    mkdtemp, \
+    touch, \
+    rm
+
+from watchdog.utils import platform
+from watchdog.events import \
+    FileSystemEventHandler, \
+    FileCreatedEvent, \
+    FileDeletedEvent, \
+    FileMovedEvent, \
+    DirCreatedEvent, \
+    DirMovedEvent
+
+from watchdog.observers.api import ObservedWatch
+
+fanotify_available = False
+if platform.is_linux():
+    try:
+        from watchdog.observers.fanotify import \
+            Fanotify, \
+            FanotifyEmitter, \
+            FanotifyObserver
+        Fanotify().close()
+        fanotify_available = True
+    except (ImportError, OSError):
+        pass
+
+
+@unittest2.skipUnless(fanotify_available,
+                      "fanotify needs Linux 5.9+ and CAP_SYS_ADMIN")
+class TestFanotifyEmitter(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.outside = mkdtemp()
+        self.event_queue = queue.Queue()
+        self.fanotify = Fanotify()
+        self.emitter = FanotifyEmitter(self.event_queue,
+                                       ObservedWatch(self.path, True),
+                                       fanotify=self.fanotify)
+
+    def tearDown(self):
+        self.fanotify.close()
+        rm(self.path, recursive=True)
+        rm(self.outside, recursive=True)
+
+    def collect_events(self, duration=0.5):
+        deadline = time() + duration
+        while time() < deadline:
+            for owner, events in self.fanotify.read_events_by_owner(
+                    timeout=0.1):
+                owner.queue_fanotify_events(events)
+        events = set()
+        while not self.event_queue.empty():
+            event, _ = self.event_queue.get_nowait()
+            events.add(event)
+        return events
+
+    def test_reports_whole_tree_without_registration(self):
+        mkdir(os.path.join(self.outside, 'a', 'b', 'c'), parents=True)
+        os.rename(os.path.join(self.outside, 'a'),
+                  os.path.join(self.path, 'a'))
+        self.collect_events()
+        touch(os.path.join(self.path, 'a', 'b', 'c', 'd'))
+        events = self.collect_events()
+        self.assertTrue(FileCreatedEvent(
+                os.path.join(self.path, 'a', 'b', 'c', 'd')) in events)
+        self.assertEqual(1, self.fanotify.marked_filesystems)
+
+    def test_ignores_changes_outside_tree(self):
+        touch(os.path.join(self.outside, 'a'))
+        self.assertEqual(set(), self.collect_events())
+
+    def test_moves(self):
+        mkdir(os.path.join(self.path, 'a'))
+        touch(os.path.join(self.path, 'b'))
+        self.collect_events()
+        os.rename(os.path.join(self.path, 'a'), os.path.join(self.path, 'c'))
+        events = self.collect_events()
+        self.assertTrue(DirMovedEvent(os.path.join(self.path, 'a'),
+                                      os.path.join(self.path, 'c')) in events)
+        os.rename(os.path.join(self.path, 'b'),
+                  os.path.join(self.path, 'c', 'b'))
+        events = self.collect_events()
+        self.assertTrue(FileMovedEvent(os.path.join(self.path, 'b'),
+                                       os.path.join(self.path, 'c', 'b'))
+                        in events)
+        os.rename(os.path.join(self.path, 'c', 'b'),
+                  os.path.join(self.outside, 'b'))
+        events = self.collect_events()
+        self.assertTrue(FileDeletedEvent(os.path.join(self.path, 'c', 'b'))
+                        in events)
+
+    def test_non_recursive_watch(self):
+        path = os.path.join(self.path, 'a')
+        mkdir(os.path.join(path, 'b'), parents=True)
+        self.collect_events()
+        emitter = FanotifyEmitter(self.event_queue,
+                                  ObservedWatch(path, False),
+                                  fanotify=self.fanotify)
+        touch(os.path.join(path, 'c'))
+        touch(os.path.join(path, 'b', 'd'))
+        mkdir(os.path.join(path, 'e'))
+        events_for_owner = dict()
+        deadline = time() + 0.5
+        while time() < deadline:
+            for owner, events in self.fanotify.read_events_by_owner(
+                    timeout=0.1):
+                events_for_owner.setdefault(owner, []).extend(events)
+        self.assertEqual(set([os.path.join(path, 'c'),
+                              os.path.join(path, 'e')]),
+                         set([event.src_path for event
+                              in events_for_owner[emitter]]))
+        self.assertEqual(set([os.path.join(path, 'c'),
+                              os.path.join(path, 'b', 'd'),
+                              os.path.join(path, 'e')]),
+                         set([event.src_path for event
+                              in events_for_owner[self.emitter]]))
+        self.fanotify.remove_owner(emitter)
+        self.assertEqual(1, self.fanotify.marked_filesystems)
+        self.fanotify.remove_owner(self.emitter)
+        self.assertEqual(0, self.fanotify.marked_filesystems)
+
+    def test_directory_created_again(self):
+        path = os.path.join(self.path, 'a')
+        mkdir(path)
+        self.collect_events()
+        rm(path, recursive=True)
+        mkdir(path)
+        events = self.collect_events()
+        self.assertTrue(DirCreatedEvent(path) in events)
+
+
+@unittest2.skipUnless(fanotify_available,
+                      "fanotify needs Linux 5.9+ and CAP_SYS_ADMIN")
+class TestFanotifyControl(unittest2.TestCase):
+    def setUp(self):
+        self.fanotify = Fanotify()
+        self.results = []
+        self.reader = threading.Thread(target=self.read)
+        self.reader.start()
+        sleep(0.1)
+
+    def tearDown(self):
+        self.fanotify.close()
+        self.reader.join(5)
+
+    def read(self):
+        try:
+            self.results.append(self.fanotify.read_events_by_owner())
+        except Exception, e:
+            self.results.append(e)
+
+    def test_close_interrupts_reader(self):
+        started = time()
+        self.fanotify.close()
+        self.reader.join(5)
+        self.assertFalse(self.reader.is_alive())
+        self.assertTrue(time() - started < 0.5)
+        self.assertEqual([[]], self.results)
+
+    def test_wake_does_not_block(self):
+        started = time()
+        # More wake-ups than the pipe can hold.
+        for _ in range(100000):
+            self.fanotify.wake()
+        self.assertTrue(time() - started < 5)
+        self.reader.join(5)
+        self.assertFalse(self.reader.is_alive())
+
+
+@unittest2.skipUnless(fanotify_available,
+                      "fanotify needs Linux 5.9+ and CAP_SYS_ADMIN")
+class TestFanotifyObserver(unittest2.TestCase):
+    def setUp(self):
+        self.paths = [mkdtemp(), mkdtemp()]
+        self.observer = FanotifyObserver(timeout=0.2)
+
+    def tearDown(self):
+        self.observer.stop()
+        for path in self.paths:
+            rm(path, recursive=True)
+
+    def test_inotify_fallback_shares_one_reader(self):
+        # As if fanotify were not available.
+        self.observer._reader.fanotify.close()
+        self.observer._reader = None
+        threads_before = threading.active_count()
+        for path in self.paths:
+            self.observer.schedule(FileSystemEventHandler(), path,
+                                   recursive=True)
+        self.observer.start()
+        # One dispatcher and one inotify reader.
+        self.assertEqual(threads_before + 2, threading.active_count())
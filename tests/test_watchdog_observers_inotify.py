@@ -0,0 +1,705 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import struct
+import threading
+import unittest2
+
+try:
+    import queue  # IGNORE:F0401
+except ImportError:
+    import Queue as queue  # IGNORE:F0401
+
+from time import sleep, time
+from tests.shell import \
+    mkdir, \
+    mkdtemp, \
+    touch, \
+    rm
+
+from watchdog.utils import platform
+from watchdog.events import \
+    FileSystemEventHandler, \
+    FileCreatedEvent, \
+    FileDeletedEvent, \
+    FileModifiedEvent, \
+    FileMovedEvent, \
+    DirCreatedEvent, \
+    DirDeletedEvent, \
+    DirMovedEvent
+
+from watchdog.observers.api import ObservedWatch
+
+if platform.is_linux():
+    from watchdog.observers.inotify import \
+        Inotify, \
+        InotifyConstants, \
+        InotifyEmitter, \
+        InotifyEvent, \
+        InotifyObserver, \
+        MOVE_EVENT_TIMEOUT
+
+
+class CollectingEventHandler(FileSystemEventHandler):
+    def __init__(self):
+        self.events = set()
+
+    def on_any_event(self, event):
+        self.events.add(event)
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyObserver(unittest2.TestCase):
+    SLEEP_TIME = 0.4
+
+    def setUp(self):
+        self.paths = [mkdtemp(), mkdtemp()]
+        self.observer = InotifyObserver(timeout=0.2)
+
+    def tearDown(self):
+        self.observer.stop()
+        for path in self.paths:
+            rm(path, recursive=True)
+
+    def test_watches_share_one_reader(self):
+        threads_before = threading.active_count()
+        handlers = [CollectingEventHandler(), CollectingEventHandler()]
+        for handler, path in zip(handlers, self.paths):
+            self.observer.schedule(handler, path, recursive=True)
+        self.observer.start()
+        # One dispatcher and one reader, regardless of the number of watches.
+        self.assertEqual(threads_before + 2, threading.active_count())
+
+        mkdir(os.path.join(self.paths[0], 'a'))
+        touch(os.path.join(self.paths[1], 'b'))
+        sleep(self.SLEEP_TIME)
+
+        self.assertTrue(DirCreatedEvent(os.path.join(self.paths[0], 'a'))
+                        in handlers[0].events)
+        self.assertTrue(FileCreatedEvent(os.path.join(self.paths[1], 'b'))
+                        in handlers[1].events)
+        for event in handlers[0].events:
+            self.assertTrue(event.src_path.startswith(self.paths[0]))
+        for event in handlers[1].events:
+            self.assertTrue(event.src_path.startswith(self.paths[1]))
+
+    def test_schedule_async(self):
+        mkdir(os.path.join(self.paths[0], 'a', 'b'), parents=True)
+        handler = CollectingEventHandler()
+        future = self.observer.schedule_async(handler, self.paths[0],
+                                              recursive=True)
+        self.observer.start()
+        self.assertEqual(future.watch, future.result())
+        touch(os.path.join(self.paths[0], 'a', 'b', 'c'))
+        sleep(self.SLEEP_TIME)
+        self.assertTrue(
+            FileCreatedEvent(os.path.join(self.paths[0], 'a', 'b', 'c'))
+            in handler.events)
+
+    def test_kernel_mask_follows_handlers(self):
+        class CreatedEventHandler(FileSystemEventHandler):
+            def on_created(self, event):
+                pass
+
+        class ModifiedEventHandler(FileSystemEventHandler):
+            def on_modified(self, event):
+                pass
+
+        watch = self.observer.schedule(CreatedEventHandler(), self.paths[0])
+        inotify = self.observer.emitters[0]._inotify
+        node = inotify._node_for_path(self.paths[0])
+        self.assertFalse(node.mask & InotifyConstants.IN_MODIFY)
+        self.assertFalse(node.mask & InotifyConstants.IN_CLOSE_NOWRITE)
+        self.assertTrue(node.mask & InotifyConstants.IN_CREATE)
+
+        handler = ModifiedEventHandler()
+        self.observer.add_handler_for_watch(handler, watch)
+        self.assertTrue(node.mask & InotifyConstants.IN_MODIFY)
+        self.observer.remove_handler_for_watch(handler, watch)
+        self.assertFalse(node.mask & InotifyConstants.IN_MODIFY)
+
+    def test_unschedule_releases_watches(self):
+        handler = CollectingEventHandler()
+        watch = self.observer.schedule(handler, self.paths[0], recursive=False)
+        self.observer.start()
+        self.observer.unschedule(watch)
+        touch(os.path.join(self.paths[0], 'a'))
+        sleep(self.SLEEP_TIME)
+        self.assertEqual(set(), handler.events)
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyEmitter(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+
+    def test_stop_does_not_wait_for_events(self):
+        emitter = InotifyEmitter(queue.Queue(), ObservedWatch(self.path, True),
+                                 timeout=60)
+        emitter.start()
+        sleep(0.2)
+        started = time()
+        emitter.stop()
+        emitter.join(5)
+        self.assertFalse(emitter.is_alive())
+        self.assertTrue(time() - started < 1)
+
+    def _collect_events(self, event_queue, expected=(), timeout=5):
+        """Collects queued events until the expected ones have come."""
+        events = set()
+        deadline = time() + timeout
+        while True:
+            try:
+                event, _ = event_queue.get(timeout=0.1)
+                events.add(event)
+            except queue.Empty:
+                if events.issuperset(expected) or time() > deadline:
+                    return events
+
+    def test_resync_on_queue_overflow(self):
+        event_queue = queue.Queue()
+        emitter = InotifyEmitter(event_queue, ObservedWatch(self.path, True))
+        try:
+            self.assertTrue(emitter.wait_until_ready(5))
+            mkdir(os.path.join(self.path, 'a'))
+            touch(os.path.join(self.path, 'a', 'b'))
+            started = time()
+            emitter.queue_inotify_events([
+                    InotifyEvent(-1, InotifyConstants.IN_Q_OVERFLOW, 0, '', '')])
+            # The resync runs in the background.
+            self.assertTrue(time() - started < 1)
+            expected = [DirCreatedEvent(os.path.join(self.path, 'a')),
+                        FileCreatedEvent(os.path.join(self.path, 'a', 'b'))]
+            events = self._collect_events(event_queue, expected)
+            self.assertTrue(events.issuperset(expected))
+            # The created directory is watched from now on.
+            touch(os.path.join(self.path, 'a', 'c'))
+            emitter.queue_events(1)
+            events = self._collect_events(event_queue)
+            self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'a', 'c'))
+                            in events)
+        finally:
+            emitter.on_thread_exit()
+
+    def test_resync_reports_only_missed_changes(self):
+        mkdir(os.path.join(self.path, 'a'))
+        event_queue = queue.Queue()
+        emitter = InotifyEmitter(event_queue, ObservedWatch(self.path, True))
+        try:
+            self.assertTrue(emitter.wait_until_ready(5))
+            emitter.resync()
+            touch(os.path.join(self.path, 'b'))
+            emitter.queue_events(1)
+            self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'b'))
+                            in self._collect_events(event_queue))
+            # Not reported by inotify.
+            emitter._inotify.remove_owner(emitter)
+            touch(os.path.join(self.path, 'a', 'c'))
+            emitter.resync()
+            events = self._collect_events(event_queue)
+            self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'a', 'c'))
+                            in events)
+            self.assertFalse(FileCreatedEvent(os.path.join(self.path, 'b'))
+                             in events)
+        finally:
+            emitter.on_thread_exit()
+
+    def test_translates_batch(self):
+        event_queue = queue.Queue()
+        emitter = InotifyEmitter(event_queue, ObservedWatch(self.path, True))
+        a = os.path.join(self.path, 'a')
+        b = os.path.join(self.path, 'b')
+        try:
+            emitter.queue_inotify_events([
+                    InotifyEvent(1, InotifyConstants.IN_CREATE |
+                                 InotifyConstants.IN_ISDIR, 0, 'a', a),
+                    InotifyEvent(1, InotifyConstants.IN_OPEN, 0, 'b', b),
+                    InotifyEvent(1, InotifyConstants.IN_MODIFY, 0, 'b', b),
+                    InotifyEvent(1, InotifyConstants.IN_CLOSE_WRITE, 0, 'b', b),
+                    InotifyEvent(1, InotifyConstants.IN_MOVED_TO, 7, 'c',
+                                 os.path.join(self.path, 'c'), b),
+                    InotifyEvent(1, InotifyConstants.IN_DELETE_SELF, 0, '', a),
+                    ])
+            events = []
+            while not event_queue.empty():
+                event, _ = event_queue.get_nowait()
+                events.append(event)
+            self.assertEqual([DirCreatedEvent(a),
+                              FileModifiedEvent(b),
+                              FileMovedEvent(b, os.path.join(self.path, 'c')),
+                              DirDeletedEvent(a)], events)
+        finally:
+            emitter.on_thread_exit()
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyCoalescing(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.file_path = os.path.join(self.path, 'a')
+        touch(self.file_path)
+        self.event_queue = queue.Queue()
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+
+    def queued_events(self, emitter, duration):
+        deadline = time() + duration
+        while time() < deadline:
+            emitter.queue_events(0.05)
+        events = []
+        while not self.event_queue.empty():
+            event, _ = self.event_queue.get_nowait()
+            events.append(event)
+        return events
+
+    def write_chunks(self, count):
+        f = open(self.file_path, 'ab')
+        try:
+            for _ in range(count):
+                f.write('x' * 16)
+                f.flush()
+        finally:
+            f.close()
+
+    def test_modifications_are_coalesced_per_read(self):
+        emitter = InotifyEmitter(self.event_queue,
+                                 ObservedWatch(self.path, False))
+        try:
+            emitter.wait_until_ready()
+            self.write_chunks(20)
+            events = self.queued_events(emitter, 0.2)
+            self.assertEqual([FileModifiedEvent(self.file_path)], events)
+        finally:
+            emitter.on_thread_exit()
+
+    def test_modifications_are_coalesced_within_window(self):
+        emitter = InotifyEmitter(self.event_queue,
+                                 ObservedWatch(self.path, False),
+                                 coalesce_window=0.5)
+        try:
+            emitter.wait_until_ready()
+            self.write_chunks(1)
+            self.assertEqual([], self.queued_events(emitter, 0.1))
+            self.write_chunks(1)
+            events = self.queued_events(emitter, 0.6)
+            self.assertEqual([FileModifiedEvent(self.file_path)], events)
+        finally:
+            emitter.on_thread_exit()
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyMoves(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.outside = mkdtemp()
+        self.event_queue = queue.Queue()
+        self.emitter = InotifyEmitter(self.event_queue,
+                                      ObservedWatch(self.path, True))
+        self.emitter.wait_until_ready()
+
+    def tearDown(self):
+        self.emitter.on_thread_exit()
+        rm(self.path, recursive=True)
+        rm(self.outside, recursive=True)
+
+    def collect_events(self, duration=1):
+        deadline = time() + duration
+        while time() < deadline:
+            self.emitter.queue_events(0.1)
+        events = set()
+        while not self.event_queue.empty():
+            event, _ = self.event_queue.get_nowait()
+            events.add(event)
+        return events
+
+    def test_move_within_tree(self):
+        mkdir(os.path.join(self.path, 'a'))
+        self.collect_events(0.2)
+        os.rename(os.path.join(self.path, 'a'), os.path.join(self.path, 'b'))
+        events = self.collect_events()
+        self.assertTrue(DirMovedEvent(os.path.join(self.path, 'a'),
+                                      os.path.join(self.path, 'b')) in events)
+
+    def test_move_updates_paths_of_subdirectories(self):
+        mkdir(os.path.join(self.path, 'a', 'b'), parents=True)
+        self.collect_events(0.2)
+        os.rename(os.path.join(self.path, 'a'), os.path.join(self.path, 'c'))
+        self.collect_events(0.2)
+        touch(os.path.join(self.path, 'c', 'b', 'd'))
+        events = self.collect_events(0.2)
+        self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'c', 'b', 'd'))
+                        in events)
+
+    def test_move_out_of_tree_is_deletion(self):
+        touch(os.path.join(self.path, 'a'))
+        self.collect_events(0.2)
+        os.rename(os.path.join(self.path, 'a'),
+                  os.path.join(self.outside, 'a'))
+        events = self.collect_events()
+        self.assertTrue(FileDeletedEvent(os.path.join(self.path, 'a'))
+                        in events)
+
+    def test_move_out_is_reported_in_order(self):
+        touch(os.path.join(self.path, 'a'))
+        self.collect_events(0.2)
+        os.rename(os.path.join(self.path, 'a'),
+                  os.path.join(self.outside, 'a'))
+        touch(os.path.join(self.path, 'a'))
+        started = time()
+        self.emitter.queue_events(1)
+        self.assertTrue(time() - started < MOVE_EVENT_TIMEOUT)
+        events = []
+        while not self.event_queue.empty():
+            events.append(self.event_queue.get_nowait()[0])
+        self.assertEqual([FileDeletedEvent(os.path.join(self.path, 'a')),
+                          FileCreatedEvent(os.path.join(self.path, 'a'))],
+                         [event for event in events
+                          if isinstance(event, (FileCreatedEvent,
+                                                FileDeletedEvent))])
+
+    def test_move_into_tree_is_creation(self):
+        mkdir(os.path.join(self.outside, 'a', 'b'), parents=True)
+        touch(os.path.join(self.outside, 'a', 'b', 'c'))
+        os.rename(os.path.join(self.outside, 'a'), os.path.join(self.path, 'a'))
+        events = self.collect_events(0.2)
+        self.assertTrue(DirCreatedEvent(os.path.join(self.path, 'a'))
+                        in events)
+        self.assertTrue(DirCreatedEvent(os.path.join(self.path, 'a', 'b'))
+                        in events)
+        self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'a', 'b', 'c'))
+                        in events)
+
+        touch(os.path.join(self.path, 'a', 'b', 'd'))
+        events = self.collect_events(0.2)
+        self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'a', 'b', 'd'))
+                        in events)
+
+    def test_unpaired_moves_expire(self):
+        inotify = self.emitter._inotify
+        for i in range(10):
+            touch(os.path.join(self.path, str(i)))
+        self.collect_events(0.2)
+        for i in range(10):
+            os.rename(os.path.join(self.path, str(i)),
+                      os.path.join(self.outside, str(i)))
+        self.collect_events()
+        self.assertEqual(0, len(inotify._moved_from_events))
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyCreatedTrees(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.inotify = Inotify()
+        self.inotify.add_dir_watch(self.path, recursive=True)
+
+    def tearDown(self):
+        self.inotify.close()
+        rm(self.path, recursive=True)
+
+    def created_paths(self, duration):
+        paths = []
+        deadline = time() + duration
+        while time() < deadline:
+            for event in self.inotify.read_events(timeout=0.05):
+                if event.is_create:
+                    paths.append(event.src_path)
+        return paths
+
+    def test_contents_are_reported_once(self):
+        expected_paths = []
+        for name in ('a', 'b'):
+            path = os.path.join(self.path, name)
+            for _ in range(4):
+                expected_paths.append(path)
+                path = os.path.join(path, 'd')
+            deepest_path = expected_paths[-1]
+            mkdir(deepest_path, parents=True)
+            for i in range(10):
+                file_path = os.path.join(deepest_path, str(i))
+                touch(file_path)
+                expected_paths.append(file_path)
+
+        paths = self.created_paths(0.5)
+        self.assertEqual(sorted(expected_paths), sorted(paths))
+
+        # The scanned directories are watched.
+        touch(os.path.join(deepest_path, 'x'))
+        self.assertEqual([os.path.join(deepest_path, 'x')],
+                         self.created_paths(0.2))
+
+    def test_entry_deleted_during_scan(self):
+        import watchdog.observers.inotify as inotify_module
+        iter_entries = inotify_module.iter_entries
+        directory = os.path.join(self.path, 'd')
+        listing = threading.Event()
+        listed = threading.Event()
+        resume = threading.Event()
+
+        def slow_iter_entries(path):
+            if path != directory:
+                return iter_entries(path)
+            listing.wait(5)
+            entries = list(iter_entries(path))
+            listed.set()
+            resume.wait(5)
+            return entries
+
+        inotify_module.iter_entries = slow_iter_entries
+        try:
+            mkdir(directory)
+            self.assertEqual([directory], self.created_paths(0.2))
+            # Created and deleted while the scan is under way.
+            touch(os.path.join(directory, 'a'))
+            listing.set()
+            self.assertTrue(listed.wait(5))
+            rm(os.path.join(directory, 'a'))
+            events = []
+            deadline = time() + 0.2
+            while time() < deadline:
+                events.extend(self.inotify.read_events(timeout=0.05))
+            resume.set()
+            deadline = time() + 0.2
+            while time() < deadline:
+                events.extend(self.inotify.read_events(timeout=0.05))
+        finally:
+            resume.set()
+            inotify_module.iter_entries = iter_entries
+        self.assertEqual([(True, False), (False, True)],
+                         [(event.is_create, event.is_delete)
+                          for event in events
+                          if event.is_create or event.is_delete])
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyControl(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        mkdir(os.path.join(self.path, 'a'))
+        self.inotify = Inotify(self.path)
+        self.reader = threading.Thread(target=self.inotify.read_events)
+        self.reader.start()
+        sleep(0.1)
+
+    def tearDown(self):
+        self.inotify.close()
+        self.reader.join(5)
+        rm(self.path, recursive=True)
+
+    def test_watch_changes_do_not_wait_for_events(self):
+        started = time()
+        self.inotify.add_watch(os.path.join(self.path, 'a'))
+        self.inotify.remove_watch(os.path.join(self.path, 'a'))
+        self.assertTrue(time() - started < 0.5)
+        self.assertTrue(self.reader.is_alive())
+
+    def test_close_interrupts_reader(self):
+        started = time()
+        self.inotify.close()
+        self.reader.join(5)
+        self.assertFalse(self.reader.is_alive())
+        self.assertTrue(time() - started < 0.5)
+
+    def test_close_with_watches_gone(self):
+        mkdir(os.path.join(self.path, 'b', 'c'), parents=True)
+        inotify = Inotify(os.path.join(self.path, 'b'), recursive=True)
+        # The kernel removes the watch, but IN_IGNORED is not read yet.
+        rm(os.path.join(self.path, 'b', 'c'), recursive=True)
+        inotify.close()
+        self.assertRaises(OSError, os.fstat, inotify.fd)
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyEventBuffer(unittest2.TestCase):
+    def test_parse_event_buffer(self):
+        event_buffer = bytearray(64)
+        struct.pack_into('iIII', event_buffer, 0, 1, 0x100, 0, 8)
+        event_buffer[16:24] = 'foo\0\0\0\0\0'
+        # A trailing event without a name, for example IN_IGNORED.
+        struct.pack_into('iIII', event_buffer, 24, 2, 0x8000, 0, 0)
+
+        self.assertEqual([(1, 0x100, 0, 'foo'), (2, 0x8000, 0, '')],
+                         list(Inotify._parse_event_buffer(event_buffer, 40)))
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyReadBuffer(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.inotify = Inotify(self.path)
+
+    def tearDown(self):
+        self.inotify.close()
+        rm(self.path, recursive=True)
+
+    def test_buffer_follows_queue(self):
+        initial_size = self.inotify.event_buffer_size
+        for i in range(500):
+            touch(os.path.join(self.path, 'file%d' % i))
+        events = self.inotify.read_events(timeout=1)
+        grown_size = self.inotify.event_buffer_size
+        self.assertTrue(grown_size > initial_size)
+        self.assertEqual(len(events), self.inotify.queue_depth)
+        self.assertEqual(len(events), self.inotify.peak_queue_depth)
+        self.assertTrue(len(events) >= 500)
+
+        for _ in range(10):
+            touch(os.path.join(self.path, 'file0'))
+            self.inotify.read_events(timeout=1)
+        self.assertTrue(self.inotify.event_buffer_size <= grown_size // 4)
+        self.assertEqual(len(events), self.inotify.peak_queue_depth)
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyTreeRegistration(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+
+    def test_register_tree(self):
+        for top in ('a', 'b', 'c'):
+            mkdir(os.path.join(self.path, top, 'x', 'y'), parents=True)
+        touch(os.path.join(self.path, 'a', 'afile'))
+        inotify = Inotify()
+        try:
+            registration = inotify.register_tree(self.path, recursive=True)
+            self.assertTrue(registration.wait(5))
+            self.assertEqual(None, registration.error)
+            self.assertEqual(10, registration.directories_registered)
+        finally:
+            inotify.close()
+
+    def test_trees_share_workers(self):
+        for top in ('a', 'b', 'c'):
+            mkdir(os.path.join(self.path, top, 'x', 'y'), parents=True)
+        inotify = Inotify(registration_workers=2)
+        try:
+            registrations = [
+                inotify.register_tree(os.path.join(self.path, top),
+                                      recursive=True, owner=top)
+                for top in ('a', 'b', 'c')]
+            self.assertTrue(inotify._registration_workers <= 2)
+            for registration in registrations:
+                self.assertTrue(registration.wait(5))
+                self.assertEqual(3, registration.directories_registered)
+            deadline = time() + 5
+            while inotify._registration_workers and time() < deadline:
+                sleep(0.01)
+            self.assertEqual(0, inotify._registration_workers)
+        finally:
+            inotify.close()
+
+    def test_cancel_does_not_wait_for_other_trees(self):
+        big = os.path.join(self.path, 'big')
+        for top in range(2000):
+            mkdir(os.path.join(big, str(top), 'x'), parents=True)
+        small = os.path.join(self.path, 'small')
+        mkdir(os.path.join(small, 'x'), parents=True)
+        inotify = Inotify(registration_workers=1)
+        try:
+            registration = inotify.register_tree(big, recursive=True,
+                                                 owner=1)
+            while registration.directories_registered < 2:
+                sleep(0.001)
+            cancelled = inotify.register_tree(small, recursive=True, owner=2)
+            cancelled.cancel()
+            self.assertTrue(cancelled.wait(0.05))
+            self.assertFalse(registration.is_done)
+            self.assertTrue(registration.wait(30))
+        finally:
+            inotify.close()
+
+    def test_cancel_releases_watches(self):
+        for top in range(20):
+            mkdir(os.path.join(self.path, str(top), 'x'), parents=True)
+        inotify = Inotify(registration_workers=1)
+        try:
+            registration = inotify.register_tree(self.path, recursive=True,
+                                                 owner=1)
+            registration.cancel()
+            inotify.remove_owner(1)
+            self.assertTrue(registration.wait(5))
+            self.assertEqual(0, inotify.watch_count)
+            self.assertFalse(1 in inotify._wds_for_owner)
+        finally:
+            inotify.close()
+
+
+@unittest2.skipUnless(platform.is_linux(), "inotify is only available on Linux")
+class TestInotifyWatchBudget(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        mkdir(os.path.join(self.path, 'a'))
+        mkdir(os.path.join(self.path, 'b'))
+        self.inotify = Inotify(max_watches=2, polling_interval=0)
+
+    def tearDown(self):
+        self.inotify.close()
+        rm(self.path, recursive=True)
+
+    def test_polls_directories_beyond_budget(self):
+        registration = self.inotify.register_tree(self.path, recursive=True)
+        self.assertTrue(registration.wait(5))
+        self.assertEqual(2, self.inotify.watch_count)
+        self.assertEqual(1, len(self.inotify.polled_paths))
+        polled_path = self.inotify.polled_paths[0]
+
+        touch(os.path.join(polled_path, 'c'))
+        events = [event for _, group in self.inotify.poll_subtrees()
+                  for event in group]
+        self.assertTrue(FileCreatedEvent(os.path.join(polled_path, 'c'))
+                        in events)
+
+    def test_demotes_cold_subtree_for_new_directory(self):
+        registration = self.inotify.register_tree(self.path, recursive=True)
+        self.assertTrue(registration.wait(5))
+        mkdir(os.path.join(self.path, 'd'))
+        self.inotify.read_events(timeout=1)
+        self.assertEqual(2, self.inotify.watch_count)
+        self.assertEqual(2, len(self.inotify.polled_paths))
+        self.assertFalse(os.path.join(self.path, 'd')
+                         in self.inotify.polled_paths)
+
+    def test_does_not_demote_root_of_other_tree(self):
+        inotify = Inotify(max_watches=5, polling_interval=0)
+        try:
+            x = os.path.join(self.path, 'a', 'x')
+            mkdir(x)
+            registration = inotify.register_tree(self.path, recursive=True,
+                                                 owner=1)
+            self.assertTrue(registration.wait(5))
+            registration = inotify.register_tree(x, recursive=True, owner=2)
+            self.assertTrue(registration.wait(5))
+            inotify.read_events(timeout=1)
+            # Leaves 'a', which holds the root of the other tree, coldest.
+            touch(os.path.join(self.path, 'b', 'e'))
+            inotify.read_events(timeout=1)
+            mkdir(os.path.join(self.path, 'c'))
+            mkdir(os.path.join(self.path, 'd'))
+            inotify.read_events(timeout=1)
+            self.assertEqual([os.path.join(self.path, 'b')],
+                             inotify.polled_paths)
+        finally:
+            inotify.close()
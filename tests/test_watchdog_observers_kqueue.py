@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import imp
+import sys
+import types
+import unittest2
+
+try:
+    import queue  # IGNORE:F0401
+except ImportError:
+    import Queue as queue  # IGNORE:F0401
+
+from tests.shell import \
+    mkdtemp, \
+    touch, \
+    rm
+
+import watchdog.observers
+from watchdog.utils import platform
+from watchdog.utils import snapshotfile
+from watchdog.observers.api import ObservedWatch
+
+
+class FakeKevent(object):
+    def __init__(self, ident, filter=0, flags=0, fflags=0):
+        self.ident = ident
+        self.filter = filter
+        self.flags = flags
+        self.fflags = fflags
+
+
+class FakeKqueue(object):
+    def __init__(self):
+        # Kevents returned by the next call to control().
+        self.events = []
+
+    def control(self, kevents, max_events, timeout=None):
+        events, self.events = self.events, []
+        return events
+
+    def close(self):
+        pass
+
+
+def fake_select():
+    select = types.ModuleType('select')
+    for bit, name in enumerate(('KQ_FILTER_VNODE', 'KQ_EV_ADD',
+                                'KQ_EV_ENABLE', 'KQ_EV_CLEAR',
+                                'KQ_NOTE_DELETE', 'KQ_NOTE_WRITE',
+                                'KQ_NOTE_EXTEND', 'KQ_NOTE_ATTRIB',
+                                'KQ_NOTE_LINK', 'KQ_NOTE_RENAME',
+                                'KQ_NOTE_REVOKE')):
+        setattr(select, name, 1 << bit)
+    select.kqueue = FakeKqueue
+    select.kevent = FakeKevent
+    return select
+
+
+def load_kqueue():
+    """
+    Loads the kqueue module with a stand-in for the select module, so that
+    the emitter can be tested where kqueue(2) is not available.
+    """
+    path = os.path.join(os.path.dirname(watchdog.observers.__file__),
+                        'kqueue.py')
+    select = sys.modules.get('select')
+    is_bsd = platform.is_bsd
+    sys.modules['select'] = fake_select()
+    platform.is_bsd = lambda: True
+    try:
+        return imp.load_source('tests.kqueue_under_test', path)
+    finally:
+        platform.is_bsd = is_bsd
+        if select is None:
+            del sys.modules['select']
+        else:
+            sys.modules['select'] = select
+
+
+class TestKqueueEmitterCheckpoint(unittest2.TestCase):
+    def setUp(self):
+        self.kqueue = load_kqueue()
+        self.path = mkdtemp()
+        self.snapshot_dir = mkdtemp()
+        touch(os.path.join(self.path, 'a'))
+        self.saves = 0
+        self.save_snapshot = snapshotfile.save_snapshot
+
+        def save_snapshot(snapshot, filename):
+            self.saves += 1
+            self.save_snapshot(snapshot, filename)
+        snapshotfile.save_snapshot = save_snapshot
+        self.emitters = []
+
+    def tearDown(self):
+        for emitter in self.emitters:
+            emitter.on_thread_exit()
+        snapshotfile.save_snapshot = self.save_snapshot
+        rm(self.path, recursive=True)
+        rm(self.snapshot_dir, recursive=True)
+
+    def create_emitter(self, checkpoint_interval):
+        emitter = self.kqueue.KqueueEmitter(
+            queue.Queue(), ObservedWatch(self.path, True),
+            snapshot_file=os.path.join(self.snapshot_dir, 'snapshot'),
+            checkpoint_interval=checkpoint_interval)
+        self.emitters.append(emitter)
+        return emitter
+
+    def write(self, emitter, name):
+        descriptor = emitter._descriptors.get(os.path.join(self.path, name))
+        emitter._kq.events.append(
+            FakeKevent(descriptor.fd,
+                       fflags=self.kqueue.select.KQ_NOTE_WRITE))
+
+    def test_saves_only_changed_snapshot(self):
+        emitter = self.create_emitter(0)
+        emitter.queue_events(0)
+        self.assertEqual(1, self.saves)
+        for _ in range(3):
+            emitter.queue_events(0)
+        self.assertEqual(1, self.saves)
+        self.write(emitter, 'a')
+        emitter.queue_events(0)
+        self.assertEqual(2, self.saves)
+        emitter.checkpoint()
+        self.assertEqual(2, self.saves)
+
+    def test_waits_for_interval(self):
+        emitter = self.create_emitter(3600)
+        emitter.queue_events(0)
+        self.assertEqual(1, self.saves)
+        self.write(emitter, 'a')
+        emitter.queue_events(0)
+        self.assertEqual(1, self.saves)
+        emitter.on_thread_exit()
+        self.emitters.remove(emitter)
+        self.assertEqual(2, self.saves)
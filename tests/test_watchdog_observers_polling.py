@@ -18,6 +18,7 @@
 
 
 import os
+import threading
 import unittest2
 
 try:
@@ -40,6 +41,7 @@ from watchdog.events import DirModifiedEvent, DirCreatedEvent, \
 
 from watchdog.observers.api import ObservedWatch
 from watchdog.observers.polling import PollingEmitter as Emitter
+from watchdog.observers.polling import PollingSchedule, PollingEngine
 
 
 temp_dir = mkdtemp()
@@ -130,3 +132,222 @@ class TestPollingEmitter(unittest2.TestCase):
                 break
 
         self.assertEqual(expected, got)
+
+
+class TestPollingEmitterSnapshotFile(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.snapshot_dir = mkdtemp()
+        self.snapshot_file = os.path.join(self.snapshot_dir, 'snapshot')
+        self.watch = ObservedWatch(self.path, True)
+        mkdir(os.path.join(self.path, 'a'))
+        touch(os.path.join(self.path, 'a', 'b'))
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+        rm(self.snapshot_dir, recursive=True)
+
+    def create_emitter(self, event_queue):
+        return Emitter(event_queue, self.watch, timeout=0,
+                       snapshot_file=self.snapshot_file)
+
+    def test_reports_changes_made_while_stopped(self):
+        emitter = self.create_emitter(queue.Queue())
+        emitter.queue_events(0)
+        emitter.on_thread_exit()
+        self.assertTrue(os.path.exists(self.snapshot_file))
+
+        touch(os.path.join(self.path, 'c'))
+        mv(os.path.join(self.path, 'a', 'b'), os.path.join(self.path, 'd'))
+
+        event_queue = queue.Queue()
+        emitter = self.create_emitter(event_queue)
+        emitter.queue_events(0)
+        events = set()
+        while not event_queue.empty():
+            events.add(event_queue.get_nowait()[0])
+        self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'c'))
+                        in events)
+        self.assertTrue(FileMovedEvent(os.path.join(self.path, 'a', 'b'),
+                                       os.path.join(self.path, 'd'))
+                        in events)
+
+    def test_ignores_snapshot_of_another_watch(self):
+        emitter = Emitter(queue.Queue(), ObservedWatch(self.path, False),
+                          timeout=0, snapshot_file=self.snapshot_file)
+        emitter.on_thread_exit()
+        touch(os.path.join(self.path, 'c'))
+        event_queue = queue.Queue()
+        emitter = self.create_emitter(event_queue)
+        emitter.queue_events(0)
+        self.assertTrue(event_queue.empty())
+
+
+class TestPollingSchedule(unittest2.TestCase):
+    def setUp(self):
+        self.schedule = PollingSchedule(1, 8)
+        self.schedule.set_directories(['/a', '/b'], 0)
+
+    def test_backs_off_quiet_directories(self):
+        self.assertEqual(1, self.schedule.next_due())
+        self.assertEqual([], self.schedule.pop_due(0.5))
+        self.assertEqual(['/a', '/b'], sorted(self.schedule.pop_due(1)))
+        self.assertEqual(None, self.schedule.next_due())
+        for expected in (2, 4, 8, 8):
+            self.schedule.reschedule(['/b'], set(), 1)
+            self.assertEqual(expected, self.schedule.interval('/b'))
+        self.schedule.reschedule(['/a'], set(['/a']), 1)
+        self.assertEqual(['/a'], self.schedule.pop_due(2))
+        self.assertEqual(['/b'], self.schedule.pop_due(9))
+        self.schedule.reschedule(['/b'], set(['/b']), 9)
+        self.assertEqual(1, self.schedule.interval('/b'))
+
+    def test_set_directories(self):
+        self.schedule.set_directories(['/b', '/c'], 5)
+        self.assertEqual(2, len(self.schedule))
+        self.assertEqual(['/b'], self.schedule.pop_due(1))
+        self.assertEqual(['/c'], self.schedule.pop_due(6))
+        self.schedule.set_directories(['/c'], 6)
+        self.schedule.reschedule(['/b', '/c'], set(), 6)
+        self.assertEqual(8, self.schedule.next_due())
+
+
+class TestAdaptivePollingEmitter(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        mkdir(os.path.join(self.path, 'hot'))
+        mkdir(os.path.join(self.path, 'cold'))
+        self.event_queue = queue.Queue()
+        self.emitter = Emitter(self.event_queue, ObservedWatch(self.path, True),
+                               timeout=0.05, max_interval=60)
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+
+    def poll(self):
+        schedule = self.emitter._schedule
+        for path, due in schedule._due.items():
+            schedule._due[path] = 0
+            schedule._heap.append((0, path))
+        self.emitter.queue_events(0)
+        events = set()
+        while not self.event_queue.empty():
+            events.add(self.event_queue.get_nowait()[0])
+        return events
+
+    def test_polls_changing_directories_more_often(self):
+        self.poll()
+        for i in range(3):
+            touch(os.path.join(self.path, 'hot', str(i)))
+            self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'hot',
+                                                          str(i)))
+                            in self.poll())
+        schedule = self.emitter._schedule
+        self.assertEqual(0.05, schedule.interval(os.path.join(self.path,
+                                                              'hot')))
+        self.assertTrue(schedule.interval(os.path.join(self.path, 'cold'))
+                        >= 0.05 * 8)
+        mkdir(os.path.join(self.path, 'cold', 'new'))
+        self.assertTrue(DirCreatedEvent(os.path.join(self.path, 'cold', 'new'))
+                        in self.poll())
+        self.assertEqual(0.05, schedule.interval(os.path.join(self.path,
+                                                              'cold')))
+        self.assertEqual(0.05, schedule.interval(os.path.join(self.path,
+                                                              'cold', 'new')))
+
+
+class TestCompactPollingEmitter(TestAdaptivePollingEmitter):
+    def setUp(self):
+        TestAdaptivePollingEmitter.setUp(self)
+        self.emitter = Emitter(self.event_queue, ObservedWatch(self.path, True),
+                               timeout=0.05, max_interval=60, compact=True)
+
+    def test_reports_changes(self):
+        self.poll()
+        touch(os.path.join(self.path, 'hot', 'a'))
+        mv(os.path.join(self.path, 'cold'), os.path.join(self.path, 'warm'))
+        events = self.poll()
+        self.assertTrue(FileCreatedEvent(os.path.join(self.path, 'hot', 'a'))
+                        in events)
+        self.assertTrue(DirMovedEvent(os.path.join(self.path, 'cold'),
+                                      os.path.join(self.path, 'warm'))
+                        in events)
+        f = open(os.path.join(self.path, 'hot', 'a'), 'ab')
+        f.write('data')
+        f.close()
+        self.assertTrue(FileModifiedEvent(os.path.join(self.path, 'hot', 'a'))
+                        in self.poll())
+
+    def test_cannot_save_snapshot(self):
+        self.assertRaises(ValueError, Emitter, self.event_queue,
+                          ObservedWatch(self.path, True), compact=True,
+                          snapshot_file=os.path.join(self.path, 'snapshot'))
+
+
+class TestPollingEngine(unittest2.TestCase):
+    def setUp(self):
+        self.paths = [mkdtemp() for _ in range(3)]
+        self.event_queue = queue.Queue()
+        self.engine = PollingEngine(workers=1)
+        self.emitters = [Emitter(self.event_queue, ObservedWatch(path, True),
+                                 timeout=0.1, engine=self.engine)
+                         for path in self.paths]
+
+    def tearDown(self):
+        self.engine.stop()
+        self.engine.join()
+        for path in self.paths:
+            rm(path, recursive=True)
+
+    def collect_events(self, duration=0.5):
+        sleep(duration)
+        events = set()
+        while not self.event_queue.empty():
+            events.add(self.event_queue.get_nowait()[0])
+        return events
+
+    def test_polls_all_watches_from_one_thread(self):
+        for emitter in self.emitters:
+            self.engine.add(emitter)
+        for path in self.paths:
+            touch(os.path.join(path, 'a'))
+        events = self.collect_events()
+        for path in self.paths:
+            self.assertTrue(FileCreatedEvent(os.path.join(path, 'a'))
+                            in events)
+        self.assertEqual(1, len(self.engine.workers))
+        for emitter in self.emitters:
+            self.assertFalse(emitter.is_alive())
+
+    def test_stopped_emitter_is_not_polled(self):
+        for emitter in self.emitters:
+            self.engine.add(emitter)
+        self.emitters[0].stop()
+        for path in self.paths:
+            touch(os.path.join(path, 'a'))
+        events = self.collect_events()
+        self.assertFalse(FileCreatedEvent(os.path.join(self.paths[0], 'a'))
+                         in events)
+        self.assertTrue(FileCreatedEvent(os.path.join(self.paths[1], 'a'))
+                        in events)
+
+    def test_remove_does_not_wait_for_poll(self):
+        snapshot_dir = mkdtemp()
+        snapshot_file = os.path.join(snapshot_dir, 'snapshot')
+        emitter = Emitter(self.event_queue, ObservedWatch(self.paths[0], True),
+                          timeout=0.1, engine=self.engine,
+                          snapshot_file=snapshot_file)
+        self.engine.add(emitter)
+        try:
+            # Holding the emitter lock stands for a poll in progress.
+            with emitter._lock:
+                stopper = threading.Thread(target=emitter.stop)
+                stopper.start()
+                stopper.join(1)
+                self.assertFalse(stopper.is_alive())
+                self.assertFalse(os.path.exists(snapshot_file))
+            self.engine.stop()
+            self.engine.join()
+            self.assertTrue(os.path.exists(snapshot_file))
+        finally:
+            rm(snapshot_dir, recursive=True)
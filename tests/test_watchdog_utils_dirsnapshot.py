@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import stat
+import time
+import unittest2
+
+from tests.shell import \
+    mkdir, \
+    mkdtemp, \
+    touch, \
+    rm, \
+    mv
+
+from watchdog.utils import dirsnapshot
+from watchdog.utils.dirsnapshot import \
+    CompactDirectorySnapshot, \
+    DirectorySnapshot, \
+    DirectorySnapshotDiff, \
+    DEFAULT_CHANGE_FIELDS
+
+
+def diff_summary(diff):
+    return dict(files_created=sorted(diff.files_created),
+                files_deleted=sorted(diff.files_deleted),
+                files_modified=sorted(diff.files_modified),
+                files_moved=sorted(diff.files_moved),
+                dirs_created=sorted(diff.dirs_created),
+                dirs_deleted=sorted(diff.dirs_deleted),
+                dirs_modified=sorted(diff.dirs_modified),
+                dirs_moved=sorted(diff.dirs_moved))
+
+
+class TestDirectorySnapshotRefresh(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        mkdir(self.p('a', 'b', 'c'), parents=True)
+        mkdir(self.p('d'))
+        for name in ('a/1', 'a/b/2', 'a/b/c/3', 'd/4', '5'):
+            touch(self.p(name))
+        self.snapshot = DirectorySnapshot(self.path)
+        self.reference = DirectorySnapshot(self.path)
+        # Timestamps of the setup would otherwise be too recent to trust.
+        self.snapshot._racy_directories.clear()
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+
+    def p(self, *args):
+        return os.path.join(self.path, *args)
+
+    def assertRefreshMatchesNewSnapshot(self, **kwargs):
+        diff = self.snapshot.refresh(**kwargs)
+        expected = DirectorySnapshotDiff(self.reference,
+                                         DirectorySnapshot(self.path))
+        self.assertEqual(diff_summary(expected), diff_summary(diff))
+        self.assertEqual(set(DirectorySnapshot(self.path).paths),
+                         set(self.snapshot.paths))
+        return diff
+
+    def test_quiet_tree_lists_nothing(self):
+        stat_paths = []
+        diff = self.snapshot.refresh(
+            stat_files=False,
+            walker_callback=lambda path, stat_info: stat_paths.append(path))
+        self.assertEqual(sorted([self.path, self.p('a'), self.p('a', 'b'),
+                                 self.p('a', 'b', 'c'), self.p('d')]),
+                         sorted(stat_paths))
+        self.assertEqual(diff_summary(DirectorySnapshotDiff(self.snapshot,
+                                                            self.snapshot)),
+                         diff_summary(diff))
+
+    def test_creations_and_deletions(self):
+        touch(self.p('a', 'b', 'new'))
+        mkdir(self.p('d', 'e', 'f'), parents=True)
+        touch(self.p('d', 'e', 'f', 'g'))
+        rm(self.p('a', 'b', 'c'), recursive=True)
+        rm(self.p('5'))
+        diff = self.assertRefreshMatchesNewSnapshot()
+        self.assertEqual([self.p('a', 'b', 'new'), self.p('d', 'e', 'f', 'g')],
+                         sorted(diff.files_created))
+
+    def test_moves(self):
+        mv(self.p('a', 'b'), self.p('d', 'b'))
+        mv(self.p('5'), self.p('a', '6'))
+        diff = self.assertRefreshMatchesNewSnapshot(stat_files=False)
+        self.assertTrue((self.p('a', 'b'), self.p('d', 'b')) in diff.dirs_moved)
+        self.assertTrue((self.p('5'), self.p('a', '6')) in diff.files_moved)
+
+    def test_modifications(self):
+        f = open(self.p('a', 'b', '2'), 'ab')
+        f.write('data')
+        f.close()
+        diff = self.snapshot.refresh(stat_files=False)
+        self.assertEqual([], diff.files_modified)
+        diff = self.snapshot.refresh()
+        self.assertEqual([self.p('a', 'b', '2')], diff.files_modified)
+        self.assertEqual([], self.snapshot.refresh().files_modified)
+
+    def test_refresh_some_directories(self):
+        touch(self.p('a', 'b', 'new'))
+        touch(self.p('d', 'new'))
+        diff = self.snapshot.refresh(directories=[self.p('a', 'b'),
+                                                  self.p('gone')])
+        self.assertEqual([self.p('a', 'b', 'new')], diff.files_created)
+        self.assertFalse(self.p('d', 'new') in self.snapshot.paths)
+        diff = self.snapshot.refresh(directories=[self.p('d')])
+        self.assertEqual([self.p('d', 'new')], diff.files_created)
+
+    def test_file_replaced_by_directory(self):
+        rm(self.p('d', '4'))
+        mkdir(self.p('d', '4'))
+        touch(self.p('d', '4', '7'))
+        self.snapshot.refresh()
+        self.assertTrue(self.p('d', '4', '7') in self.snapshot.paths)
+        rm(self.p('a', 'b'), recursive=True)
+        touch(self.p('a', 'b'))
+        self.snapshot.refresh()
+        self.assertFalse(self.p('a', 'b', '2') in self.snapshot.paths)
+        self.assertEqual(set(DirectorySnapshot(self.path).paths),
+                         set(self.snapshot.paths))
+
+
+class TestCompactDirectorySnapshotRefresh(TestDirectorySnapshotRefresh):
+    def setUp(self):
+        TestDirectorySnapshotRefresh.setUp(self)
+        self.snapshot = CompactDirectorySnapshot(self.path)
+        self.snapshot._racy_directories.clear()
+
+    def test_same_contents_as_new_snapshot(self):
+        mv(self.p('a', 'b'), self.p('d', 'b'))
+        touch(self.p('a', '0'))
+        f = open(self.p('d', '4'), 'ab')
+        f.write('data')
+        f.close()
+        self.snapshot.refresh()
+        compact = CompactDirectorySnapshot(self.path)
+        self.assertEqual(set(compact.paths), set(self.snapshot.paths))
+        for path in compact.paths:
+            self.assertEqual(compact.stat_info(path),
+                             self.snapshot.stat_info(path))
+        self.assertEqual(sorted(DirectorySnapshot(self.path).directories),
+                         sorted(self.snapshot.directories))
+
+
+def fake_snapshot(stat_info_for_path):
+    snapshot = DirectorySnapshot('/', _copying=True)
+    for path, (dev, ino) in stat_info_for_path.items():
+        snapshot._stat_snapshot[path] = os.stat_result(
+            (stat.S_IFREG, ino, dev, 1, 0, 0, 0, 0, 0, 0))
+    return snapshot
+
+
+class TestDirectorySnapshotDiffMoves(unittest2.TestCase):
+    def test_moves_match_device_and_inode(self):
+        diff = DirectorySnapshotDiff(
+            fake_snapshot({'/a': (1, 10), '/b': (2, 10)}),
+            fake_snapshot({'/c': (2, 10), '/d': (3, 10)}))
+        self.assertEqual([('/b', '/c')], diff.files_moved)
+        self.assertEqual(['/a'], diff.files_deleted)
+        self.assertEqual(['/d'], diff.files_created)
+
+    def test_bulk_rename_is_linear(self):
+        count = 50000
+        ref = fake_snapshot(dict([('/old/%d' % i, (1, i))
+                                  for i in range(count)]))
+        new = fake_snapshot(dict([('/new/%d' % i, (1, i))
+                                  for i in range(count)]))
+        started = time.time()
+        diff = DirectorySnapshotDiff(ref, new)
+        self.assertTrue(time.time() - started < 10)
+        self.assertEqual(count, len(diff.files_moved))
+        self.assertEqual([], diff.files_created)
+        self.assertEqual([], diff.files_deleted)
+
+
+def fake_stat_info(ino, size=0, mtime=0, ctime=0, mode=stat.S_IFREG):
+    return os.stat_result((mode, ino, 1, 1, 0, 0, size, 0, mtime, ctime))
+
+
+def snapshot_of(stat_info_for_path):
+    snapshot = DirectorySnapshot('/', _copying=True)
+    for path, stat_info in stat_info_for_path.items():
+        snapshot._set_stat_info(path, stat_info)
+    return snapshot
+
+
+class TestDirectorySnapshotDiffChanges(unittest2.TestCase):
+    def test_compares_size_and_ctime(self):
+        ref = snapshot_of({'/a': fake_stat_info(1, size=1, mtime=5),
+                           '/b': fake_stat_info(2, mtime=5, ctime=5)})
+        new = snapshot_of({'/a': fake_stat_info(1, size=2, mtime=5),
+                           '/b': fake_stat_info(2, mtime=5, ctime=6)})
+        diff = DirectorySnapshotDiff(
+            ref, new, change_fields=('st_mtime_ns', 'st_ctime_ns', 'st_size'))
+        self.assertEqual(['/a', '/b'], sorted(diff.files_modified))
+        self.assertEqual([], DirectorySnapshotDiff(ref, new).files_modified)
+        self.assertRaises(ValueError, DirectorySnapshotDiff, ref, new,
+                          ('st_atime',))
+
+    def test_replaced_file(self):
+        ref = snapshot_of({'/a': fake_stat_info(1),
+                           '/d': fake_stat_info(4, mode=stat.S_IFREG)})
+        new = snapshot_of({'/a': fake_stat_info(2),
+                           '/d': fake_stat_info(5, mode=stat.S_IFDIR)})
+        diff = DirectorySnapshotDiff(ref, new)
+        self.assertEqual([], diff.files_modified + diff.files_deleted +
+                         diff.files_created + diff.dirs_created)
+        diff = DirectorySnapshotDiff(ref, new, report_replaced=True)
+        self.assertEqual([], diff.files_modified)
+        self.assertEqual(['/a', '/d'], sorted(diff.files_deleted))
+        self.assertEqual(['/a'], diff.files_created)
+        self.assertEqual(['/d'], diff.dirs_created)
+        diff = DirectorySnapshotDiff(
+            ref, new, change_fields=DEFAULT_CHANGE_FIELDS + ('st_ino',))
+        self.assertEqual(['/a'], diff.files_modified)
+        self.assertEqual(['/d'], diff.files_deleted)
+        self.assertEqual([], diff.files_created)
+        self.assertEqual(['/d'], diff.dirs_created)
+
+    def test_file_moved_over_another(self):
+        ref = snapshot_of({'/a': fake_stat_info(1), '/b': fake_stat_info(2)})
+        new = snapshot_of({'/b': fake_stat_info(1)})
+        diff = DirectorySnapshotDiff(ref, new)
+        self.assertEqual([], diff.files_moved)
+        self.assertEqual(['/a'], diff.files_deleted)
+        for change_fields, report_replaced in (
+                (DEFAULT_CHANGE_FIELDS, True),
+                (DEFAULT_CHANGE_FIELDS + ('st_ino',), False)):
+            diff = DirectorySnapshotDiff(ref, new, change_fields,
+                                         report_replaced)
+            self.assertEqual([('/a', '/b')], diff.files_moved)
+            self.assertEqual(['/b'], diff.files_deleted)
+            self.assertEqual([], diff.files_modified)
+            self.assertEqual([], diff.files_created)
+
+
+class TestCompactDirectorySnapshot(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        mkdir(self.p('a', 'b'), parents=True)
+        mkdir(self.p('c'))
+        for name in ('a/1', 'a/b/1', 'a/b/2', 'c/1', '2'):
+            touch(self.p(name))
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+
+    def p(self, *args):
+        return os.path.join(self.path, *args)
+
+    def test_same_contents_as_directory_snapshot(self):
+        snapshot = DirectorySnapshot(self.path)
+        compact = CompactDirectorySnapshot(self.path)
+        self.assertEqual(set(snapshot.paths), set(compact.paths))
+        self.assertEqual(len(snapshot.stat_snapshot), len(compact))
+        for path in snapshot.paths:
+            stat_info = snapshot.stat_info(path)
+            compact_stat_info = compact.stat_info(path)
+            self.assertTrue(path in compact.stat_snapshot)
+            self.assertEqual((stat_info.st_ino, stat_info.st_dev,
+                              stat_info.st_mode, stat_info.st_size),
+                             (compact_stat_info.st_ino,
+                              compact_stat_info.st_dev,
+                              compact_stat_info.st_mode,
+                              compact_stat_info.st_size))
+            self.assertEqual(path, compact.path_for_inode(stat_info.st_ino))
+        self.assertFalse(self.p('a', 'b', '3') in compact.stat_snapshot)
+        self.assertRaises(KeyError, compact.stat_info, self.p('d'))
+
+    def test_non_recursive(self):
+        compact = CompactDirectorySnapshot(self.path, recursive=False)
+        self.assertEqual(set([self.path, self.p('a'), self.p('c'),
+                              self.p('2')]),
+                         set(compact.paths))
+
+    def test_diff(self):
+        ref = CompactDirectorySnapshot(self.path)
+        mv(self.p('a', 'b'), self.p('c', 'b'))
+        touch(self.p('3'))
+        rm(self.p('2'))
+        diff = CompactDirectorySnapshot(self.path) - ref
+        self.assertTrue((self.p('a', 'b'), self.p('c', 'b')) in diff.dirs_moved)
+        self.assertEqual([self.p('2')], diff.files_deleted)
+        self.assertEqual([self.p('3')], diff.files_created)
+
+
+@unittest2.skipUnless(dirsnapshot.numpy is not None, "NumPy is not installed")
+class TestVectorisedDiff(unittest2.TestCase):
+    def setUp(self):
+        self.numpy = dirsnapshot.numpy
+        self.path = mkdtemp()
+        mkdir(os.path.join(self.path, 'a', 'b'), parents=True)
+        for name in ('1', '2', '3'):
+            touch(os.path.join(self.path, 'a', name))
+            touch(os.path.join(self.path, 'a', 'b', name))
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+        dirsnapshot.numpy = self.numpy
+
+    def test_same_as_pure_python_diff(self):
+        ref = CompactDirectorySnapshot(self.path)
+        mkdir(os.path.join(self.path, 'c'))
+        mv(os.path.join(self.path, 'a', 'b'), os.path.join(self.path, 'c', 'b'))
+        touch(os.path.join(self.path, 'a', '4'))
+        rm(os.path.join(self.path, 'a', '1'))
+        mv(os.path.join(self.path, 'a', '2'), os.path.join(self.path, '2'))
+        f = open(os.path.join(self.path, 'a', '3'), 'ab')
+        f.write('data')
+        f.close()
+        snapshot = CompactDirectorySnapshot(self.path)
+        vectorised = diff_summary(DirectorySnapshotDiff(ref, snapshot))
+        dirsnapshot.numpy = None
+        self.assertEqual(diff_summary(DirectorySnapshotDiff(ref, snapshot)),
+                         vectorised)
+        self.assertTrue((os.path.join(self.path, 'a', '2'),
+                         os.path.join(self.path, '2'))
+                        in vectorised['files_moved'])
+
+    def test_same_changes_as_pure_python_diff(self):
+        ref = CompactDirectorySnapshot(self.path)
+        touch(os.path.join(self.path, 'a', 'new'))
+        os.rename(os.path.join(self.path, 'a', 'new'),
+                  os.path.join(self.path, 'a', '1'))
+        os.chmod(os.path.join(self.path, 'a', '2'), 0600)
+        snapshot = CompactDirectorySnapshot(self.path)
+        for change_fields, report_replaced in (
+                (DEFAULT_CHANGE_FIELDS, False),
+                (DEFAULT_CHANGE_FIELDS, True),
+                (DEFAULT_CHANGE_FIELDS + ('st_ino', 'st_mode'), False)):
+            dirsnapshot.numpy = self.numpy
+            vectorised = diff_summary(DirectorySnapshotDiff(
+                    ref, snapshot, change_fields, report_replaced))
+            dirsnapshot.numpy = None
+            self.assertEqual(diff_summary(DirectorySnapshotDiff(
+                        ref, snapshot, change_fields, report_replaced)),
+                             vectorised)
+        self.assertTrue(os.path.join(self.path, 'a', '1')
+                        in vectorised['files_modified'])
+        self.assertTrue(os.path.join(self.path, 'a', '2')
+                        in vectorised['files_modified'])
+
+    def test_colliding_path_hashes(self):
+        ref = CompactDirectorySnapshot(self.path)
+        rm(os.path.join(self.path, 'a', '1'))
+        touch(os.path.join(self.path, 'a', 'new'))
+        f = open(os.path.join(self.path, 'a', '2'), 'ab')
+        f.write('data')
+        f.close()
+        snapshot = CompactDirectorySnapshot(self.path)
+        # As if a/1, a/2 and a/new had the same hash.
+        path_hash = ref._path_hash[ref._index_for_path(
+                os.path.join(self.path, 'a', '1'))]
+        for dirsnap, name in ((ref, '2'), (snapshot, '2'), (snapshot, 'new')):
+            dirsnap._path_hash[dirsnap._index_for_path(
+                    os.path.join(self.path, 'a', name))] = path_hash
+        vectorised = diff_summary(DirectorySnapshotDiff(ref, snapshot))
+        dirsnapshot.numpy = None
+        self.assertEqual(diff_summary(DirectorySnapshotDiff(ref, snapshot)),
+                         vectorised)
+        self.assertTrue(os.path.join(self.path, 'a', '2')
+                        in vectorised['files_modified'])
+
+
+class TestStructureOnlySnapshot(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        mkdir(os.path.join(self.path, 'a', 'b'), parents=True)
+        for name in ('1', 'a/2', 'a/b/3'):
+            touch(os.path.join(self.path, name))
+        self.stat = os.stat
+        self.stat_paths = []
+
+    def tearDown(self):
+        os.stat = self.stat
+        rm(self.path, recursive=True)
+
+    def p(self, *args):
+        return os.path.join(self.path, *args)
+
+    def count_stat_calls(self):
+        def counting_stat(path):
+            self.stat_paths.append(path)
+            return self.stat(path)
+        os.stat = counting_stat
+
+    def test_stats_only_directories(self):
+        reference = DirectorySnapshot(self.path)
+        self.count_stat_calls()
+        snapshot = DirectorySnapshot(self.path, structure_only=True)
+        self.assertEqual(set(reference.paths), set(snapshot.paths))
+        self.assertEqual(set([self.path, self.p('a'), self.p('a', 'b')]),
+                         set(self.stat_paths))
+        snapshot._racy_directories.clear()
+        touch(self.p('a', 'b', '4'))
+        mv(self.p('1'), self.p('a', '1'))
+        mv(self.p('a', 'b', '3'), self.p('a', 'b', '5'))
+        f = open(self.p('a', '2'), 'ab')
+        f.write('data')
+        f.close()
+        del self.stat_paths[:]
+        diff = snapshot.refresh()
+        directories = set([self.path, self.p('a'), self.p('a', 'b')])
+        self.assertEqual(directories, set(self.stat_paths))
+        self.assertEqual([self.p('a', 'b', '4')], diff.files_created)
+        self.assertEqual(sorted([(self.p('1'), self.p('a', '1')),
+                                 (self.p('a', 'b', '3'),
+                                  self.p('a', 'b', '5'))]),
+                         sorted(diff.files_moved))
+        self.assertEqual([], diff.files_modified)
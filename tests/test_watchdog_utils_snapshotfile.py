@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# Copyright (C) 2011 Yesudeep Mangalapilly <yesudeep@gmail.com>
+# Copyright (C) 2012 Google, Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import unittest2
+
+from tests.shell import \
+    mkdir, \
+    mkdtemp, \
+    touch, \
+    rm
+
+from watchdog.utils.dirsnapshot import \
+    DirectorySnapshot, \
+    _mtime_ns, \
+    _ctime_ns
+from watchdog.utils.snapshotfile import \
+    load_snapshot, \
+    save_snapshot, \
+    snapshot_file_name
+
+
+class TestSnapshotFile(unittest2.TestCase):
+    def setUp(self):
+        self.path = mkdtemp()
+        self.snapshot_dir = mkdtemp()
+        self.filename = os.path.join(self.snapshot_dir, 'snapshot')
+        mkdir(os.path.join(self.path, 'a', 'b'), parents=True)
+        for name in ('1', 'a/1', 'a/b/1', 'a/b/2'):
+            touch(os.path.join(self.path, name))
+
+    def tearDown(self):
+        rm(self.path, recursive=True)
+        rm(self.snapshot_dir, recursive=True)
+
+    def test_round_trip(self):
+        snapshot = DirectorySnapshot(self.path)
+        save_snapshot(snapshot, self.filename)
+        loaded = load_snapshot(self.filename, self.path, True)
+        self.assertEqual(set(snapshot.paths), set(loaded.paths))
+        self.assertEqual(snapshot._entries, loaded._entries)
+        self.assertEqual(snapshot._racy_directories,
+                         loaded._racy_directories)
+        for path in snapshot.paths:
+            stat_info = snapshot.stat_info(path)
+            loaded_stat_info = loaded.stat_info(path)
+            for name in ('st_mode', 'st_ino', 'st_dev', 'st_size',
+                         'st_mtime', 'st_ctime'):
+                self.assertEqual(getattr(stat_info, name),
+                                 getattr(loaded_stat_info, name))
+            self.assertEqual(_mtime_ns(stat_info), _mtime_ns(loaded_stat_info))
+            self.assertEqual(_ctime_ns(stat_info), _ctime_ns(loaded_stat_info))
+            self.assertEqual(path, loaded.path_for_inode(stat_info.st_ino))
+        self.assertEqual(['snapshot'], os.listdir(self.snapshot_dir))
+
+    def test_refresh_loaded_snapshot(self):
+        save_snapshot(DirectorySnapshot(self.path), self.filename)
+        touch(os.path.join(self.path, 'a', 'b', '3'))
+        diff = load_snapshot(self.filename).refresh()
+        self.assertEqual([os.path.join(self.path, 'a', 'b', '3')],
+                         diff.files_created)
+
+    def test_unchanged_tree_after_load(self):
+        save_snapshot(DirectorySnapshot(self.path), self.filename)
+        diff = load_snapshot(self.filename).refresh()
+        self.assertEqual([], diff.files_modified)
+        self.assertEqual([], diff.dirs_modified)
+
+    def test_rejects_other_files(self):
+        save_snapshot(DirectorySnapshot(self.path, False), self.filename)
+        self.assertRaises(ValueError, load_snapshot, self.filename,
+                          self.path, True)
+        self.assertRaises(ValueError, load_snapshot, self.filename,
+                          os.path.join(self.path, 'a'))
+        f = open(self.filename, 'r+b')
+        f.seek(-1, os.SEEK_END)
+        f.write('\xff')
+        f.close()
+        self.assertRaises(ValueError, load_snapshot, self.filename)
+        f = open(self.filename, 'wb')
+        f.write('not a snapshot')
+        f.close()
+        self.assertRaises(ValueError, load_snapshot, self.filename)
+
+    def test_file_name_depends_on_watch(self):
+        self.assertNotEqual(snapshot_file_name(self.path, True),
+                            snapshot_file_name(self.path, False))
+        self.assertEqual(snapshot_file_name(self.path, True),
+                         snapshot_file_name(self.path + '/a/..', True))
+
+    def test_structure_only(self):
+        save_snapshot(DirectorySnapshot(self.path, structure_only=True),
+                      self.filename)
+        self.assertTrue(load_snapshot(self.filename).is_structure_only)
+        self.assertRaises(ValueError, load_snapshot, self.filename,
+                          structure_only=False)